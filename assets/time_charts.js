@@ -0,0 +1,285 @@
+// Time page charts redrawn in the browser (pages/ridership_time.py).
+//
+// The server sends sums and counts once per route/date range (and per stop for
+// the stop chart). Switching the calculation method, day of week or time
+// interval only re-aggregates those here, so it costs no server round trip.
+// The figures are built like utils/figures.py builds them.
+
+(function () {
+    var COLOR = '#636EFA';  // first colour of the Plotly palette, as px uses for one trace
+    var SECONDS_PER_DAY = 24 * 60 * 60;
+
+    function isAverage(calcMethod) {
+        return calcMethod === 'Average' || calcMethod === 'avg';
+    }
+
+    // Day-of-week codes kept by the selector ('Everyday', a day, or a list of days), as utils/index.py day_mask
+    function selectedDays(days, selectedDay) {
+        return days.map(function (day) {
+            if (Array.isArray(selectedDay)) {
+                return selectedDay.indexOf(day) >= 0;
+            }
+            return selectedDay === null || selectedDay === undefined || selectedDay === 'Everyday' ||
+                day === selectedDay;
+        });
+    }
+
+    // Round half to even at 2 decimals, like pandas' round(2)
+    function round2(value) {
+        var scaled = value * 100;
+        var rounded = Math.round(scaled);
+        if (rounded - scaled === 0.5 && rounded % 2 !== 0) {
+            rounded -= 1;
+        }
+        return rounded / 100;
+    }
+
+    function pad(n) {
+        return (n < 10 ? '0' : '') + n;
+    }
+
+    function timeLabel(seconds) {
+        return pad(Math.floor(seconds / 3600)) + ':' + pad(Math.floor(seconds % 3600 / 60)) + ':' + pad(seconds % 60);
+    }
+
+    // Sum the measures of ``table`` per label (labels keep their first-seen order, i.e. the server's sort order)
+    function sumBy(table, keys, measures, keep) {
+        var index = {}, labels = [], totals = {};
+        measures.forEach(function (m) { totals[m] = []; });
+        for (var i = 0; i < keys.length; i++) {
+            if (keep && !keep(i)) {
+                continue;
+            }
+            var key = keys[i];
+            if (!(key in index)) {
+                index[key] = labels.length;
+                labels.push(key);
+                measures.forEach(function (m) { totals[m].push(0); });
+            }
+            measures.forEach(function (m) { totals[m][index[key]] += table[m][i]; });
+        }
+        return {labels: labels, totals: totals};
+    }
+
+    // Sum, or riders per stop event (sum / count) for Average
+    function finish(totals, measure, calcMethod) {
+        if (!isAverage(calcMethod)) {
+            return totals[measure];
+        }
+        return totals[measure].map(function (sum, i) { return sum / totals[measure + '_count'][i]; });
+    }
+
+    ////////// FIGURES //////////
+    function axis(title, props) {
+        return Object.assign({}, props, {title: {text: title}});
+    }
+
+    function figure(traces, title, template, font, layout) {
+        layout = Object.assign({}, layout, {template: template, title: {text: title}});
+        if (font) {
+            layout.font = {family: 'Segoe UI', size: 12, color: 'black'};
+        }
+        return {data: traces, layout: layout};
+    }
+
+    function bar(x, y, name, text) {
+        var trace = {type: 'bar', name: name, x: x, y: y};
+        if (text) {
+            trace.text = text;
+            trace.textposition = 'auto';
+        }
+        return trace;
+    }
+
+    function labeledBar(x, y, xLabel, yLabel, text) {
+        return Object.assign(bar(x, y, '', text), {
+            orientation: 'v',
+            marker: {color: COLOR},
+            hovertemplate: xLabel + '=%{x}<br>' + yLabel + '=%{y}<extra></extra>',
+            legendgroup: '',
+            showlegend: false
+        });
+    }
+
+    function lineGl(x, y, xLabel, yLabel) {
+        return {
+            type: 'scattergl', mode: 'lines', name: '', x: x, y: y, line: {color: COLOR},
+            hovertemplate: xLabel + '=%{x}<br>' + yLabel + '=%{y}<extra></extra>',
+            legendgroup: '', showlegend: false
+        };
+    }
+
+    function pie(labels, values, labelName, valueName) {
+        return {
+            type: 'pie', labels: labels, values: values, name: '', showlegend: true,
+            textinfo: 'value', textposition: 'auto',
+            hovertemplate: labelName + '=%{label}<br>' + valueName + '=%{value}<extra></extra>'
+        };
+    }
+
+    ////////// LEVEL OF DETAIL (as utils/detail.py) //////////
+    // Lowest and highest point of each of maxPoints / 2 buckets, in order
+    function peakIndices(values, maxPoints) {
+        var n = values.length, keep = [];
+        if (n <= maxPoints) {
+            return values.map(function (_, i) { return i; });
+        }
+        var buckets = Math.floor(maxPoints / 2);
+        for (var b = 0; b < buckets; b++) {
+            var start = Math.floor(b * n / buckets), end = Math.floor((b + 1) * n / buckets);
+            var low = start, high = start;
+            for (var i = start + 1; i < end; i++) {
+                if (values[i] < values[low]) { low = i; }
+                if (values[i] > values[high]) { high = i; }
+            }
+            keep.push(low);
+            if (high !== low) { keep.push(high); }
+        }
+        return keep.sort(function (a, b) { return a - b; });
+    }
+
+    function pick(values, indices) {
+        return indices.map(function (i) { return values[i]; });
+    }
+
+    function dateAxis(title, zoomWindow) {
+        return axis(title, zoomWindow ? {type: 'date', range: zoomWindow.slice().sort()} : {type: 'date'});
+    }
+
+    function noUpdate() {
+        return window.dash_clientside.no_update;
+    }
+
+    ////////// CHARTS //////////
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        time_charts: {
+            semester: function (aggregate, calcMethod, selectedDay, template) {
+                if (!aggregate) {
+                    return noUpdate();
+                }
+                var table = aggregate.semester;
+                var keep = selectedDays(aggregate.days, selectedDay);
+                var grouped = sumBy(table, table.label, ['on', 'on_count'], function (i) { return keep[table.day[i]]; });
+                // Labels come sorted from the server; the per-day rows of a label are adjacent
+                return figure([pie(grouped.labels, finish(grouped.totals, 'on', calcMethod), 'Semester', 'Riders On')],
+                              'Ridership by Semester', template, false, {legend: {tracegroupgap: 0}});
+            },
+
+            monthly: function (aggregate, calcMethod, template) {
+                if (!aggregate) {
+                    return noUpdate();
+                }
+                var table = aggregate.month;
+                var values = finish(table, 'on', calcMethod);
+                return figure([labeledBar(table.label, values, 'Month', 'Riders On', values)], 'Ridership by Month',
+                              template, false, {xaxis: axis('Month', {tickangle: -45}), yaxis: axis('Riders On')});
+            },
+
+            weekly: function (aggregate, calcMethod, zoomWindow, template) {
+                if (!aggregate) {
+                    return noUpdate();
+                }
+                var table = aggregate.week;
+                if (!table.label.length) {
+                    return figure([labeledBar([], [], 'Week Starting', 'Riders On')], 'No Data Available', template);
+                }
+                var labels = table.label, values = finish(table, 'on', calcMethod);
+                if (zoomWindow) {
+                    // Weeks starting in the zoomed-in range (labels are YYYY-MM-DD)
+                    var first = zoomWindow.slice().sort()[0], last = zoomWindow.slice().sort()[1];
+                    var shown = labels.map(function (_, i) { return i; })
+                        .filter(function (i) { return labels[i] >= first && labels[i] <= last; });
+                    labels = pick(labels, shown);
+                    values = pick(values, shown);
+                }
+                var detail = aggregate.detail, layout = {yaxis: axis('Riders On')};
+                if (labels.length > detail.max_bars) {
+                    var keep = peakIndices(values, detail.max_points);
+                    layout.xaxis = dateAxis('Week Starting', zoomWindow);
+                    return figure([lineGl(pick(labels, keep), pick(values, keep), 'Week Starting', 'Riders On')],
+                                  'Ridership by Week', template, false, layout);
+                }
+                layout.xaxis = zoomWindow ? dateAxis('Week Starting', zoomWindow) : axis('Week Starting');
+                return figure([labeledBar(labels, values, 'Week Starting', 'Riders On', values)], 'Ridership by Week',
+                              template, false, layout);
+            },
+
+            // [start, end] dates of a zoom on a date axis, null to show everything again
+            zoomWindow: function (relayoutData) {
+                var triggered = window.dash_clientside.callback_context.triggered || [];
+                var zoomed = triggered.some(function (t) { return /\.relayoutData$/.test(t.prop_id); });
+                if (!zoomed) {
+                    return null;  // new data or grouping: back to the full range
+                }
+                if (!relayoutData) {
+                    return noUpdate();
+                }
+                if (relayoutData['xaxis.autorange']) {
+                    return null;
+                }
+                var range = relayoutData['xaxis.range'] ||
+                    [relayoutData['xaxis.range[0]'], relayoutData['xaxis.range[1]']];
+                // Other events, and zooms on a category axis (few enough bars already)
+                if (typeof range[0] !== 'string' || typeof range[1] !== 'string') {
+                    return noUpdate();
+                }
+                return [range[0].slice(0, 10), range[1].slice(0, 10)];
+            },
+
+            timeOfDay: function (aggregate, selectedDay, binWidth, template) {
+                if (!aggregate) {
+                    return noUpdate();
+                }
+                var table = aggregate.time;
+                var keep = selectedDays(aggregate.days, selectedDay);
+                // Nearest block start, ties to the earlier block, past the last block stays in it
+                var step = binWidth * 60, nBins = SECONDS_PER_DAY / step;
+                var on = new Array(nBins).fill(0), off = new Array(nBins).fill(0);
+                for (var i = 0; i < table.seconds.length; i++) {
+                    if (!keep[table.day[i]]) {
+                        continue;
+                    }
+                    var bin = Math.min(Math.max(Math.floor((table.seconds[i] + step / 2 - 1) / step), 0), nBins - 1);
+                    on[bin] += table.on[i];
+                    off[bin] += table.off[i];
+                }
+                // Only blocks with riders getting on or off
+                var x = [], ridersOn = [], ridersOff = [];
+                for (var b = 0; b < nBins; b++) {
+                    if (on[b] > 0 || off[b] > 0) {
+                        x.push(timeLabel(b * step));
+                        ridersOn.push(on[b]);
+                        ridersOff.push(off[b]);
+                    }
+                }
+                return figure([bar(x, ridersOn, 'Riders On', ridersOn), bar(x, ridersOff, 'Riders Off', ridersOff)],
+                              'Overall Ridership for all Stops by Time (' + binWidth + '-Minute Intervals)', template, true,
+                              {barmode: 'stack', xaxis: axis('Time of Day'), yaxis: axis('Total Riders On/Off')});
+            },
+
+            stopTime: function (aggregate, selectedDay, calcMethod, template) {
+                if (!aggregate) {
+                    return noUpdate();
+                }
+                var table = aggregate.time;
+                var keep = selectedDays(aggregate.days, selectedDay);
+                // Group by scheduled time, in time order
+                var order = table.seconds.map(function (_, i) { return i; })
+                    .filter(function (i) { return keep[table.day[i]]; })
+                    .sort(function (a, b) { return table.seconds[a] - table.seconds[b]; });
+                var sorted = {};
+                Object.keys(table).forEach(function (m) {
+                    sorted[m] = order.map(function (i) { return table[m][i]; });
+                });
+                var grouped = sumBy(sorted, sorted.seconds, ['on', 'on_count', 'off', 'off_count']);
+                var ridersOn = finish(grouped.totals, 'on', calcMethod).map(round2);
+                var ridersOff = finish(grouped.totals, 'off', calcMethod).map(round2);
+                var times = grouped.labels.map(timeLabel);
+                return figure([bar(times, ridersOn, 'Riders On', ridersOn), bar(times, ridersOff, 'Riders Off', ridersOff)],
+                              calcMethod + ' Riders On/Off for Stop: ' + aggregate.stop + ', Route: ' + aggregate.route,
+                              template, true,
+                              {barmode: 'stack', xaxis: axis('Scheduled Time'), yaxis: axis(calcMethod + ' Riders On/Off')});
+            }
+        }
+    });
+})();
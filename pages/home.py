@@ -22,6 +22,13 @@ layout = html.Div([
         html.P('This dashboard includes two bar charts, one displaying the frequency of a particular capacity being met by day of week and one by scheduled hour. The calculation of the capacity reached is determined by dividing Riders Cumulative (the amount of riders on the bus) by the vehicle capacity.'),
         html.P('The user is able to narrow down what data is included by selecting the route, date range to include, and the capacity percentage range we want to check is being met.'),
         html.P('For analyzing the frequency of capacity reached by scheduled time, the user is also able to select a particular day of the week to see if there are trends for those particular days.'),
+        html.P('A third chart ranks the stops and hours where the most riders were left behind (Riders Left) because the vehicle was full.'),
+    ]),
+
+    html.Section([
+        html.H2('On-Time Performance'),
+        html.P('This dashboard compares each stop’s actual arrival and departure with its scheduled time. The first chart shows the share of stops served early, on time (from 1 minute early to 5 minutes late) or late by scheduled hour.'),
+        html.P('The next charts show the median and 90th percentile lateness and dwell time (how long the vehicle stayed at the stop) of each stop, and a heatmap of lateness by stop and hour.'),
     ]),
 
     html.Section([
@@ -0,0 +1,194 @@
+import dash
+from dash import dcc, html, callback
+from dash.dependencies import Input, Output
+
+from utils import backend, cache, capacity, encoding, figures, metrics, slices
+from utils.index import day_mask
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+################### READING DATA ###################
+# Stop events binned by load factor (Riders Cumulative / Vehicle Capacity) and
+# Riders Left per stop and hour (utils/capacity.py), queried per call through
+# the backend (utils/backend.py) so new data (utils/refresh.py) shows up
+# without a restart.
+
+HOTSPOTS = 10
+
+################### DASH APP ###################
+dash.register_page(__name__, title="Ridership Capacity")
+
+# Layout
+def layout(**kwargs):
+    data = backend.get()
+    routes = data.routes()
+    first, last = data.day_range()
+    return html.Div([
+        html.H1("Ridership Capacity", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+
+        ########### FILTERS / DROPDOWN MENU ###########
+        html.Div([
+            # ROUTE DROPDOWN
+            html.Div([
+                dcc.Dropdown(
+                    id="route-selector",
+                    options=[{'label': route, 'value': route} for route in routes],
+                    value=routes[0],
+                    style={'font-family': 'Segoe UI', 'padding': '0 2em'}
+                )
+            ], style={'width': '75%'}),
+
+            # DATE SLICER SLIDER
+            html.Div([
+                dcc.DatePickerRange(
+                    id='date-slider',
+                    start_date=encoding.to_date(first),
+                    end_date=encoding.to_date(last),
+                    display_format='YYYY-MM-DD',
+                    style={'font-family': 'Segoe UI', 'padding': '0 2em'}
+                )
+            ], style={'width': '75%'})
+        ], style={'display': 'flex'}),
+
+        # Route/date filter computed once per change and shared by the charts below
+        dcc.Store(id='capacity-filter-store'),
+
+        # CAPACITY PERCENTAGE RANGE
+        html.Div([
+            html.Label("Capacity Reached (%):", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
+            html.Div([
+                dcc.RangeSlider(
+                    id='capacity-range-slider',
+                    min=0, max=capacity.MAX_PERCENT, step=capacity.BUCKET_PERCENT,
+                    value=[80, capacity.MAX_PERCENT],
+                    marks={p: f'{p}%' + ('+' if p == capacity.MAX_PERCENT else '')
+                           for p in range(0, capacity.MAX_PERCENT + 1, 25)},
+                )
+            ], style={'width': '75%', 'display': 'inline-block'})
+        ], style={'display': 'flex', 'padding': '0 2em'}),
+
+        ########## BY DAY OF WEEK HERE ##########
+        dcc.Graph(id="capacity-day-of-week-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+
+        ########## BY SCHEDULED HOUR HERE ##########
+        html.Div([
+            html.Label("Day of Week:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
+            dcc.Dropdown(
+                id='day-of-week-selector',
+                options=[{'label': day, 'value': day} for day in encoding.DAYS_OF_WEEK] + [{'label': 'Weekend', 'value': ['Saturday','Sunday']}] + [{'label': 'Everyday', 'value': 'Everyday'}],
+                value='Everyday',
+                style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
+            ),
+        ], style={'display': 'flex', 'padding': '0 2em'}),
+        dcc.Graph(id="capacity-hour-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+
+        ########## DENIED BOARDINGS HERE ##########
+        # Stops and hours where the most riders were left behind by a full vehicle
+        dcc.Graph(id="denied-boardings-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+    ])
+
+########## ROUTE / DATE FILTER ##########
+# Sum the bins of the selected route and date range once; each capacity range is then a sum of a few bins
+@slices.builder('ridership_capacity')
+def build_capacity_slice(route, start_date, end_date):
+    data = backend.get()  # one snapshot for all three
+    query = dict(route=route, start_date=start_date, end_date=end_date)
+    return {
+        # stop events per load bucket and day of week: day of week chart
+        'day': data.capacity('load_day', ['Load Bucket', 'Day of Week'], **query),
+        # ... and per scheduled hour: hour chart
+        'hour': data.capacity('load_hour', ['Load Bucket', 'Day of Week', 'Hour'], **query),
+        # Riders Left per stop, day of week and hour: denied boardings
+        'left': data.capacity('left', ['Stop', 'Day of Week', 'Hour'], **query),
+    }
+
+@callback(
+    Output("capacity-filter-store", "data"),
+    [Input("route-selector", "value"),
+     Input("date-slider", "start_date"),
+     Input("date-slider", "end_date")]
+)
+@metrics.instrument
+def update_capacity_filter(selected_route, start_date, end_date):
+    return slices.publish('ridership_capacity', route=selected_route, start_date=start_date, end_date=end_date)
+
+def _range_label(capacity_range):
+    low, high = capacity_range
+    return f"{low}%+" if high >= capacity.MAX_PERCENT else f"{low}-{high}%"
+
+def _hour_labels(hours):
+    return [f'{hour:02d}:00' for hour in hours]
+
+########## BY DAY OF WEEK ##########
+@callback(
+    Output("capacity-day-of-week-graph", "figure"),
+    [Input("capacity-filter-store", "data"),
+     Input("capacity-range-slider", "value")]
+)
+@metrics.instrument
+@cache.memoize
+def update_capacity_day_of_week_graph(filter_data, capacity_range):
+    by_day = capacity.in_range(slices.get(filter_data)['day'], *capacity_range)
+    counts = by_day.groupby('Day of Week', observed=False)['Stop Events'].sum()  # every day, in order
+
+    bar = figures.labeled_bar(counts.index.astype(str), counts.to_numpy(), "Day of Week", "Stop Events",
+                              text=counts.to_numpy())
+    return figures.figure(
+        [bar],
+        f"Stop Events at {_range_label(capacity_range)} Capacity by Day of Week for Route {filter_data['route']}",
+        font=True,
+        xaxis=figures.axis("Day of Week"),
+        yaxis=figures.axis("Stop Events")
+    )
+
+########## BY SCHEDULED HOUR ##########
+@callback(
+    Output("capacity-hour-graph", "figure"),
+    [Input("capacity-filter-store", "data"),
+     Input("capacity-range-slider", "value"),
+     Input("day-of-week-selector", "value")]
+)
+@metrics.instrument
+@cache.memoize
+def update_capacity_hour_graph(filter_data, capacity_range, selected_day):
+    by_hour = slices.get(filter_data)['hour']
+    by_hour = by_hour[day_mask(by_hour['Day of Week'], selected_day) & (by_hour['Hour'] >= 0)]
+    # Every hour with service shows, at 0 if the range was never reached
+    hours = sorted(by_hour['Hour'].unique())
+    counts = capacity.in_range(by_hour, *capacity_range).groupby('Hour')['Stop Events'].sum()
+    counts = counts.reindex(hours, fill_value=0)
+
+    bar = figures.labeled_bar(_hour_labels(counts.index), counts.to_numpy(), "Scheduled Hour", "Stop Events",
+                              text=counts.to_numpy())
+    return figures.figure(
+        [bar],
+        f"Stop Events at {_range_label(capacity_range)} Capacity by Scheduled Hour for Route {filter_data['route']}",
+        font=True,
+        xaxis=figures.axis("Scheduled Hour"),
+        yaxis=figures.axis("Stop Events")
+    )
+
+########## DENIED BOARDINGS ##########
+@callback(
+    Output("denied-boardings-graph", "figure"),
+    [Input("capacity-filter-store", "data"),
+     Input("day-of-week-selector", "value")]
+)
+@metrics.instrument
+@cache.memoize
+def update_denied_boardings_graph(filter_data, selected_day):
+    left = slices.get(filter_data)['left']
+    left = left[day_mask(left['Day of Week'], selected_day)]
+    hotspots = left.groupby(['Stop', 'Hour'], as_index=False, observed=True)[['Riders Left', 'Denied Events']].sum()
+    hotspots = hotspots[hotspots['Riders Left'] > 0].nlargest(HOTSPOTS, 'Riders Left')
+    title = f"Top {HOTSPOTS} Denied Boarding Hotspots (Riders Left) for Route {filter_data['route']}"
+
+    if hotspots.empty:
+        return figures.figure([], "No riders were left behind for the selected filters.")
+
+    hotspots = hotspots.iloc[::-1]  # largest at the top
+    labels = [f'{stop} {hour}' for stop, hour in zip(hotspots['Stop'].astype(str), _hour_labels(hotspots['Hour']))]
+    bar = figures.labeled_bar(hotspots['Riders Left'].to_numpy(), labels, "Riders Left", "Stop / Hour",
+                              text_auto=True, color='red', orientation='h',
+                              customdata=hotspots['Denied Events'].to_numpy().tolist())
+    bar['hovertemplate'] = bar['hovertemplate'].replace('<extra>', '<br>Stop Events with Riders Left=%{customdata}<extra>')
+    return figures.figure([bar], title, xaxis=figures.axis("Riders Left"), yaxis=figures.axis("Stop / Hour"))
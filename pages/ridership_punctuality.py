@@ -0,0 +1,189 @@
+import dash
+from dash import dcc, html, callback
+from dash.dependencies import Input, Output
+
+from utils import backend, background, cache, encoding, figures, metrics, punctuality, slices
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+################### READING DATA ###################
+# Lateness and dwell of each stop event are parsed once when the data is
+# loaded (utils/dataset.py); the events are queried per call through the
+# backend (utils/backend.py) so new data (utils/refresh.py) shows up without
+# a restart.
+
+################### DASH APP ###################
+dash.register_page(__name__, title="On-Time Performance")
+
+# Layout
+def layout(**kwargs):
+    data = backend.get()
+    routes = data.routes()
+    first, last = data.day_range()
+    return html.Div([
+        html.H1("On-Time Performance", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+
+        ########### FILTERS / DROPDOWN MENU ###########
+        html.Div([
+            # ROUTE DROPDOWN
+            html.Div([
+                dcc.Dropdown(
+                    id="route-selector",
+                    options=[{'label': route, 'value': route} for route in routes],
+                    value=routes[0],
+                    style={'font-family': 'Segoe UI', 'padding': '0 2em'}
+                )
+            ], style={'width': '75%'}),
+
+            # DATE SLICER SLIDER
+            html.Div([
+                dcc.DatePickerRange(
+                    id='date-slider',
+                    start_date=encoding.to_date(first),
+                    end_date=encoding.to_date(last),
+                    display_format='YYYY-MM-DD',
+                    style={'font-family': 'Segoe UI', 'padding': '0 2em'}
+                )
+            ], style={'width': '75%'})
+        ], style={'display': 'flex'}),
+
+        # Route/date filter computed once per change and shared by the charts below
+        dcc.Store(id='punctuality-filter-store'),
+        # Shown while the filter runs as a background job (utils/background.py)
+        html.Div("Loading the selected dates...", id='punctuality-filter-status', style=background.STATUS_HIDDEN),
+
+        ########## ON TIME BY HOUR HERE ##########
+        dcc.Graph(id="on-time-hour-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+
+        ########## LATENESS / DWELL BY STOP HERE ##########
+        dcc.Graph(id="lateness-stop-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+        dcc.Graph(id="dwell-stop-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+
+        ########## LATENESS BY STOP AND HOUR HERE ##########
+        html.Div([
+            html.Label("Percentile:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
+            dcc.Dropdown(
+                id="lateness-percentile-dropdown",
+                options=[{'label': label, 'value': p} for p, label in punctuality.PERCENTILE_LABELS.items()],
+                value=punctuality.PERCENTILES[0],
+                clearable=False,
+                style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
+            ),
+        ], style={'display': 'flex', 'padding': '0 2em'}),
+        dcc.Graph(id="lateness-heatmap", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+    ])
+
+########## ROUTE / DATE FILTER ##########
+# Filter the selected route and date range and compute the percentiles once; the charts read the result
+@slices.builder('ridership_punctuality')
+def build_punctuality_slice(route, start_date, end_date):
+    events = punctuality.events(backend.get().events(punctuality.COLUMNS, route, start_date, end_date))
+    return {
+        'hour': punctuality.summarize(events, ['Hour']),
+        'stop': punctuality.summarize(events, ['Stop']),
+        'stop_hour': punctuality.summarize(events, ['Stop', 'Hour']),
+    }
+
+# A background job over long ranges, so it doesn't hold up other requests
+@background.callback(
+    Output("punctuality-filter-store", "data"),
+    [Input("route-selector", "value"),
+     Input("date-slider", "start_date"),
+     Input("date-slider", "end_date")],
+    status="punctuality-filter-status"
+)
+@metrics.instrument
+def update_punctuality_filter(selected_route, start_date, end_date):
+    return slices.publish('ridership_punctuality', route=selected_route, start_date=start_date, end_date=end_date)
+
+def _hour_labels(hours):
+    return [f'{hour:02d}:00' for hour in hours]
+
+########## ON TIME BY HOUR ##########
+@callback(
+    Output("on-time-hour-graph", "figure"),
+    Input("punctuality-filter-store", "data")
+)
+@metrics.instrument
+@cache.memoize
+def update_on_time_hour_graph(filter_data):
+    by_hour = slices.get(filter_data)['hour']
+    hours = _hour_labels(by_hour['Hour'])
+
+    # Share of each hour's stop events that were early / on time / late
+    colors = {'Early': figures.COLORS[0], 'On Time': 'green', 'Late': 'red'}
+    traces = []
+    for status, color in colors.items():
+        share = (by_hour[status] / by_hour['Events'] * 100).round(1)
+        traces.append(figures.bar(hours, share, status, text=share, marker={'color': color}))
+    return figures.figure(
+        traces,
+        f"On-Time Performance by Scheduled Hour for Route {filter_data['route']} "
+        f"(on time: {-punctuality.EARLY_SECONDS // 60} min early to {punctuality.LATE_SECONDS // 60} min late)",
+        font=True,
+        barmode='stack',
+        xaxis=figures.axis("Scheduled Hour"),
+        yaxis=figures.axis("% of Stop Events")
+    )
+
+########## LATENESS / DWELL BY STOP ##########
+def _percentile_bars(by_stop, measure, scale):
+    return [figures.bar(by_stop['Stop'].astype(str), (by_stop[f'{measure} p{p}'] / scale).round(1), label,
+                        text=(by_stop[f'{measure} p{p}'] / scale).round(1))
+            for p, label in punctuality.PERCENTILE_LABELS.items()]
+
+@callback(
+    [Output("lateness-stop-graph", "figure"),
+     Output("dwell-stop-graph", "figure")],
+    Input("punctuality-filter-store", "data")
+)
+@metrics.instrument
+@cache.memoize
+def update_stop_percentile_graphs(filter_data):
+    by_stop = slices.get(filter_data)['stop']
+    if by_stop.empty:
+        empty = figures.figure([], 'No data found for selected filters.')
+        return empty, empty
+
+    fig_lateness = figures.figure(
+        _percentile_bars(by_stop, 'Lateness', 60),
+        f"Lateness by Stop for Route {filter_data['route']}",
+        font=True,
+        barmode='group',
+        xaxis=figures.axis("Stop"),
+        yaxis=figures.axis("Minutes Late")
+    )
+    fig_dwell = figures.figure(
+        _percentile_bars(by_stop, 'Dwell', 1),
+        f"Dwell Time by Stop for Route {filter_data['route']}",
+        font=True,
+        barmode='group',
+        xaxis=figures.axis("Stop"),
+        yaxis=figures.axis("Seconds at Stop")
+    )
+    return fig_lateness, fig_dwell
+
+########## LATENESS BY STOP AND HOUR ##########
+@callback(
+    Output("lateness-heatmap", "figure"),
+    [Input("punctuality-filter-store", "data"),
+     Input("lateness-percentile-dropdown", "value")]
+)
+@metrics.instrument
+@cache.memoize
+def update_lateness_heatmap(filter_data, percentile):
+    stop_hour = slices.get(filter_data)['stop_hour']
+    label = punctuality.PERCENTILE_LABELS[percentile]
+    if stop_hour.empty:
+        return figures.figure([], 'No data found for selected filters.')
+
+    minutes = stop_hour.assign(Minutes=(stop_hour[f'Lateness p{percentile}'] / 60).round(1))
+    grid = minutes.pivot(index='Stop', columns='Hour', values='Minutes')  # blank where a stop isn't served
+    trace = figures.heatmap(_hour_labels(grid.columns), grid.index.astype(str), grid.to_numpy(),
+                            "Scheduled Hour", "Stop", f"{label} Minutes Late")
+    return figures.figure(
+        [trace],
+        f"{label} Lateness by Stop and Scheduled Hour for Route {filter_data['route']}",
+        font=True,
+        xaxis=figures.axis("Scheduled Hour"),
+        yaxis=figures.axis("Stop")
+    )
@@ -1,157 +1,181 @@
 import dash
 from dash import dcc, html, callback
 from dash.dependencies import Input, Output
-import pandas as pd
 from datetime import datetime
-import os
-import plotly.express as px
-import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from utils import backend, cache, cube, encoding, export, figures, metrics, prefix, slices
+from utils.index import day_mask
+
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 ################### READING DATA ###################
-# Get the directory of the current script
-script_dir = os.path.dirname(__file__)
-
-# Construct the full path to the CSV file
-# file_name = 'RidershipData.csv'
-# file_name = 'Fall2024_RidershipData.csv'
-# file_name = 'Summer2024_RidershipData.csv'
-# file_name = '051524-051924_RidershipData.csv'
-file_name = 'mock_ridership_data.csv'
-
-# file_path = os.path.join(script_dir, '..','.gitignore','data', file_name)
-file_path = os.path.join(script_dir, '..','data', file_name)
+# Riders On/Off sums/counts of the shared, already-cleaned data, queried per
+# call through the backend (utils/backend.py) rather than kept here, so new
+# data (utils/refresh.py) shows up without a restart.
 
-# Read the CSV file
-df = pd.read_csv(file_path)
 ################### MODIFY DATA ###################
 
-date_format = '%Y/%m/%d'
-df['Day'] = pd.to_datetime(df['Day'], format=date_format)
-
 # Define the order of days of the week in chronological order
 days_of_week_order = [
     'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'
 ]
 
+# How many top/bottom stops the charts rank (chosen on the page)
+STOP_COUNTS = [5, 10, 15, 20, 25]
+DEFAULT_STOP_COUNT = 10
+
 ################### DASH APP ###################
 dash.register_page(__name__, title="Ridership by Stops")
 
-layout = html.Div([
-    # FILTERING OPTIONS
-    html.Div([
-        dcc.Dropdown(
-            id='riders-selector',
-            options=[
-                {'label': 'Riders On', 'value': 'Riders On'},
-                {'label': 'Riders Off', 'value': 'Riders Off'}
-            ],
-            value='Riders On',
-            style={'width': '75%', 'display': 'inline-block', 'font-family': 'Segoe UI'}),
-        dcc.Dropdown(
-            id='route-selector',
-            options=[
-                {'label': route, 'value': route} for route in df['Route'].unique()
-            ],
-            multi=False,
-            value='Waltham Shuttle',
-            style={'width': '75%', 'display': 'inline-block','font-family': 'Segoe UI'}),
-        dcc.Dropdown(
-            id='aggregation-selector',
-            options=[
-                {'label': 'Sum', 'value': 'sum'},
-                {'label': 'Average', 'value': 'avg'}
-            ],
-            value='sum',
-            style={'width': '75%', 'display': 'inline-block', 'font-family': 'Segoe UI'}),
-        dcc.DatePickerRange(
-            id='date-slider',
-            start_date=df['Day'].min(),
-            end_date=df['Day'].max(),
-            style={'width': '75%', 'display': 'inline-block', 'font-family': 'Segoe UI'}
-        ),
-    ], style={'display': 'flex'}),
-
-    # TOP/BOTTOM 5 STOPS SUM
-    # top-x-bar-overall
-    dcc.Graph(id='top-5-overall-bar-chart', style={'width': '48%', 'display': 'inline-block'}),
-    dcc.Graph(id='bottom-5-overall-bar-chart', style={'width': '48%', 'display': 'inline-block'}),
-
-    #TOP/BOTTOM 5 STOPS BY DAY OF WEEK
-    # top/bottom-stops-dayofweek
-    dcc.Graph(id='top-stops-dayofweek'),
-    dcc.Graph(id='bottom-stops-dayofweek'),
-
-    # ALL STOPS RIDERSHIP
-    # STOP MULTI SELECT
+def layout(**kwargs):
+    data = backend.get()
+    routes = data.routes()
+    first, last = data.day_range()
+    return html.Div([
+        # FILTERING OPTIONS
         html.Div([
             dcc.Dropdown(
-                id='stop-multiselect',
-                options=[],  # Initialize with an empty list
-                value=[],
-                multi=True,
-                style={'max-height': '95px', 'overflow-y': 'auto', 'font-family': 'Segoe UI', 'padding-left': '2em'}
-            )
-        ], style={'width': '75%'}),
-    dcc.Graph(id='stop-bar-chart')
-])
+                id='riders-selector',
+                options=[
+                    {'label': 'Riders On', 'value': 'Riders On'},
+                    {'label': 'Riders Off', 'value': 'Riders Off'}
+                ],
+                value='Riders On',
+                style={'width': '75%', 'display': 'inline-block', 'font-family': 'Segoe UI'}),
+            dcc.Dropdown(
+                id='route-selector',
+                options=[
+                    {'label': route, 'value': route} for route in routes
+                ],
+                multi=False,
+                value='Waltham Shuttle',
+                style={'width': '75%', 'display': 'inline-block','font-family': 'Segoe UI'}),
+            dcc.Dropdown(
+                id='aggregation-selector',
+                options=[
+                    {'label': 'Sum', 'value': 'sum'},
+                    {'label': 'Average', 'value': 'avg'}
+                ],
+                value='sum',
+                style={'width': '75%', 'display': 'inline-block', 'font-family': 'Segoe UI'}),
+            dcc.DatePickerRange(
+                id='date-slider',
+                start_date=encoding.to_date(first),
+                end_date=encoding.to_date(last),
+                style={'width': '75%', 'display': 'inline-block', 'font-family': 'Segoe UI'}
+            ),
+            dcc.Dropdown(
+                id='stop-count-selector',
+                options=[{'label': f'Top/Bottom {count}', 'value': count} for count in STOP_COUNTS],
+                value=DEFAULT_STOP_COUNT,
+                clearable=False,
+                style={'width': '75%', 'display': 'inline-block', 'font-family': 'Segoe UI'}),
+        ], style={'display': 'flex'}),
+
+        # Route/date filter computed once per change and shared by the charts below
+        dcc.Store(id='stops-filter-store'),
+
+        # TOP/BOTTOM 5 STOPS SUM
+        # top-x-bar-overall
+        dcc.Graph(id='top-5-overall-bar-chart', style={'width': '48%', 'display': 'inline-block'}),
+        dcc.Graph(id='bottom-5-overall-bar-chart', style={'width': '48%', 'display': 'inline-block'}),
+
+        #TOP/BOTTOM 5 STOPS BY DAY OF WEEK
+        # top/bottom-stops-dayofweek
+        dcc.Graph(id='top-stops-dayofweek'),
+        dcc.Graph(id='bottom-stops-dayofweek'),
+
+        # ALL STOPS RIDERSHIP
+        # STOP MULTI SELECT
+            html.Div([
+                dcc.Dropdown(
+                    id='stop-multiselect',
+                    options=[],  # Initialize with an empty list
+                    value=[],
+                    multi=True,
+                    style={'max-height': '95px', 'overflow-y': 'auto', 'font-family': 'Segoe UI', 'padding-left': '2em'}
+                )
+            ], style={'width': '75%'}),
+        dcc.Graph(id='stop-bar-chart'),
+
+        # DOWNLOADS (streamed by the server, see utils/export.py)
+        html.Div([
+            html.A('Per-stop totals (CSV)', id='stops-csv-link', style=export.LINK_STYLE),
+            html.A('Per-stop totals (Parquet)', id='stops-parquet-link', style=export.LINK_STYLE),
+            html.A('Stop events (CSV)', id='stops-events-csv-link', style=export.LINK_STYLE),
+            html.A('Stop events (Parquet)', id='stops-events-parquet-link', style=export.LINK_STYLE),
+        ], style={'padding-left': '2em'})
+    ])
+
+###### ROUTE / DATE FILTER ######
+# Total the selected route and date range by stop once (from running totals, so a long
+# range costs no more than a short one); the charts read the result
+@slices.builder('ridership_stops')
+def build_stops_slice(route, start_date, end_date):
+    stop_dow = backend.get().stop_totals(route=route, start_date=start_date, end_date=end_date)
+    return {
+        'stop_dow': stop_dow,
+        'stop_totals': encoding.labeled(cube.regroup(stop_dow, ['Stop'])).set_index('Stop'),
+    }
 
-###### TOP/BOTTOM 5 OVERALL ######
 @callback(
-    Output('top-5-overall-bar-chart', 'figure'),  # corrected ID
+    Output('stops-filter-store', 'data'),
     [Input('route-selector', 'value'),
      Input('date-slider', 'start_date'),
-     Input('date-slider', 'end_date'),
-     Input('riders-selector', 'value')]
+     Input('date-slider', 'end_date')]
 )
-def update_top_5_chart(selected_route, start_date, end_date, selected_riders):
-    filtered_df = df[(df['Route'] == selected_route) &
-                     (df['Day'] >= start_date) &
-                     (df['Day'] <= end_date)]
-    
-    sorted_df = filtered_df.groupby(['Stop'])[selected_riders].sum().sort_values(ascending=False).head(10)
-    
-    title = f'Top 10 Stops by {selected_riders} for Route {selected_route}'
-    fig = px.bar(sorted_df, x=selected_riders, y=sorted_df.index, title=title, color_discrete_sequence=['green'], text_auto=True, orientation='h')
-    return fig
-
+@metrics.instrument
+def update_stops_filter(selected_route, start_date, end_date):
+    return slices.publish('ridership_stops', route=selected_route, start_date=start_date, end_date=end_date)
 
+###### TOP/BOTTOM 5 OVERALL ######
+# Both rankings come from the same per-stop totals, picked without sorting all of them
 @callback(
-    Output('bottom-5-overall-bar-chart', 'figure'),  # corrected ID
-    [Input('route-selector', 'value'),
-     Input('date-slider', 'start_date'),
-     Input('date-slider', 'end_date'),
-     Input('riders-selector', 'value')]
+    [Output('top-5-overall-bar-chart', 'figure'),  # corrected ID
+     Output('bottom-5-overall-bar-chart', 'figure')],
+    [Input('stops-filter-store', 'data'),
+     Input('riders-selector', 'value'),
+     Input('stop-count-selector', 'value')]
 )
-def update_bottom_5_chart(selected_route, start_date, end_date, selected_riders):
-    filtered_df = df[(df['Route'] == selected_route) &
-                     (df['Day'] >= start_date) &
-                     (df['Day'] <= end_date)]
-    
-    sorted_df = filtered_df.groupby(['Stop'])[selected_riders].sum().sort_values().head(10)
-    
-    title = f'Bottom 10 Stops by {selected_riders} for Route {selected_route}'
-    fig = px.bar(sorted_df, x=selected_riders, y=sorted_df.index, title=title, color_discrete_sequence=['red'], text_auto=True, orientation='h')
-    return fig
+@metrics.instrument
+@cache.memoize
+def update_top_bottom_5_charts(filter_data, selected_riders, stop_count):
+    selected_route = filter_data['route']
+    stop_totals = slices.get(filter_data)['stop_totals'][selected_riders]
+
+    top_df = stop_totals.iloc[prefix.top_k(stop_totals, stop_count)]
+    title = f'Top {stop_count} Stops by {selected_riders} for Route {selected_route}'
+    fig_top = stop_ranking_figure(top_df, selected_riders, title, 'green')
+
+    bottom_df = stop_totals.iloc[prefix.top_k(stop_totals, stop_count, largest=False)]
+    title = f'Bottom {stop_count} Stops by {selected_riders} for Route {selected_route}'
+    fig_bottom = stop_ranking_figure(bottom_df, selected_riders, title, 'red')
+    return fig_top, fig_bottom
+
+def stop_ranking_figure(totals, selected_riders, title, color):
+    bar = figures.labeled_bar(totals.to_numpy(), totals.index, selected_riders, 'Stop',
+                              text_auto=True, color=color, orientation='h')
+    return figures.figure([bar] if len(totals) else [], title, barmode='relative',
+                          xaxis=figures.axis(selected_riders), yaxis=figures.axis('Stop'))
 
 ###### TOP/BOTTOM 5 BY DAY OF WEEK ######
 @callback(
     [Output('top-stops-dayofweek', 'figure'), Output('bottom-stops-dayofweek', 'figure')],
-    [Input('riders-selector', 'value'), Input('route-selector', 'value'), Input('aggregation-selector', 'value'),
-     Input('date-slider', 'start_date'), Input('date-slider', 'end_date')]
+    [Input('riders-selector', 'value'), Input('stops-filter-store', 'data'), Input('aggregation-selector', 'value'),
+     Input('stop-count-selector', 'value')]
 )
-def update_graphs(riders_option, selected_route, aggregation_option, start_date, end_date):
-    filtered_df = df[(df['Route'] == selected_route) & (df['Day'] >= start_date) & (df['Day'] <= end_date)]
+@metrics.instrument
+@cache.memoize
+def update_graphs(riders_option, filter_data, aggregation_option, stop_count):
+    grouped_df = slices.get(filter_data)['stop_dow']
+    grouped_df = cube.finish(grouped_df[['Stop', 'Day of Week', riders_option, cube.count_column(riders_option)]],
+                             aggregation_option, [riders_option])
+    grouped_df = encoding.labeled(grouped_df)
 
-    if aggregation_option == 'sum':
-        grouped_df = filtered_df.groupby(['Stop', 'Day Of Week'])[riders_option].sum().reset_index()
-    else:
-        grouped_df = filtered_df.groupby(['Stop', 'Day Of Week'])[riders_option].mean().reset_index()
-
-    # Get the top 5 stops with the all-time highest Riders On/Off
-    top_stops = grouped_df.groupby('Stop')[riders_option].sum().nlargest(10).index
-    bottom_stops = grouped_df.groupby('Stop')[riders_option].sum().nsmallest(10).index
+    # Get the top/bottom stops with the highest/lowest Riders On/Off over the range
+    stop_totals = grouped_df.groupby('Stop')[riders_option].sum()
+    top_stops = stop_totals.index[prefix.top_k(stop_totals, stop_count)]
+    bottom_stops = stop_totals.index[prefix.top_k(stop_totals, stop_count, largest=False)]
 
     # Create DataFrames to store daily data for top and bottom stops
     top_daily_data = grouped_df[grouped_df['Stop'].isin(top_stops)]
@@ -161,85 +185,76 @@ def update_graphs(riders_option, selected_route, aggregation_option, start_date,
     color_mapping = {}
     common_stops = set(top_stops).intersection(bottom_stops)
     for stop in common_stops:
-        color_mapping[stop] = px.colors.qualitative.Plotly[len(color_mapping) % len(px.colors.qualitative.Plotly)]
+        color_mapping[stop] = figures.COLORS[len(color_mapping) % len(figures.COLORS)]
 
     # Create clustered vertical bar charts for the top and bottom stops with common color mapping
-    fig_top = px.bar(top_daily_data, 
-                     x='Day Of Week', 
-                     y=riders_option, 
-                     color='Stop',
-                     title=f'Highest 10 Stops for {riders_option} by Day of Week', 
-                     barmode='group',
-                     color_discrete_map=color_mapping,
-                     text_auto=True)  # Updated title and color mapping
-    fig_bottom = px.bar(bottom_daily_data, 
-                        x='Day Of Week', 
-                        y=riders_option, color='Stop',
-                        title=f'Lowest 10 Stops for {riders_option} by Day of Week', 
-                        barmode='group',
-                        color_discrete_map=color_mapping,
-                        text_auto=True)  # Updated title and color mapping
-
-    # Sort days of the week in chronological order
-    fig_top.update_xaxes(categoryorder='array', categoryarray=days_of_week_order)
-    fig_bottom.update_xaxes(categoryorder='array', categoryarray=days_of_week_order)
-    
+    fig_top = day_of_week_figure(top_daily_data, riders_option, color_mapping,
+                                 f'Highest {stop_count} Stops for {riders_option} by Day of Week')
+    fig_bottom = day_of_week_figure(bottom_daily_data, riders_option, color_mapping,
+                                    f'Lowest {stop_count} Stops for {riders_option} by Day of Week')
     return fig_top, fig_bottom
 
+def day_of_week_figure(daily_data, riders_option, color_mapping, title):
+    traces = figures.grouped_bars(daily_data, 'Day of Week', riders_option, 'Stop',
+                                  colors=color_mapping, text_auto=True)
+    return figures.figure(traces, title, barmode='group',
+                          legend={'title': {'text': 'Stop'}, 'tracegroupgap': 0},
+                          # Sort days of the week in chronological order
+                          xaxis=figures.axis('Day of Week', categoryorder='array', categoryarray=days_of_week_order),
+                          yaxis=figures.axis(riders_option))
+
 ######## OVERALL STOP ###########
 @callback(
     [Output('stop-multiselect', 'options'),
      Output('stop-multiselect', 'value')],  # Set the initial value of stop-multiselect
     Input('route-selector', 'value')
 )
+@metrics.instrument
 def update_stop_selector_options(selected_route):
-    stops_for_route = df[df['Route'] == selected_route]['Stop'].unique()
+    stops_for_route = backend.get().stops(selected_route)
     stop_options = [{'label': stop, 'value': stop} for stop in stops_for_route]
     return stop_options, list(stops_for_route)
 
 # RIDERSHIP BY STOP
 @callback(
     Output('stop-bar-chart', 'figure'),
-    [Input('route-selector', 'value'),
-     Input('date-slider', 'start_date'),
-     Input('date-slider', 'end_date'),
+    [Input('stops-filter-store', 'data'),
      Input('stop-multiselect', 'value'),
      Input('day-of-week-selector', 'value'),
      Input('calc-method-dropdown', 'value')]
 )
-def update_stop_bar_chart(selected_route, start_date, end_date, selected_stops, selected_day, calc_method):
-    filtered_df = df[(df['Route'] == selected_route) & 
-                     (df['Stop'].isin(selected_stops)) & 
-                     (df['Day'] >= start_date) & 
-                     (df['Day'] <= end_date)]
-    
-    if selected_day != 'Everyday':
-        filtered_df = filtered_df[filtered_df['Day of Week'] == selected_day]
-
-    if calc_method == 'Average':
-        stop_data = filtered_df.groupby('Stop')[['Riders On', 'Riders Off']].mean().reset_index()
-    else:
-        stop_data = filtered_df.groupby('Stop')[['Riders On', 'Riders Off']].sum().reset_index()
+@metrics.instrument
+@cache.memoize
+def update_stop_bar_chart(filter_data, selected_stops, selected_day, calc_method):
+    selected_route = filter_data['route']
+    stop_dow = slices.get(filter_data)['stop_dow']
+    stop_dow = stop_dow[stop_dow['Stop'].isin(selected_stops) & day_mask(stop_dow['Day of Week'], selected_day)]
+    stop_data = encoding.labeled(cube.finish(cube.regroup(stop_dow, ['Stop']), calc_method))
     
-    fig = go.Figure(data=[
-        go.Bar(name='Riders On', 
-               x=stop_data['Stop'], 
-               y=stop_data['Riders On'],
-                text=stop_data['Riders On'],  # Add text labels
-                textposition='auto'  # Position text labels to be visible
-                ),
-        go.Bar(name='Riders Off', 
-               x=stop_data['Stop'], 
-               y=stop_data['Riders Off'],
-                text=stop_data['Riders Off'],  # Add text labels
-                textposition='auto'  # Position text labels to be visible
-            )
-    ])
+    if stop_data.empty:
+        return figures.figure([], 'No data found for selected filters.')
 
-    
-    fig.update_layout(barmode='group', title=f'{calc_method} Riders On and Off at Stops for Route {selected_route}')
+    # Text labels on the bars, positioned to be visible
+    return figures.figure(
+        [figures.bar(stop_data['Stop'], stop_data['Riders On'], 'Riders On', text=stop_data['Riders On']),
+         figures.bar(stop_data['Stop'], stop_data['Riders Off'], 'Riders Off', text=stop_data['Riders Off'])],
+        f'{calc_method} Riders On and Off at Stops for Route {selected_route}',
+        barmode='group'
+    )
 
-    if filtered_df.empty:
-        return go.Figure(layout={'title': 'No data found for selected filters.'})
-    
-    return fig
+# DOWNLOAD LINKS
+@callback(
+    [Output('stops-csv-link', 'href'),
+     Output('stops-parquet-link', 'href'),
+     Output('stops-events-csv-link', 'href'),
+     Output('stops-events-parquet-link', 'href')],
+    [Input('stops-filter-store', 'data'),
+     Input('aggregation-selector', 'value')]
+)
+@metrics.instrument
+def update_stops_export_links(filter_data, aggregation_option):
+    filters = dict(route=filter_data['route'], start_date=filter_data['start_date'], end_date=filter_data['end_date'])
+    return [export.url('aggregations/stops', 'csv', calc=aggregation_option, **filters),
+            export.url('aggregations/stops', 'parquet', calc=aggregation_option, **filters),
+            export.url('events', 'csv', **filters),
+            export.url('events', 'parquet', **filters)]
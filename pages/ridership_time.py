@@ -1,330 +1,285 @@
 import dash
-from dash import dcc, html, callback
-from dash.dependencies import Input, Output
-import pandas as pd
+from dash import dcc, html, callback, clientside_callback, ClientsideFunction
+from dash.dependencies import Input, Output, State
+import numpy as np
 from datetime import datetime
-import os
-import plotly.express as px
-import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from utils import backend, background, binning, cache, cube, dates, detail, encoding, export, figures, metrics, slices
+
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 ################### READING DATA ###################
-# Get the directory of the current script
-script_dir = os.path.dirname(__file__)
-
-# Construct the full path to the CSV file
-# file_name = 'RidershipData.csv'
-# file_name = 'Fall2024_RidershipData.csv'
-# file_name = '20250205_RidershipData.csv'
-# file_name = 'Summer2024_RidershipData.csv'
-# file_name = '051524-051924_RidershipData.csv'
-file_name = 'mock_ridership_data.csv'
-
-# file_path = os.path.join(script_dir, '..','.gitignore','data', file_name)
-file_path = os.path.join(script_dir, '..','data', file_name)
-
-# Read the CSV file
-df = pd.read_csv(file_path)
-
-################### MODIFY DATA ###################
-#removing cancelled trips, skipped/waiting stops (bc no riders getting on)
-df.drop(df[df['Ride State'] == 'Cancelled'].index, inplace = True)
-df.drop(df[df['Stop State'] == 'Skipped'].index, inplace = True)
-df.drop(df[df['Stop State'] == 'Awaiting'].index, inplace = True)
-
-# Removing exact duplicate rows
-df.drop_duplicates(inplace=True)
-
-# converting to datetime
-date_format = '%Y/%m/%d'
-df['Day'] = pd.to_datetime(df['Day'], format=date_format)
-
-#trimming to include time only
-ind = df.iloc[0]['Scheduled Time'].find(" ")
-df['Scheduled Time'] = df['Scheduled Time'].str[ind+1:]
-
-ind = df.iloc[0]['Actual Arrival'].find(" ")
-df['Actual Arrival'] = df['Actual Arrival'].str[ind+1:]
-
-time_format = "%H:%M:%S"
-df['Scheduled Time'] = pd.to_datetime(df['Scheduled Time'], format=time_format).dt.time
-
-# Adding a Day of Week column
-df['Day of Week'] = df['Day'].dt.day_name()
+# Riders On/Off sums/counts of the shared, already-cleaned data, queried per
+# call through the backend (utils/backend.py) rather than kept here, so new
+# data (utils/refresh.py) shows up without a restart.
 
 ################### DASH APP ###################
 dash.register_page(__name__, title="Ridership over Dates and Time")
 
 # Layout
-layout = html.Div([
-    html.H1("Ridership by Time", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+def layout(**kwargs):
+    data = backend.get()
+    routes = data.routes()
+    first, last = data.day_range()
+    return html.Div([
+        html.H1("Ridership by Time", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
 
-    # AVERAGE STOP RIDERSHIP GRAPH
-    # dcc.Graph(id='stop-bar-chart'), # MOVE TO STOP UTILIZATION
+        # AVERAGE STOP RIDERSHIP GRAPH
+        # dcc.Graph(id='stop-bar-chart'), # MOVE TO STOP UTILIZATION
 
-    ########### FILTERS / DROPDOWN MENU ###########
-    html.Div([
-        # ROUTE DROPDOWN
+        ########### FILTERS / DROPDOWN MENU ###########
         html.Div([
-            dcc.Dropdown(
-                id="route-selector",
-                options=[{'label': route, 'value': route} for route in df['Route'].unique()],
-                value=df['Route'].unique()[0],
-                style={'font-family': 'Segoe UI', 'padding': '0 2em'}
+            # ROUTE DROPDOWN
+            html.Div([
+                dcc.Dropdown(
+                    id="route-selector",
+                    options=[{'label': route, 'value': route} for route in routes],
+                    value=routes[0],
+                    style={'font-family': 'Segoe UI', 'padding': '0 2em'}
+                )
+            ], style={'width': '75%'}),
+
+            # DAY OF WEEK SELECTION
+            html.Div([
+                dcc.Dropdown(
+                    id='day-of-week-selector',
+                    options=[{'label': day, 'value': day} for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']] + [{'label': 'Weekend', 'value': ['Saturday','Sunday']}] + [{'label': 'Everyday', 'value': 'Everyday'}],
+                    value='Everyday',
+                    style={'font-family': 'Segoe UI', 'padding': '0 2em'}
+                )
+            ], style={'width': '25%', 'padding-left': '2em'}),
+
+            # DATE SLICER SLIDER
+            html.Div([
+                dcc.DatePickerRange(
+                    id='date-slider',
+                    start_date=encoding.to_date(first),
+                    end_date=encoding.to_date(last),
+                    display_format='YYYY-MM-DD',
+                    style={'font-family': 'Segoe UI', 'padding': '0 2em'}
+                )
+            ], style={'width': '75%'})
+        ], style={'display': 'flex'}),
+
+        # Route/date filter computed once per change and shared by the charts below
+        dcc.Store(id='time-filter-store'),
+        # Shown while the filter runs as a background job (utils/background.py)
+        html.Div("Loading the selected dates...", id='time-filter-status', style=background.STATUS_HIDDEN),
+        # Aggregates the browser redraws the toggle-only charts from, and their figure template
+        dcc.Store(id='time-aggregate-store'),
+        dcc.Store(id='stop-time-aggregate-store'),
+        dcc.Store(id='figure-template-store', data=figures.TEMPLATE),
+    
+        # CALCULATION METHOD
+        html.Div([
+            html.Label("Calculation Method:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
+            dcc.Dropdown( id="calc-method-dropdown",
+                options=[
+                    {'label': 'Average', 'value': 'Average'},
+                    {'label': 'Sum', 'value': 'Sum'}
+                ],
+                value='Sum',  # Default to "Average"
+                style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
             )
-        ], style={'width': '75%'}),
+        ], style={'display': 'flex', 'padding': '0 2em'}),
+
+        ########## BY SEMESTER HERE ##########
+        dcc.Graph(id="semester-ridership-graph", style={'padding': '0 2em'}),
+
+        ########## BY MONTH HERE ##########
+        dcc.Graph(id="monthly-ridership-graph", style={'padding': '0 2em'}),
 
-        # DAY OF WEEK SELECTION
+        ########## BY WEEK HERE ##########
+        dcc.Graph(id="weekly-ridership-graph", style={'padding': '0 2em'}),
+        dcc.Store(id='weekly-zoom-store'),  # zoomed-in date range, redrawn in more detail
+
+        ########## BY DAY/DATE HERE ##########
+        # DROPDOWN FOR WEEKLY RANGES
         html.Div([
+            html.Label("Select Date Range:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
             dcc.Dropdown(
-                id='day-of-week-selector',
-                options=[{'label': day, 'value': day} for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']] + [{'label': 'Weekend', 'value': ['Saturday','Sunday']}] + [{'label': 'Everyday', 'value': 'Everyday'}],
-                value='Everyday',
-                style={'font-family': 'Segoe UI', 'padding': '0 2em'}
-            )
-        ], style={'width': '25%', 'padding-left': '2em'}),
+                id="date-range-dropdown",
+                options=[],  # Will be dynamically populated
+                style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
+            ),
+        ], style={'display': 'flex', 'padding': '0 2em'}),
 
-        # DATE SLICER SLIDER
         html.Div([
-            dcc.DatePickerRange(
-                id='date-slider',
-                start_date=df['Day'].min(),
-                end_date=df['Day'].max(),
-                display_format='YYYY-MM-DD',
-                style={'font-family': 'Segoe UI', 'padding': '0 2em'}
-            )
-        ], style={'width': '75%'})
-    ], style={'display': 'flex'}),
-
-    
-    # CALCULATION METHOD
-    html.Div([
-        html.Label("Calculation Method:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
-        dcc.Dropdown( id="calc-method-dropdown",
-            options=[
-                {'label': 'Average', 'value': 'Average'},
-                {'label': 'Sum', 'value': 'Sum'}
-            ],
-            value='Sum',  # Default to "Average"
-            style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
-        )
-    ], style={'display': 'flex', 'padding': '0 2em'}),
-
-    ########## BY SEMESTER HERE ##########
-    dcc.Graph(id="semester-ridership-graph", style={'padding': '0 2em'}),
-
-    ########## BY MONTH HERE ##########
-    dcc.Graph(id="monthly-ridership-graph", style={'padding': '0 2em'}),
-
-    ########## BY WEEK HERE ##########
-    dcc.Graph(id="weekly-ridership-graph", style={'padding': '0 2em'}),
-
-    ########## BY DAY/DATE HERE ##########
-    # DROPDOWN FOR WEEKLY RANGES
-    html.Div([
-        html.Label("Select Date Range:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
-        dcc.Dropdown(
-            id="date-range-dropdown",
-            options=[],  # Will be dynamically populated
-            style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
-        ),
-    ], style={'display': 'flex', 'padding': '0 2em'}),
-
-    html.Div([
-        html.Label("Group Data:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
-        dcc.Dropdown(
-            id="group-data-dropdown",
-            options=[
-                {'label': 'By Week', 'value': 'By Week'},
-                {'label': 'Entire Dates with Selected Route', 'value': 'Entire Dates'}
-            ],
-            value='By Week',  # Default to "By Week"
-            style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
-        ),
-    ], style={'display': 'flex', 'padding': '0 2em'}),
-
-    # RIDERSHIP-DAILY-BY-WEEK
-    # this calculates total ridership over 1 day shown as a week or all time by route (formerly (ridership-dates-graph))
-    dcc.Graph(id="ridership-daily-by-week-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+            html.Label("Group Data:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
+            dcc.Dropdown(
+                id="group-data-dropdown",
+                options=[
+                    {'label': 'By Week', 'value': 'By Week'},
+                    {'label': 'Entire Dates with Selected Route', 'value': 'Entire Dates'}
+                ],
+                value='By Week',  # Default to "By Week"
+                style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
+            ),
+        ], style={'display': 'flex', 'padding': '0 2em'}),
+
+        # RIDERSHIP-DAILY-BY-WEEK
+        # this calculates total ridership over 1 day shown as a week or all time by route (formerly (ridership-dates-graph))
+        dcc.Graph(id="ridership-daily-by-week-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+        dcc.Store(id='daily-zoom-store'),
+
+        # DOWNLOADS (streamed by the server, see utils/export.py)
+        html.Div([
+            html.A("Daily totals (CSV)", id='daily-csv-link', style=export.LINK_STYLE),
+            html.A("Daily totals (Parquet)", id='daily-parquet-link', style=export.LINK_STYLE),
+            html.A("Stop events (CSV)", id='time-events-csv-link', style=export.LINK_STYLE),
+            html.A("Stop events (Parquet)", id='time-events-parquet-link', style=export.LINK_STYLE),
+        ], style={'padding': '0 2em'}),
     
-    ########## BY TIME HERE ##########
-    # RIDERSHIP-30MIN-TIME-GRAPH
-    # This breaks down and calculates ridership over 30 minute increments.
-    # Overall Ridership by Scheduled Time Graph (was called overall-ridership-time-graph)
-    dcc.Graph(id="ridership-30min-time-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
-
-    # STOP RIDERSHIP OVER TIME
-    # Stop Dropdown
-    html.Div([
-        html.Label("Select Stop:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
-        dcc.Dropdown(
-            id="stop-single-select-dropdown", # formerly stop-dropdown
-            options=[],
-            value='Admissions',
-            style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
-        ),
-    ], style={'display': 'flex'}),
-
-    # STOP-SCHEDULED-TIME-GRAPH
-    # Given a particular stop, show the riders on/off by scheduled time.
-    dcc.Graph(id="stop-scheduled-time-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
-    # formerly ridership-time-graph
-])
+        ########## BY TIME HERE ##########
+        # RIDERSHIP-30MIN-TIME-GRAPH
+        # This breaks down and calculates ridership over 30 minute increments (or the selected interval).
+        # Overall Ridership by Scheduled Time Graph (was called overall-ridership-time-graph)
+        html.Div([
+            html.Label("Time Interval:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
+            dcc.Dropdown(
+                id="time-bin-width-dropdown",
+                options=[{'label': f'{width} Minutes', 'value': width} for width in binning.BIN_WIDTHS],
+                value=binning.DEFAULT_BIN_WIDTH,
+                clearable=False,
+                style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
+            ),
+        ], style={'display': 'flex', 'padding': '0 2em'}),
+        dcc.Graph(id="ridership-30min-time-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+
+        # STOP RIDERSHIP OVER TIME
+        # Stop Dropdown
+        html.Div([
+            html.Label("Select Stop:", style={'font-family': 'Segoe UI', 'width': '25%', 'display': 'inline-block'}),
+            dcc.Dropdown(
+                id="stop-single-select-dropdown", # formerly stop-dropdown
+                options=[],
+                value='Admissions',
+                style={'font-family': 'Segoe UI', 'width': '75%', 'display': 'inline-block'}
+            ),
+        ], style={'display': 'flex'}),
+
+        # STOP-SCHEDULED-TIME-GRAPH
+        # Given a particular stop, show the riders on/off by scheduled time.
+        dcc.Graph(id="stop-scheduled-time-graph", style={'font-family': 'Segoe UI', 'padding': '0 2em'}),
+        # formerly ridership-time-graph
+    ])
 
-########## BY-SEMESTER VISUALIZATIONS + DROPDOWNS ##########
-@callback(
-    Output("semester-ridership-graph", "figure"),
+########## ROUTE / DATE FILTER ##########
+# Filter the selected route and date range once; the charts read the result
+@slices.builder('ridership_time')
+def build_time_slice(route, start_date, end_date):
+    data = backend.get()  # one snapshot for all three
+    query = dict(route=route, start_date=start_date, end_date=end_date)
+    by_time = data.ridership(['Day of Week', 'Scheduled Time'], **query)
+    stop_time = data.ridership(['Stop', 'Day of Week', 'Scheduled Time'], **query)
+    return {
+        # one row per day: semester, month, week and daily charts
+        'daily': data.ridership(['Day', 'Day of Week'], **query),
+        # per day of week and scheduled time: 30-minute chart
+        'time': by_time[by_time['Scheduled Time'] != encoding.MISSING_TIME],
+        # per stop, day of week and scheduled time: stop by scheduled time chart
+        'stop_time': stop_time[stop_time['Scheduled Time'] != encoding.MISSING_TIME],
+    }
+
+# A background job over long ranges, so it doesn't hold up other requests
+@background.callback(
+    Output("time-filter-store", "data"),
     [Input("route-selector", "value"),
      Input("date-slider", "start_date"),
-     Input("date-slider", "end_date"),
-     Input("calc-method-dropdown", "value"),
-     Input("day-of-week-selector", "value")]
+     Input("date-slider", "end_date")],
+    status="time-filter-status"
 )
-def update_semester_ridership_graph(selected_route, start_date, end_date, calc_method, selected_day):
-    # Filter data for the selected route and date range
-    filtered_df = df.loc[
-                    (df['Route'] == selected_route) & 
-                    (df['Day'] >= start_date) & 
-                    (df['Day'] <= end_date)
-                ].copy()
-    
-    if isinstance(selected_day, list):  # Check if selected_day is a list (for 'Weekend')
-        filtered_df = filtered_df[filtered_df['Day of Week'].isin(selected_day)]
-    elif selected_day != 'Everyday':  # Handle individual days
-        filtered_df = filtered_df[filtered_df['Day of Week'] == selected_day]
+@metrics.instrument
+def update_time_filter(selected_route, start_date, end_date):
+    return slices.publish('ridership_time', route=selected_route, start_date=start_date, end_date=end_date)
 
 
-    # Add Semester column based on date
-    filtered_df['Semester'] = 'Fall ' + filtered_df['Day'].dt.year.astype(str)
-    filtered_df.loc[filtered_df['Day'].dt.month < 6, 'Semester'] = 'Spring ' + filtered_df['Day'].dt.year.astype(str)
+########## CLIENTSIDE AGGREGATE ##########
+# Sums and counts for the semester, month, week and time-of-day charts, sent to
+# the browser once per route/date range. Switching the calculation method, day
+# of week or time interval then redraws those charts in the browser
+# (assets/time_charts.js) without a round trip.
+def _columns(frame, columns):
+    return {key: frame[column].tolist() for key, column in columns.items()}
 
-    filtered_df['Riders On'] = pd.to_numeric(filtered_df['Riders On'], errors='coerce')
-    filtered_df = filtered_df.dropna(subset=['Riders On'])  # Drop rows with NaN values
-    
-    if calc_method == 'Average':
-        # filtered_df['Riders On'] = pd.to_numeric(filtered_df['Riders On'], errors='coerce')
-        grouped = filtered_df.groupby('Semester')['Riders On'].mean().reset_index()
-    else:
-        grouped = filtered_df.groupby('Semester')['Riders On'].sum().reset_index()
-
-    # Group by Semester
-    # grouped = filtered_df.groupby('Semester')['Riders On'].agg(calc_method.lower()).reset_index()
-
-    # Create pie chart
-    fig = px.pie(
-        grouped,
-        names='Semester',
-        values='Riders On',
-        title="Ridership by Semester",
-        labels={"Semester": "Semester", "Riders On": "Riders On"},
-    )
-    fig.update_traces(textposition="auto", textinfo='value')
-    return fig
+@callback(
+    Output("time-aggregate-store", "data"),
+    Input("time-filter-store", "data")
+)
+@metrics.instrument
+@cache.memoize
+def update_time_aggregate(filter_data):
+    time_slice = slices.get(filter_data)
+    # One row per day, joined to its semester, month and week codes by day number
+    daily = time_slice['daily']
+    daily = dates.for_days(daily['Day']).join(daily, ['Semester', 'Month', 'Week'])
+
+    # Kept per day of week for the day selector
+    semesters = cube.regroup(daily, ['Semester', 'Day of Week'], ['Riders On'])
+    semesters['Semester'] = semesters['Semester'].map(dates.semester_label)
+    semesters['Day of Week'] = semesters['Day of Week'].cat.codes
+
+    months = cube.regroup(daily, ['Month'], ['Riders On'])
+    months['Month'] = months['Month'].map(dates.month_label)
+
+    # Start of the week (Monday), as a string for Plotly
+    weeks = cube.regroup(daily, ['Week'], ['Riders On'])
+    weeks['Week'] = weeks['Week'].map(dates.week_label)
+
+    # Riders On/Off per day of week and scheduled time, binned in the browser
+    by_time = time_slice['time']
+    by_time = by_time.assign(**{'Day of Week': by_time['Day of Week'].cat.codes})
+
+    return {
+        'days': encoding.DAYS_OF_WEEK,
+        'semester': _columns(semesters, {'label': 'Semester', 'day': 'Day of Week',
+                                         'on': 'Riders On', 'on_count': 'Riders On count'}),
+        'month': _columns(months, {'label': 'Month', 'on': 'Riders On', 'on_count': 'Riders On count'}),
+        'week': _columns(weeks, {'label': 'Week', 'on': 'Riders On', 'on_count': 'Riders On count'}),
+        'time': _columns(by_time, {'day': 'Day of Week', 'seconds': 'Scheduled Time',
+                                   'on': 'Riders On', 'off': 'Riders Off'}),
+        'detail': {'max_bars': detail.MAX_BARS, 'max_points': detail.MAX_POINTS},
+    }
+
+
+########## BY-SEMESTER VISUALIZATIONS + DROPDOWNS ##########
+clientside_callback(
+    ClientsideFunction(namespace='time_charts', function_name='semester'),
+    Output("semester-ridership-graph", "figure"),
+    [Input("time-aggregate-store", "data"),
+     Input("calc-method-dropdown", "value"),
+     Input("day-of-week-selector", "value")],
+    State("figure-template-store", "data")
+)
 
 
 ########## BY-MONTH VISUALIZATIONS + DROPDOWNS ##########
-@callback(
+clientside_callback(
+    ClientsideFunction(namespace='time_charts', function_name='monthly'),
     Output("monthly-ridership-graph", "figure"),
-    [Input("route-selector", "value"),
-     Input("date-slider", "start_date"),
-     Input("date-slider", "end_date"),
-     Input("calc-method-dropdown", "value")]
+    [Input("time-aggregate-store", "data"),
+     Input("calc-method-dropdown", "value")],
+    State("figure-template-store", "data")
 )
-def update_monthly_ridership_graph(selected_route, start_date, end_date, calc_method):
-    # Filter data for the selected route and date range
-    filtered_df = df.loc[
-        (df['Route'] == selected_route) & 
-        (df['Day'] >= start_date) & 
-        (df['Day'] <= end_date)
-    ].copy()
-
-    # Add two columns: one for Month-Year as datetime (for sorting) and one for text (for displaying)
-    filtered_df['Month'] = filtered_df['Day'].dt.to_period('M').dt.to_timestamp()
-    filtered_df['Month_Text'] = filtered_df['Day'].dt.strftime('%B %Y')
-
-    # Convert 'Riders On' to numeric and drop NaN values
-    filtered_df['Riders On'] = pd.to_numeric(filtered_df['Riders On'], errors='coerce')
-    filtered_df = filtered_df.dropna(subset=['Riders On'])
-
-    # Group data by Month
-    if calc_method == 'Average':
-        grouped = filtered_df.groupby('Month')['Riders On'].mean().reset_index()
-    else:
-        grouped = filtered_df.groupby('Month')['Riders On'].sum().reset_index()
-
-    # Add the text version of the Month-Year to the grouped DataFrame for display
-    grouped['Month_Text'] = grouped['Month'].dt.strftime('%B %Y')
-    grouped = grouped.sort_values(by='Month', ascending=True)
-
-    # Create bar graph
-    fig = px.bar(
-        grouped,
-        x="Month_Text",  # Display the text version of Month-Year
-        y="Riders On",
-        text="Riders On",
-        title="Ridership by Month",
-        labels={"Month_Text": "Month", "Riders On": "Riders On"}
-    )
-    fig.update_traces(textposition="auto")
-
-    # Sort by the datetime column for chronological order
-    fig.update_layout(
-        xaxis_tickangle=-45
-    )
-
-    return fig
 
 ########## BY-WEEK VISUALIZATIONS + DROPDOWNS ##########
-@callback(
-    Output("weekly-ridership-graph", "figure"),
-    [Input("route-selector", "value"),
-     Input("date-slider", "start_date"),
-     Input("date-slider", "end_date"),
-     Input("calc-method-dropdown", "value")]
+# Zooming in on a long range (a date axis) sets the window the chart is redrawn for;
+# new data resets it
+clientside_callback(
+    ClientsideFunction(namespace='time_charts', function_name='zoomWindow'),
+    Output("weekly-zoom-store", "data"),
+    [Input("weekly-ridership-graph", "relayoutData"),
+     Input("time-aggregate-store", "data")]
 )
-def update_weekly_ridership_graph(selected_route, start_date, end_date, calc_method):
-    # Filter data for the selected route and date range
-    filtered_df = df.loc[
-        (df['Route'] == selected_route) & 
-        (df['Day'] >= start_date) & 
-        (df['Day'] <= end_date)
-    ].copy()
-
-    # Add Week column (Start of the week)
-    filtered_df.loc[:, 'Week'] = filtered_df['Day'].dt.to_period('W').apply(lambda r: r.start_time)
-
-    # Ensure 'Riders On' is numeric and drop NaN values
-    filtered_df['Riders On'] = pd.to_numeric(filtered_df['Riders On'], errors='coerce')
-    filtered_df = filtered_df.dropna(subset=['Riders On']).copy()
-
-    # Group data by 'Week' and calculate based on 'calc_method'
-    if calc_method == 'Average':
-        grouped = filtered_df.groupby('Week', as_index=False)['Riders On'].mean()
-    else:
-        grouped = filtered_df.groupby('Week', as_index=False)['Riders On'].sum()
-
-    # Convert 'Week' column to string for Plotly
-    grouped['Week'] = grouped['Week'].astype(str)
-
-    # Check for empty data
-    if grouped.empty:
-        return px.bar(
-            title="No Data Available",
-            labels={"Week": "Week Starting", "Riders On": "Riders On"}
-        )
 
-    # Create bar graph
-    fig = px.bar(
-        grouped,
-        x="Week",
-        y="Riders On",
-        text="Riders On",
-        title="Ridership by Week",
-        labels={"Week": "Week Starting", "Riders On": "Riders On"}
-    )
-    fig.update_traces(textposition="auto")
-    return fig
+clientside_callback(
+    ClientsideFunction(namespace='time_charts', function_name='weekly'),
+    Output("weekly-ridership-graph", "figure"),
+    [Input("time-aggregate-store", "data"),
+     Input("calc-method-dropdown", "value"),
+     Input("weekly-zoom-store", "data")],
+    State("figure-template-store", "data")
+)
 
 
 ########## BY-DATE/DAY VISUALIZATIONS + DROPDOWNS HERE ##########
@@ -336,168 +291,172 @@ def update_weekly_ridership_graph(selected_route, start_date, end_date, calc_met
     Input("date-slider", "start_date"),
     Input("date-slider", "end_date")
 )
+@metrics.instrument
 def update_date_range_dropdown(start_date, end_date):
-    date_range = pd.date_range(start=start_date, end=end_date, freq="D")
-    week_ranges = []
+    first, last = encoding.to_day_number(start_date), encoding.to_day_number(end_date)
+    days = np.arange(first, last + 1)
 
-    # Split the date range into week-long intervals (Monday-Sunday)
-    current_week_start = date_range[0]
-    for date in date_range:
-        if date.weekday() == 0 and date != date_range[0]:  # Start a new week on Monday
-            week_ranges.append((current_week_start, date - pd.Timedelta(days=1)))
-            current_week_start = date
-    week_ranges.append((current_week_start, date_range[-1]))  # Last partial week
+    # Split the date range into week-long intervals (Monday-Sunday), the first and last partial
+    starts = days[(dates.get(first, last).codes('Weekday', days) == 0) | (days == first)]
+    ends = np.append(starts[1:] - 1, last)[:len(starts)]
+    starts, ends = encoding.to_dates(starts), encoding.to_dates(ends)
 
     # Format each week range for display in dropdown
     week_options = [
-        {'label': f"{start.strftime('%m/%d')} - {end.strftime('%m/%d')}", 'value': (start, end)}
-        for start, end in week_ranges
+        {'label': f"{start} - {end}", 'value': (start_day, end_day)}
+        for start, end, start_day, end_day in zip(starts.strftime('%m/%d'), ends.strftime('%m/%d'), starts, ends)
     ]
     return week_options
 
 #~~~~~~ Daily Ridership based on Selected Week Graph ~~~~~~~
+clientside_callback(
+    ClientsideFunction(namespace='time_charts', function_name='zoomWindow'),
+    Output("daily-zoom-store", "data"),
+    [Input("ridership-daily-by-week-graph", "relayoutData"),
+     Input("time-filter-store", "data"),
+     Input("date-range-dropdown", "value"),
+     Input("group-data-dropdown", "value")]
+)
+
+# Long ranges are drawn as WebGL lines with the peaks kept (utils/detail.py);
+# zooming in redraws the visible dates, as bars again once few enough are left
+def _date_axis(zoom_window):
+    return figures.axis("Date", type='date', **({'range': sorted(zoom_window)} if zoom_window else {}))
+
+def _lines(frame, x, y, color, labels):
+    """One downsampled WebGL line per value of ``color`` (colours as ``figures.grouped_bars``)."""
+    traces = []
+    for i, value in enumerate(frame[color].unique()):
+        rows = frame[(frame[color] == value).to_numpy()]
+        keep = detail.peak_indices(rows[y])
+        traces.append(figures.line_gl(rows[x].iloc[keep], rows[y].iloc[keep], labels[x], labels[y],
+                                      color=figures.COLORS[i % len(figures.COLORS)], name=str(value)))
+    return traces
+
 @callback(
     Output("ridership-daily-by-week-graph", "figure"),
-    [Input("route-selector", "value"),
-     Input("date-slider", "start_date"),
-     Input("date-slider", "end_date"),
+    [Input("time-filter-store", "data"),
      Input("date-range-dropdown", "value"),
-     Input("group-data-dropdown", "value")]
+     Input("group-data-dropdown", "value"),
+     Input("daily-zoom-store", "data")]
 )
-def update_ridership_daily_by_week_graph(selected_route, start_date, end_date, selected_week_range, group_data):
+@metrics.instrument
+@cache.memoize
+def update_ridership_daily_by_week_graph(filter_data, selected_week_range, group_data, zoom_window):
+    selected_route = filter_data['route']
+    start_date, end_date = filter_data['start_date'], filter_data['end_date']
+    window = detail.day_window(zoom_window)
+
     if group_data == 'By Week':
         if selected_week_range:
             start_date, end_date = selected_week_range  # Override with the selected week range
 
-        # Filter data within the selected route and date range
-        filtered_df = df[(df['Day'] >= start_date) & 
-                         (df['Day'] <= end_date)]
-
-        # Group by Day and Route, calculate daily sum of 'Riders On'
-        daily_ridership = filtered_df.groupby(['Day', 'Route'])['Riders On'].sum().reset_index()
-        daily_ridership['Day'] = pd.to_datetime(daily_ridership['Day'])  # Ensure 'Day' is datetime type
+        # Daily sum of 'Riders On' per route within the selected date range
+        daily_ridership = backend.get().ridership(['Day', 'Route'], start_date=start_date, end_date=end_date,
+                                                  measures=['Riders On'])
+        if window:
+            daily_ridership = daily_ridership[daily_ridership['Day'].between(*window)]  # Zoomed-in dates only
+        daily_ridership = encoding.labeled(daily_ridership)  # Day numbers to dates, routes to plain labels
         daily_ridership = daily_ridership.sort_values('Day')  # Sort by date
-        daily_ridership['Day'] = daily_ridership['Day'].dt.strftime('%m/%d')  # Format dates as mm/dd for display
-
-        # Create stacked bar chart
-        fig = px.bar(
-            daily_ridership,
-            x="Day",
-            y="Riders On",
-            color="Route",
-            title="Daily Ridership by Route within Selected Week Range",
-            labels={"Day": "Date", 
-                    "Riders On": "Total Riders On"},
-            category_orders={"Day": sorted(daily_ridership['Day'].unique())},  # Sort x-axis by date order
-            text="Riders On"  # Add text for each segment
+        labels = {"Day": "Date", "Riders On": "Total Riders On"}
+        title = "Daily Ridership by Route within Selected Week Range"
+
+        if not detail.is_detailed(daily_ridership['Day'].nunique()):
+            daily_ridership['Day'] = daily_ridership['Day'].dt.strftime('%Y-%m-%d')
+            fig = figures.figure(_lines(daily_ridership, "Day", "Riders On", "Route", labels), title, font=True,
+                                 legend={'title': {'text': "Route"}, 'tracegroupgap': 0},
+                                 xaxis=_date_axis(zoom_window), yaxis=figures.axis("Total Riders On"))
+            return fig
+
+        if window:
+            daily_ridership['Day'] = daily_ridership['Day'].dt.strftime('%Y-%m-%d')  # On the zoomed date axis
+            xaxis = _date_axis(zoom_window)
+        else:
+            daily_ridership['Day'] = daily_ridership['Day'].dt.strftime('%m/%d')  # Format dates as mm/dd for display
+            xaxis = figures.axis("Date", categoryorder='array',
+                                 categoryarray=sorted(daily_ridership['Day'].unique()))  # Sort x-axis by date order
+
+        # Create stacked bar chart, one trace per route with text for each segment
+        traces = figures.grouped_bars(daily_ridership, "Day", "Riders On", "Route", labels=labels, text="Riders On")
+        fig = figures.figure(
+            traces,
+            title,
+            font=True,
+            barmode='relative',
+            legend={'title': {'text': "Route"}, 'tracegroupgap': 0},
+            xaxis=xaxis,
+            yaxis=figures.axis("Total Riders On")
         )
-        fig.update_layout(
-            xaxis_title="Date",
-            yaxis_title="Total Riders On",
-            font=dict(family="Segoe UI", size=12, color="black")
-        )
-        fig.update_traces(textposition='auto')
 
     elif group_data == 'Entire Dates':
-        # Filter data for the selected route and date range
-        filtered_df = df[(df['Route'] == selected_route) & 
-                         (df['Day'] >= start_date) & 
-                         (df['Day'] <= end_date)]
-
-        # Group by Day, calculate the total sum of 'Riders On'
-        daily_totals = filtered_df.groupby('Day')['Riders On'].sum().reset_index()
-        daily_totals['Day'] = pd.to_datetime(daily_totals['Day'])  # Ensure 'Day' is datetime type
+        # Total sum of 'Riders On' per day for the selected route and date range
+        daily_totals = slices.get(filter_data)['daily'][['Day', 'Riders On']]
+        if window:
+            daily_totals = daily_totals[daily_totals['Day'].between(*window)]  # Zoomed-in dates only
+        daily_totals = encoding.labeled(daily_totals)  # Day numbers to dates
         daily_totals = daily_totals.sort_values('Day')  # Sort by date
-        daily_totals['Day'] = daily_totals['Day'].dt.strftime('%m/%d')  # Format dates as mm/dd for display
+        title = f"Total Riders On for Route {selected_route}"
+
+        if not detail.is_detailed(len(daily_totals)):
+            keep = detail.peak_indices(daily_totals['Riders On'])
+            line = figures.line_gl(daily_totals['Day'].dt.strftime('%Y-%m-%d').iloc[keep],
+                                   daily_totals['Riders On'].iloc[keep], "Date", "Total Riders On")
+            return figures.figure([line], title, font=True, xaxis=_date_axis(zoom_window),
+                                  yaxis=figures.axis("Total Riders On"))
+
+        if window:
+            daily_totals['Day'] = daily_totals['Day'].dt.strftime('%Y-%m-%d')  # On the zoomed date axis
+            xaxis = _date_axis(zoom_window)
+        else:
+            daily_totals['Day'] = daily_totals['Day'].dt.strftime('%m/%d')  # Format dates as mm/dd for display
+            xaxis = figures.axis("Date", categoryorder='array',
+                                 categoryarray=sorted(daily_totals['Day'].unique()))  # Sort x-axis by date order
 
         # Create bar chart
-        fig = px.bar(
-            daily_totals,
-            x="Day",
-            y="Riders On",
-            title=f"Total Riders On for Route {selected_route}",
-            labels={"Day": "Date", 
-                    "Riders On": "Total Riders On"},
-            category_orders={"Day": sorted(daily_totals['Day'].unique())}  # Sort x-axis by date order
-        )
-        fig.update_layout(
-            xaxis_title="Date",
-            yaxis_title="Total Riders On",
-            font=dict(family="Segoe UI", size=12, color="black")
+        bar = figures.labeled_bar(daily_totals['Day'], daily_totals['Riders On'], "Date", "Total Riders On",
+                                  text=daily_totals['Riders On'])
+        fig = figures.figure(
+            [bar],
+            title,
+            font=True,
+            xaxis=xaxis,
+            yaxis=figures.axis("Total Riders On")
         )
-        fig.update_traces(text=daily_totals['Riders On'], textposition='auto')
 
     return fig
 
+#~~~~~~ Download links for the selected route, dates, day and calculation ~~~~~~~
+@callback(
+    [Output("daily-csv-link", "href"),
+     Output("daily-parquet-link", "href"),
+     Output("time-events-csv-link", "href"),
+     Output("time-events-parquet-link", "href")],
+    [Input("time-filter-store", "data"),
+     Input("day-of-week-selector", "value"),
+     Input("calc-method-dropdown", "value")]
+)
+@metrics.instrument
+def update_time_export_links(filter_data, selected_day, calc_method):
+    filters = dict(route=filter_data['route'], start_date=filter_data['start_date'],
+                   end_date=filter_data['end_date'], day=selected_day)
+    return [export.url('aggregations/day', 'csv', calc=calc_method, **filters),
+            export.url('aggregations/day', 'parquet', calc=calc_method, **filters),
+            export.url('events', 'csv', **filters),
+            export.url('events', 'parquet', **filters)]
+
 ##########---------------end-by-date-day-section----------------##########
 
 ########## BY-TIME VISUALIZATIONS + DROPDOWNS HERE ##########
 ###*** Ridership in 30 Minute Increments Graph ***###
-@callback(
+# Binned in the browser (nearest block start, as utils/binning.py)
+clientside_callback(
+    ClientsideFunction(namespace='time_charts', function_name='timeOfDay'),
     Output("ridership-30min-time-graph", "figure"),
-    [Input('route-selector', 'value'),
-     Input('date-slider', 'start_date'),
-     Input('date-slider', 'end_date'),
-     Input('day-of-week-selector', 'value')]
+    [Input('time-aggregate-store', 'data'),
+     Input('day-of-week-selector', 'value'),
+     Input('time-bin-width-dropdown', 'value')],
+    State("figure-template-store", "data")
 )
-def update_ridership_30min_time_graph(selected_route, start_date, end_date, selected_day):
-    # Copy the dataframe and apply the filters
-    filtered_df = df[(df['Route'] == selected_route) & 
-                     (df['Day'] >= start_date) & 
-                     (df['Day'] <= end_date)]
-    
-    if isinstance(selected_day, list):  # Check if selected_day is a list (for 'Weekend')
-        filtered_df = filtered_df[filtered_df['Day of Week'].isin(selected_day)]
-    elif selected_day != 'Everyday':  # Handle individual days
-        filtered_df = filtered_df[filtered_df['Day of Week'] == selected_day]
-
-    # Generate 30-minute time blocks from 00:00 to 23:59
-    time_blocks = pd.date_range("00:00", "23:59", freq="30T").time
-    time_df = pd.DataFrame(time_blocks, columns=["Time"])
-    time_df["Riders On"] = 0
-    time_df["Riders Off"] = 0
-
-    # Populate time_df by summing Riders On and Off for each 30-minute block
-    for _, row in filtered_df.iterrows():
-        # Find the 30-minute block to place this row in
-        time = row['Scheduled Time']
-        block_time = min(time_blocks, key=lambda t: abs(pd.Timestamp.combine(pd.Timestamp.min, time) - pd.Timestamp.combine(pd.Timestamp.min, t)))
-        idx = time_df[time_df["Time"] == block_time].index[0]
-        
-        # Accumulate the values
-        time_df.at[idx, "Riders On"] += row["Riders On"]
-        time_df.at[idx, "Riders Off"] += row["Riders Off"]
-
-    # Filter out rows where both Riders On and Riders Off are zero
-    time_df = time_df[(time_df["Riders On"] > 0) | (time_df["Riders Off"] > 0)]
-
-    # Create the stacked bar chart
-    fig = go.Figure(data=[
-        go.Bar(
-            x=time_df["Time"],
-            y=time_df["Riders On"],
-            name="Riders On",
-            text=time_df["Riders On"], 
-            textposition='auto'
-        ),
-        go.Bar(
-            x=time_df["Time"],
-            y=time_df["Riders Off"],
-            name="Riders Off",
-            text=time_df["Riders Off"], 
-            textposition='auto'
-        )
-    ])
-
-    fig.update_layout(
-        barmode="stack",
-        title="Overall Ridership for all Stops by Time (30-Minute Intervals)",
-        xaxis_title="Time of Day",
-        yaxis_title="Total Riders On/Off",
-        font=dict(family="Segoe UI", size=12, color="black")
-    )
-    
-    return fig
 
 ###*** Specific Stop Ridership by Time Graph + Dropdown ***###
 #~~~~~~ Stop Single Select Dropdown ~~~~~~~
@@ -505,63 +464,45 @@ def update_ridership_30min_time_graph(selected_route, start_date, end_date, sele
     Output("stop-single-select-dropdown", "options"),
     Input("route-selector", "value")
 )
+@metrics.instrument
 def update_stop_options(selected_route):
     if selected_route is None:
         return []
     
-    stop_options = [{'label': stop, 'value': stop} for stop in df[df['Route'] == selected_route]['Stop'].unique()]
+    stops = backend.get().stops(selected_route)
+    stop_options = [{'label': stop, 'value': stop} for stop in stops]
     return stop_options
 
 #~~~~~~ Specific Stop Ridership by Scheduled Time ~~~~~~
+# Sums/counts of the selected stop per day of week and scheduled time; the day
+# of week and calculation method are applied in the browser
 @callback(
-    Output("stop-scheduled-time-graph", "figure"),
+    Output("stop-time-aggregate-store", "data"),
     [Input("stop-single-select-dropdown", "value"),
-     Input("route-selector", "value"),
-     Input("date-slider", "start_date"),
-     Input("date-slider", "end_date"),
+     Input("time-filter-store", "data")]
+)
+@metrics.instrument
+@cache.memoize
+def update_stop_time_aggregate(selected_stop, filter_data):
+    stop_time = slices.get(filter_data)['stop_time']
+    stop_time = stop_time[stop_time['Stop'] == selected_stop]
+    stop_time = stop_time.assign(**{'Day of Week': stop_time['Day of Week'].cat.codes})
+    return {
+        'stop': selected_stop,
+        'route': filter_data['route'],
+        'days': encoding.DAYS_OF_WEEK,
+        'time': _columns(stop_time, {'day': 'Day of Week', 'seconds': 'Scheduled Time',
+                                     'on': 'Riders On', 'on_count': 'Riders On count',
+                                     'off': 'Riders Off', 'off_count': 'Riders Off count'}),
+    }
+
+clientside_callback(
+    ClientsideFunction(namespace='time_charts', function_name='stopTime'),
+    Output("stop-scheduled-time-graph", "figure"),
+    [Input("stop-time-aggregate-store", "data"),
      Input("day-of-week-selector", "value"),
-     Input("calc-method-dropdown", "value")]
+     Input("calc-method-dropdown", "value")],
+    State("figure-template-store", "data")
 )
-def update_stop_scheduled_time_graph(selected_stop, selected_route, start_date, end_date, selected_day, calc_method):
-    filtered_data = df[(df['Stop'] == selected_stop) & 
-                       (df['Route'] == selected_route) &
-                       (df['Day'] >= start_date) & 
-                       (df['Day'] <= end_date)]
-    
-    if selected_day != 'Everyday':
-        filtered_data = filtered_data[filtered_data['Day of Week'] == selected_day]
-
-    if calc_method == 'Average':
-        rider_data = filtered_data.groupby('Scheduled Time')[['Riders On', 'Riders Off']].mean().reset_index()
-    else:
-        rider_data = filtered_data.groupby('Scheduled Time')[['Riders On', 'Riders Off']].sum().reset_index()
-    
-    rider_data['Riders On'] = rider_data['Riders On'].round(2)
-    rider_data['Riders Off'] = rider_data['Riders Off'].round(2)
-
-    fig = go.Figure(data=[
-        go.Bar(
-            x=rider_data['Scheduled Time'],
-            y=rider_data['Riders On'],
-            name='Riders On',
-            text=rider_data['Riders On'],
-            textposition='auto'
-        ),
-        go.Bar(
-            x=rider_data['Scheduled Time'],
-            y=rider_data['Riders Off'],
-            name='Riders Off',
-            text=rider_data['Riders Off'],
-            textposition='auto'
-        )
-    ])
-    
-    fig.update_layout(barmode='stack',
-                      title=f"{calc_method} Riders On/Off for Stop: {selected_stop}, Route: {selected_route}",
-                      xaxis_title="Scheduled Time",
-                      yaxis_title=f"{calc_method} Riders On/Off",
-                      font=dict(family='Segoe UI', size=12, color='black'))
-    
-    return fig
 
 ##########---------------end-by-time-section----------------##########
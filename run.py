@@ -1,7 +1,38 @@
 # IMPORTS
+import argparse
+import logging
+import os
+
 import dash
 from dash import Dash, html, dcc
-import plotly.express as px
+import flask
+
+from utils import api, backend, cache, export, metrics, refresh, serve, warmup
+
+# Log dataset load time / memory footprint (see utils/dataset.py)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+
+# Callback result cache (utils/cache.py). Set KEEP_RESULTS_ON_DISK to also keep
+# results in RESULTS_CACHE_DIR across restarts.
+KEEP_RESULTS_ON_DISK = False
+RESULTS_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'results_cache')
+cache.configure(max_entries=512, disk_dir=RESULTS_CACHE_DIR if KEEP_RESULTS_ON_DISK else None)
+
+# Per-callback metrics on /metrics (utils/metrics.py). Uncomment to also record
+# each callback's peak memory allocation (makes callbacks several times slower).
+# metrics.configure(trace_memory=True)
+
+# Worker processes (utils/serve.py), sharing one copy of the dataset. 1 runs the
+# Flask development server; override with `python run.py --workers 4`.
+WORKERS = 1
+
+# Where the pages' queries run (utils/backend.py): 'pandas' over the data loaded
+# in memory, or 'duckdb' over the Parquet cache (run `python -m utils.ingest`
+# first). Override with `python run.py --backend duckdb`.
+BACKEND = 'pandas'
+
+# Seconds spent pre-computing the common charts at startup (utils/warmup.py), 0 to skip
+WARM_UP_SECONDS = 60
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 app = Dash(__name__, use_pages=True, external_stylesheets=external_stylesheets)
@@ -37,5 +68,53 @@ app.layout = html.Div([
     dash.page_container
 ])
 
+# JSON API over the aggregations, for scripts: /api/v1/aggregations, /api/v1/batch (utils/api.py)
+app.server.register_blueprint(api.blueprint)
+# CSV/Parquet downloads of the filtered stop events and aggregations, streamed (utils/export.py)
+app.server.register_blueprint(export.blueprint)
+
+# Hit/miss/eviction counts of the result cache, for sizing it
+@app.server.route('/cache/stats')
+def cache_stats():
+    return flask.jsonify(dict(cache.stats(), warm_up=warmup.last_report))
+
+# Callback latency / rows scanned / payload size histograms, in the Prometheus format
+@app.server.route('/metrics')
+def metrics_endpoint():
+    return flask.Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# /metrics/profile/<callback>?calls=20 profiles the next 20 calls of a callback,
+# /metrics/profile/<callback> shows what has been captured so far
+@app.server.route('/metrics/profile/<callback>')
+def profile_endpoint(callback):
+    if callback not in metrics.callbacks():
+        return flask.Response(f"Unknown callback. Callbacks: {', '.join(metrics.callbacks())}\n",
+                              status=404, mimetype='text/plain')
+    if 'calls' in flask.request.args:
+        try:
+            calls = metrics.profile(callback, int(flask.request.args['calls']))
+        except ValueError:
+            return flask.Response(f"calls must be a whole number from 1 to {metrics.MAX_PROFILE_CALLS}\n",
+                                  status=400, mimetype='text/plain')
+        return flask.Response(f"Profiling the next {calls} calls of {callback}\n", mimetype='text/plain')
+    report = metrics.profile_report(callback)
+    return flask.Response(report or f"No profile of {callback} captured yet\n", mimetype='text/plain')
+
 if __name__ == '__main__':
-    app.run(debug=False,port=8040)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the ridership dashboard.")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="worker processes (1: development server)")
+    parser.add_argument('--port', type=int, default=8040)
+    parser.add_argument('--backend', choices=backend.BACKENDS, default=BACKEND, help="where queries run")
+    args = parser.parse_args()
+
+    backend.configure(args.backend)
+
+    if WARM_UP_SECONDS:
+        warmup.warm(WARM_UP_SECONDS)
+    if args.workers > 1:
+        # Workers share one copy of the data; new exports are picked up too (utils/serve.py)
+        serve.run(app.server, port=args.port, workers=args.workers)
+    else:
+        # Pick up new/grown exports in data/ while running (utils/refresh.py)
+        refresh.start()
+        app.run(debug=False,port=args.port)
\ No newline at end of file
@@ -0,0 +1 @@
+# Utility modules for loading, cleaning and processing ridership data.
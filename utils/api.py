@@ -0,0 +1,258 @@
+"""Versioned JSON API over the ridership aggregations (``/api/v1``).
+
+The aggregations behind the Time and Stops charts, as data rather than
+figures, for scripts:
+
+    GET  /api/v1/aggregations
+    GET  /api/v1/aggregations/month?route=Waltham%20Shuttle&start_date=2024-01-01&calc=Average
+    POST /api/v1/batch    {"queries": [{"aggregation": "month", "route": "Waltham Shuttle"}, ...]}
+
+Query parameters, all optional (``DEFAULTS``):
+
+- ``route``: one route (default: every route)
+- ``start_date`` / ``end_date``: ``YYYY-MM-DD``, inclusive (default: all the data)
+- ``day``: a day of the week, ``Weekend`` or ``Everyday``
+- ``calc``: ``Sum`` or ``Average`` (riders per stop event, as the charts)
+- ``interval``: minutes per block of the ``time`` aggregation (``binning.BIN_WIDTHS``)
+- ``measure`` and ``n``: what ``top_stops`` / ``bottom_stops`` rank by, and how many
+
+Queries read the same shared slices as the pages (``utils/slices.py``). A
+batch fetches each distinct route and date range once and answers every query
+on it from that; a query that is invalid gets an ``error`` in its place.
+"""
+import flask
+import pandas as pd
+
+from utils import backend, binning, cache, cube, dates, encoding, metrics, prefix, slices
+from utils.index import day_mask
+
+MAX_BATCH_QUERIES = 200
+
+DEFAULTS = {
+    'route': None,
+    'start_date': None,
+    'end_date': None,
+    'day': 'Everyday',
+    'calc': 'Sum',
+    'interval': binning.DEFAULT_BIN_WIDTH,
+    'measure': 'Riders On',
+    'n': 10,
+}
+CALC_METHODS = ['Sum', 'Average']
+WEEKEND = ['Saturday', 'Sunday']
+
+
+class QueryError(ValueError):
+    """A query the API can't answer (status 400)."""
+
+
+################### AGGREGATIONS ###################
+# Each takes the slice of the query's route and date range and the parsed query
+def _days(rows, query):
+    return rows[day_mask(rows['Day of Week'], query['day']).to_numpy()]
+
+
+def _by_period(column, label):
+    """Riders On per semester / month / week, from one row per day joined to the calendar."""
+    def aggregate(time_slice, query):
+        daily = _days(time_slice['daily'], query)
+        daily = dates.for_days(daily['Day']).join(daily, [column])
+        grouped = cube.finish(cube.regroup(daily, [column], ['Riders On']), query['calc'], ['Riders On'])
+        grouped[column] = grouped[column].map(label)
+        return grouped
+    return aggregate
+
+
+def by_day(time_slice, query):
+    daily = _days(time_slice['daily'], query)
+    grouped = cube.finish(cube.regroup(daily, ['Day'], ['Riders On']), query['calc'], ['Riders On'])
+    grouped['Day'] = encoding.to_dates(grouped['Day']).strftime('%Y-%m-%d')
+    return grouped.rename(columns={'Day': 'Date'})
+
+
+def by_time(time_slice, query):
+    """Riders On/Off per block of ``interval`` minutes (every block of the day)."""
+    rows = _days(time_slice['time'], query)
+    columns = cube.MEASURES + [cube.count_column(m) for m in cube.MEASURES]
+    totals = binning.bin_totals(rows['Scheduled Time'], query['interval'], {c: rows[c] for c in columns})
+    totals['Time'] = [block.strftime('%H:%M:%S') for block in totals['Time']]
+    return cube.finish(totals, query['calc'])
+
+
+def by_stop(stops_slice, query):
+    rows = _days(stops_slice['stop_dow'], query)
+    return encoding.labeled(cube.finish(cube.regroup(rows, ['Stop']), query['calc']))
+
+
+def top_stops(stops_slice, query):
+    stops = by_stop(stops_slice, query)
+    return stops.iloc[prefix.top_k(stops[query['measure']], query['n'])]
+
+
+def bottom_stops(stops_slice, query):
+    stops = by_stop(stops_slice, query)
+    return stops.iloc[prefix.top_k(stops[query['measure']], query['n'], largest=False)]
+
+
+# name -> (slice it reads, function)
+AGGREGATIONS = {
+    'semester': ('ridership_time', _by_period('Semester', dates.semester_label)),
+    'month': ('ridership_time', _by_period('Month', dates.month_label)),
+    'week': ('ridership_time', _by_period('Week', dates.week_label)),
+    'day': ('ridership_time', by_day),
+    'time': ('ridership_time', by_time),
+    'stops': ('ridership_stops', by_stop),
+    'top_stops': ('ridership_stops', top_stops),
+    'bottom_stops': ('ridership_stops', bottom_stops),
+}
+
+
+################### QUERIES ###################
+def _date(value, name):
+    try:
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise QueryError(f"{name} is not a date: {value!r}")
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise QueryError(f"{name} is not a whole number: {value!r}")
+
+
+def parse(params):
+    """The complete query for ``params`` (strings from a URL, or JSON values), checked."""
+    unknown = sorted(set(params) - set(DEFAULTS))
+    if unknown:
+        raise QueryError(f"Unknown parameters: {', '.join(unknown)}")
+    query = dict(DEFAULTS, **{k: v for k, v in params.items() if v is not None})
+
+    data = backend.get()
+    if query['route'] is not None and query['route'] not in data.routes():
+        raise QueryError(f"Unknown route: {query['route']!r}")
+    # Missing dates become the data's own, so the slices match the pages' default view
+    first, last = data.day_range()
+    query['start_date'] = _date(query['start_date'] or encoding.to_date(first), 'start_date')
+    query['end_date'] = _date(query['end_date'] or encoding.to_date(last), 'end_date')
+
+    if query['day'] == 'Weekend':
+        query['day'] = WEEKEND
+    days_asked = query['day'] if isinstance(query['day'], list) else [query['day']]
+    if query['day'] != 'Everyday' and not set(days_asked) <= set(encoding.DAYS_OF_WEEK):
+        raise QueryError(f"day must be a day of the week, Weekend or Everyday, not {query['day']!r}")
+    if query['calc'] not in CALC_METHODS:
+        raise QueryError(f"calc must be one of {', '.join(CALC_METHODS)}")
+    query['interval'] = _int(query['interval'], 'interval')
+    if query['interval'] not in binning.BIN_WIDTHS:
+        raise QueryError(f"interval must be one of {', '.join(map(str, binning.BIN_WIDTHS))} minutes")
+    if query['measure'] not in cube.MEASURES:
+        raise QueryError(f"measure must be one of {', '.join(cube.MEASURES)}")
+    query['n'] = _int(query['n'], 'n')
+    if query['n'] < 1:
+        raise QueryError("n must be at least 1")
+    return query
+
+
+def _slice_payload(name, query):
+    return slices.payload(AGGREGATIONS[name][0], route=query['route'],
+                          start_date=query['start_date'], end_date=query['end_date'])
+
+
+def _records(frame):
+    # NaN (an Average over no stop events) is not valid JSON
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def _answer(name, query, table):
+    return {'aggregation': name, 'query': query, 'data': _records(AGGREGATIONS[name][1](table, query))}
+
+
+def aggregate(name, query):
+    """Aggregation ``name`` for a query returned by ``parse``, as a frame."""
+    return AGGREGATIONS[name][1](slices.get(_slice_payload(name, query)), query)
+
+
+@metrics.instrument
+@cache.memoize
+def run_query(name, query):
+    """Aggregation ``name`` for a query returned by ``parse``, as the JSON the API returns."""
+    return {'aggregation': name, 'query': query, 'data': _records(aggregate(name, query))}
+
+
+@metrics.instrument
+def run_batch(queries):
+    """Answer each ``(name, query)`` in ``queries`` (or pass on its ``QueryError``).
+
+    Every distinct route and date range is fetched once for the whole batch,
+    however many queries share it.
+    """
+    tables = {}
+    results = []
+    for item in queries:
+        if isinstance(item, QueryError):
+            results.append({'error': str(item)})
+            continue
+        name, query = item
+        payload = _slice_payload(name, query)
+        key = cache.normalize(payload)
+        if key not in tables:
+            tables[key] = slices.get(payload)
+        results.append(_answer(name, query, tables[key]))
+    return results
+
+
+################### ENDPOINTS ###################
+blueprint = flask.Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def error(message, status=400):
+    return flask.jsonify(error=message), status
+
+
+def _parse_item(item):
+    if not isinstance(item, dict):
+        return QueryError("Each query must be an object")
+    params = dict(item)
+    name = params.pop('aggregation', None)
+    if name not in AGGREGATIONS:
+        return QueryError(f"Unknown aggregation: {name!r}")
+    try:
+        return name, parse(params)
+    except QueryError as e:
+        return e
+
+
+@blueprint.route('/aggregations')
+def aggregations_endpoint():
+    data = backend.get()
+    first, last = data.day_range()
+    return flask.jsonify(
+        aggregations=list(AGGREGATIONS),
+        parameters=DEFAULTS,
+        routes=list(data.routes()),
+        first_date=encoding.to_date(first).strftime('%Y-%m-%d'),
+        last_date=encoding.to_date(last).strftime('%Y-%m-%d'),
+    )
+
+
+@blueprint.route('/aggregations/<name>')
+def aggregation_endpoint(name):
+    if name not in AGGREGATIONS:
+        return error(f"Unknown aggregation: {name!r}. Aggregations: {', '.join(AGGREGATIONS)}", 404)
+    try:
+        query = parse(flask.request.args.to_dict())
+    except QueryError as e:
+        return error(str(e))
+    return flask.jsonify(run_query(name, query))
+
+
+@blueprint.route('/batch', methods=['POST'])
+def batch_endpoint():
+    body = flask.request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('queries'), list):
+        return error('Expected a JSON body like {"queries": [{"aggregation": "month", ...}, ...]}')
+    if len(body['queries']) > MAX_BATCH_QUERIES:
+        return error(f"At most {MAX_BATCH_QUERIES} queries per batch")
+    return flask.jsonify(results=run_batch([_parse_item(item) for item in body['queries']]))
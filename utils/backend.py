@@ -0,0 +1,341 @@
+"""Query backends: where the pages' filters and group-bys run.
+
+Every page reads the data through ``get()``, which answers a few kinds of
+query (``ridership``, ``capacity``, ``events``, plus the routes, stops and
+dates the filters offer). Two backends implement them and return the same
+frames:
+
+- ``PandasBackend`` (default) answers from the in-memory snapshot
+  (``utils/dataset.py``): the ridership cube, the capacity bins and the
+  indexed frame.
+- ``DuckDBBackend`` runs SQL over the Parquet cache written by
+  ``python -m utils.ingest``, with DuckDB (``pip install duckdb``). The
+  route, date and day filters and the group-by are pushed down to the scan:
+  only the partitions and row groups of the selected route and semesters are
+  read, and only the columns the query uses. Nothing is loaded up front, so
+  the history served isn't limited by the host's memory.
+
+``configure`` picks the backend once at startup (``BACKEND`` in ``run.py``).
+Results are keyed by ``version()``, which both backends take from the files
+behind them, so new data drops stale cached results either way.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils import capacity, cube, dataset, encoding, ingest
+from utils.index import day_mask
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ['pandas', 'duckdb']
+
+_backend = None  # DuckDBBackend once configured; the pandas one is per snapshot
+
+
+################### PANDAS ###################
+class PandasBackend:
+    """Queries over one in-memory snapshot (``dataset.current()``)."""
+
+    in_memory = True
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def version(self):
+        return self.snapshot.version
+
+    def prepare(self):
+        """Build the cube and capacity bins now rather than on the first query."""
+        self.snapshot.cube
+        self.snapshot.capacity
+
+    def routes(self):
+        return self.snapshot.index.routes
+
+    def day_range(self):
+        days = self.snapshot.df['Day']
+        return int(days.min()), int(days.max())
+
+    def stops(self, route):
+        return sorted(self.snapshot.index.slice(route)['Stop'].dropna().unique())
+
+    def ridership(self, by, route=None, start_date=None, end_date=None, selected_day=None,
+                  stops=None, measures=cube.MEASURES):
+        """Riders On/Off sums and counts grouped by ``by`` (``RidershipCube.query``)."""
+        return self.snapshot.cube.query(by, route, start_date, end_date, selected_day, stops, measures)
+
+    def stop_totals(self, route=None, start_date=None, end_date=None, selected_day=None):
+        """``ridership(['Stop', 'Day of Week'], ...)`` from running totals (``utils/prefix.py``)."""
+        return self.snapshot.cube.stop_totals(route, start_date, end_date, selected_day)
+
+    def capacity(self, name, by, route=None, start_date=None, end_date=None, selected_day=None):
+        """Capacity table ``name`` summed to ``by`` (``CapacityCube.query``)."""
+        return self.snapshot.capacity.query(name, by, route, start_date, end_date, selected_day)
+
+    def events(self, columns, route=None, start_date=None, end_date=None):
+        """``columns`` of the stop events of a route and date range."""
+        return self.snapshot.index.slice(route, start_date, end_date)[columns]
+
+    def event_batches(self, route=None, start_date=None, end_date=None, selected_day=None,
+                      batch_rows=dataset.CHUNK_ROWS):
+        """Every column of the matching stop events, route by route, ``batch_rows`` at a time.
+
+        Yields at least one (possibly empty) frame, so the columns are known.
+        """
+        index = self.snapshot.index
+        yielded = False
+        for name in ([route] if route is not None else index.routes):
+            lo, hi = index.bounds(name, start_date, end_date)
+            for start in range(lo, hi, batch_rows):
+                rows = index.frame.iloc[start:min(start + batch_rows, hi)]
+                yielded = True
+                yield rows[day_mask(rows['Day of Week'], selected_day).to_numpy()]
+        if not yielded:
+            yield index.frame.iloc[0:0]
+
+
+################### DUCKDB ###################
+# Day of week from the day number (0 is Monday; 1970-01-01 was a Thursday)
+WEEKDAY_SQL = '(("Day" % 7) + 10) % 7'
+# As capacity.load_buckets: -1 without a capacity, clipped to the overflow bucket
+LOAD_PERCENT_SQL = ('CASE WHEN "Vehicle Capacity" > 0 AND NOT isnan("Vehicle Capacity") '
+                    'THEN CAST("Riders Cumulative" AS DOUBLE) / CAST("Vehicle Capacity" AS DOUBLE) * 100 END')
+LOAD_BUCKET_SQL = (f'CAST(coalesce(least(greatest(ceil(roundbankers({LOAD_PERCENT_SQL}, 6) / '
+                   f'{capacity.BUCKET_PERCENT}), -1), {capacity.OVERFLOW_BUCKET}), -1) AS SMALLINT)')
+
+# Column -> SQL expression and the dtype it comes back as
+KEYS = {
+    'Route': ('"Route"', 'category'),
+    'Stop': ('"Stop"', 'category'),
+    'Day': ('"Day"', np.int32),
+    'Day of Week': (WEEKDAY_SQL, encoding.DAY_OF_WEEK_DTYPE),
+    'Scheduled Time': ('"Scheduled Time"', np.int32),
+    'Hour': ('CAST(floor("Scheduled Time" / 3600) AS TINYINT)', np.int8),
+    'Load Bucket': (LOAD_BUCKET_SQL, np.int16),
+}
+CAPACITY_MEASURES = {
+    'Stop Events': 'count(*)',
+    'Riders Left': 'CAST(coalesce(sum("Riders Left"), 0) AS BIGINT)',
+    'Denied Events': 'CAST(count_if("Riders Left" > 0) AS BIGINT)',
+}
+# Stop event columns as the cleaned frame has them ('Day of Week' is added from Day)
+EVENT_COLUMNS = ['Route', 'Day', 'Ride Start', 'Stop', 'Scheduled Time', 'Day Of Week', 'Vehicle Capacity',
+                 'Ride State', 'Stop State', 'Actual Arrival', 'Actual Departure', 'Riders On', 'Riders Off',
+                 'Riders Left', 'Riders Cumulative', 'Lateness', 'Dwell']
+
+
+def _quoted(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _select(column):
+    """SQL for ``column`` of the stop events."""
+    return WEEKDAY_SQL if column == 'Day of Week' else _quoted(column)
+
+
+def _typed(frame, columns):
+    """Result columns back to the dtypes the pandas backend gives them."""
+    for column in columns:
+        if column not in KEYS or column not in frame:
+            continue
+        dtype = KEYS[column][1]
+        if dtype is encoding.DAY_OF_WEEK_DTYPE:
+            codes = frame[column].to_numpy(dtype=np.int64)
+            frame[column] = pd.Categorical.from_codes(codes, dtype=dtype)
+        elif dtype == 'category':
+            # Categories sorted, as dataset.compact sorts them
+            frame[column] = pd.Categorical(frame[column], categories=sorted(frame[column].dropna().unique()))
+        else:
+            frame[column] = frame[column].astype(dtype)
+    return frame
+
+
+class DuckDBBackend:
+    """Queries run by DuckDB over the Parquet cache in ``cache_dir``."""
+
+    in_memory = False
+
+    def __init__(self, cache_dir=ingest.CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._version = (None, None)  # (manifest mtime, version)
+        self._memo = {}  # routes, stops and dates of the current version
+
+    def _cursor(self):
+        import duckdb
+
+        with self._lock:
+            # A connection isn't carried over a fork (warm-up, workers): open one per process
+            if self._connection is None or self._pid != os.getpid():
+                self._connection = duckdb.connect()
+                self._pid = os.getpid()
+        # One cursor per query, so threads don't share one
+        return self._connection.cursor()
+
+    def _query(self, sql, params=()):
+        cursor = self._cursor()
+        try:
+            return cursor.execute(sql, list(params)).df()
+        finally:
+            cursor.close()
+
+    def _source(self):
+        path = os.path.join(self.cache_dir, 'route=*', 'semester=*', '*.parquet').replace("'", "''")
+        return f"read_parquet('{path}', hive_partitioning = true)"
+
+    def _where(self, route, start_date, end_date, selected_day=None, stops=None):
+        """WHERE clause and parameters of the filters, pruning semesters the dates rule out."""
+        conditions, params = [], []
+        if route is None:
+            conditions.append('"Route" IS NOT NULL')
+        else:
+            conditions.append('"Route" = ?')
+            params.append(route)
+        if start_date is not None and end_date is not None:
+            semesters = ingest.semesters_between(start_date, end_date)
+            conditions.append(f'semester IN ({", ".join("?" * len(semesters))})')
+            params += semesters
+        if start_date is not None:
+            conditions.append('"Day" >= ?')
+            params.append(encoding.to_day_number(start_date))
+        if end_date is not None:
+            conditions.append('"Day" <= ?')
+            params.append(encoding.to_day_number(end_date))
+        if selected_day not in (None, 'Everyday'):
+            days = selected_day if isinstance(selected_day, list) else [selected_day]
+            codes = [encoding.DAYS_OF_WEEK.index(day) for day in days if day in encoding.DAYS_OF_WEEK]
+            conditions.append(f'{WEEKDAY_SQL} IN ({", ".join(map(str, codes)) or "NULL"})')
+        if stops is not None:
+            conditions.append(f'"Stop" IN ({", ".join("?" * len(stops)) or "NULL"})')
+            params += list(stops)
+        return ' AND '.join(conditions), params
+
+    def _grouped(self, by, aggregates, where, params, dropna):
+        """``aggregates`` ({column: SQL}) grouped by ``by``, sorted like a pandas group-by."""
+        keys = [f'{KEYS[column][0]} AS k{i}' for i, column in enumerate(by)]
+        values = [f'{sql} AS v{i}' for i, sql in enumerate(aggregates.values())]
+        sql = f'SELECT {", ".join(keys + values)} FROM {self._source()} WHERE {where}'
+        if by:
+            sql += f' GROUP BY {", ".join(f"k{i}" for i in range(len(by)))}'
+            if dropna:
+                sql += ' HAVING ' + ' AND '.join(f'k{i} IS NOT NULL' for i in range(len(by)))
+        frame = self._query(sql, params)
+        frame.columns = list(by) + list(aggregates)
+        frame = _typed(frame, by)
+        if by:
+            frame = frame.sort_values(list(by), kind='stable').reset_index(drop=True)
+        return frame
+
+    def version(self):
+        """Fingerprint of the cache's manifest (re-read only when it changes)."""
+        mtime = os.stat(os.path.join(self.cache_dir, ingest.MANIFEST_NAME)).st_mtime_ns
+        if self._version[0] != mtime:
+            self._version = (mtime, dataset.fingerprint(self.cache_dir))
+        return self._version[1]
+
+    def prepare(self):
+        pass
+
+    def _memoized(self, key, compute):
+        key = (self.version(),) + key
+        if key not in self._memo:
+            if len(self._memo) > 1000:
+                self._memo.clear()
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def routes(self):
+        return self._memoized(('routes',), lambda: sorted(self._query(
+            f'SELECT DISTINCT "Route" FROM {self._source()} WHERE "Route" IS NOT NULL')['Route']))
+
+    def day_range(self):
+        def compute():
+            first, last = self._query(f'SELECT min("Day"), max("Day") FROM {self._source()}').iloc[0]
+            return int(first), int(last)
+        return self._memoized(('days',), compute)
+
+    def stops(self, route):
+        return self._memoized(('stops', route), lambda: sorted(self._query(
+            f'SELECT DISTINCT "Stop" FROM {self._source()} WHERE "Route" = ? AND "Stop" IS NOT NULL',
+            [route])['Stop']))
+
+    def ridership(self, by, route=None, start_date=None, end_date=None, selected_day=None,
+                  stops=None, measures=cube.MEASURES):
+        aggregates = {measure: f'CAST(coalesce(sum({_quoted(measure)}), 0) AS BIGINT)' for measure in measures}
+        aggregates.update({cube.count_column(measure): f'count({_quoted(measure)})' for measure in measures})
+        where, params = self._where(route, start_date, end_date, selected_day, stops)
+        # As the cube: groups with a missing key are dropped
+        return self._grouped(list(by), aggregates, where, params, dropna=True)
+
+    def stop_totals(self, route=None, start_date=None, end_date=None, selected_day=None):
+        # The scan only reads the range's partitions and row groups; no running totals to keep
+        return self.ridership(['Stop', 'Day of Week'], route, start_date, end_date, selected_day)
+
+    def capacity(self, name, by, route=None, start_date=None, end_date=None, selected_day=None):
+        where, params = self._where(route, start_date, end_date, selected_day)
+        if name != 'left':
+            where += f' AND {LOAD_BUCKET_SQL} >= 0'  # events without a capacity have no load factor
+        aggregates = {measure: CAPACITY_MEASURES[measure] for measure in capacity.MEASURES[name]}
+        return self._grouped(list(by), aggregates, where, params, dropna=False)
+
+    def events(self, columns, route=None, start_date=None, end_date=None):
+        where, params = self._where(route, start_date, end_date)
+        sql = f'SELECT {", ".join(_select(c) for c in columns)} FROM {self._source()} WHERE {where}'
+        frame = self._query(sql, params)
+        frame.columns = list(columns)
+        return _typed(frame, columns)
+
+    @staticmethod
+    def _event_frame(frame, columns):
+        frame.columns = columns
+        return _typed(frame, ['Day of Week'])
+
+    def event_batches(self, route=None, start_date=None, end_date=None, selected_day=None,
+                      batch_rows=dataset.CHUNK_ROWS):
+        where, params = self._where(route, start_date, end_date, selected_day)
+        columns = EVENT_COLUMNS + ['Day of Week']
+        sql = (f'SELECT {", ".join(_quoted(c) for c in EVENT_COLUMNS)}, {WEEKDAY_SQL} AS weekday '
+               f'FROM {self._source()} WHERE {where} ORDER BY "Route", "Day"')
+        cursor = self._cursor()
+        try:
+            reader = cursor.execute(sql, params).fetch_record_batch(batch_rows)
+            yielded = False
+            for batch in reader:
+                yielded = True
+                yield self._event_frame(batch.to_pandas(), columns)
+            if not yielded:
+                yield self._event_frame(reader.schema.empty_table().to_pandas(), columns)
+        finally:
+            cursor.close()
+
+
+################### CONFIGURATION ###################
+def configure(name='pandas', cache_dir=ingest.CACHE_DIR):
+    """Answer every query with backend ``name`` (one of ``BACKENDS``) from now on."""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, expected one of {BACKENDS}")
+    if name == 'pandas':
+        _backend = None
+        return
+    if not ingest.has_cache(cache_dir):
+        raise RuntimeError(f"The {name} backend reads the Parquet cache, but {cache_dir} has none; "
+                           "run `python -m utils.ingest` first")
+    _backend = DuckDBBackend(cache_dir)
+    logger.info("Answering queries with DuckDB over %s", cache_dir)
+
+
+def get():
+    """The backend to answer a query from (for pandas, bound to the current snapshot)."""
+    return _backend or PandasBackend(dataset.current())
+
+
+def version():
+    """Version id of the data behind the backend; result caches are keyed by it."""
+    return get().version()
@@ -0,0 +1,120 @@
+"""Run the heavy callbacks as background jobs.
+
+A page's filter callback builds its shared slice (``utils/slices.py``), which
+over a multi-year range is the slowest thing the dashboard does. Run on a
+server thread, it holds that thread (and, in pandas, the GIL) for the whole
+time, and everyone else's requests queue behind it.
+
+With Dash's ``DiskcacheManager`` installed (``pip install "dash[diskcache]"``),
+the callbacks registered with ``callback`` instead run in a process of their
+own. Jobs and results go through a ``diskcache`` directory (``JOBS_DIR``), so
+no broker is needed. The browser polls for the result every ``POLL_MS``.
+
+- At most ``MAX_JOBS`` heavy jobs compute at once, across all worker
+  processes. The others wait for a free slot, and the page's status line says
+  so.
+- When the filters change while a job runs, the browser sends the old job
+  along with the new request, and Dash kills the old job.
+- The slice a job builds is kept on disk as well (``slices.configure``), so
+  the chart callbacks on the server read it instead of building it again.
+
+Without those packages, the callbacks run as ordinary callbacks.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import dash
+from dash.dependencies import Output
+
+from utils import dataset, slices
+
+JOBS_DIR = os.path.join(dataset.DATA_DIR, 'jobs')
+
+MAX_JOBS = 2
+POLL_MS = 250
+WAIT_SECONDS = 0.1
+
+SLOTS_KEY = 'heavy-job-pids'
+
+# Style of a page's status line while its job runs / otherwise
+STATUS_SHOWN = {'display': 'block', 'font-family': 'Segoe UI', 'padding': '0 2em', 'color': 'gray'}
+STATUS_HIDDEN = {'display': 'none'}
+
+
+def _manager():
+    try:
+        import diskcache
+        return dash.DiskcacheManager(diskcache.Cache(JOBS_DIR))
+    except ImportError:
+        return None
+
+
+MANAGER = _manager()
+if MANAGER is not None:
+    slices.configure(disk_dir=os.path.join(JOBS_DIR, 'slices'))
+
+
+################### JOB SLOTS ###################
+def _take_slot(handle):
+    """Take one of the ``MAX_JOBS`` slots for this process. Returns how many jobs
+    are running if none is free (0 once taken)."""
+    import psutil
+
+    with handle.transact():
+        # Jobs that were killed (superseded) never gave their slot back
+        running = [pid for pid in handle.get(SLOTS_KEY, []) if psutil.pid_exists(pid)]
+        if len(running) >= MAX_JOBS:
+            handle.set(SLOTS_KEY, running)
+            return len(running)
+        handle.set(SLOTS_KEY, running + [os.getpid()])
+        return 0
+
+
+def _give_back_slot(handle):
+    with handle.transact():
+        handle.set(SLOTS_KEY, [pid for pid in handle.get(SLOTS_KEY, []) if pid != os.getpid()])
+
+
+@contextmanager
+def slot(set_progress):
+    """Wait for a free job slot, then hold it for the ``with`` block."""
+    handle = MANAGER.handle
+    while True:
+        running = _take_slot(handle)
+        if not running:
+            break
+        set_progress(f"Waiting for {running} other long queries to finish...")
+        time.sleep(WAIT_SECONDS)
+    try:
+        yield
+    finally:
+        _give_back_slot(handle)
+
+
+################### REGISTRATION ###################
+def callback(output, inputs, status):
+    """Register ``func`` as the callback for ``output`` / ``inputs``, as a background
+    job when a manager is installed.
+
+    ``status`` is the id of an ``html.Div`` (styled ``STATUS_HIDDEN``) shown while
+    the job runs, with its progress. ``func`` itself is returned unchanged, so it
+    can still be called directly (warm-up, benchmarks).
+    """
+    running = [(Output(status, 'style'), STATUS_SHOWN, STATUS_HIDDEN)]
+
+    def register(func):
+        if MANAGER is None:
+            dash.callback(output, inputs, running=running)(func)
+            return func
+
+        def job(set_progress, *args):
+            with slot(set_progress):
+                set_progress("Loading the selected dates...")
+                return func(*args)
+        job.__name__ = job.__qualname__ = func.__name__
+
+        dash.callback(output, inputs, background=True, manager=MANAGER, interval=POLL_MS,
+                      progress=Output(status, 'children'), running=running)(job)
+        return func
+    return register
@@ -0,0 +1,230 @@
+"""Time loading and every dashboard callback at production sizes, without a browser.
+
+    python -m utils.benchmark                        # 10k and 1M rows
+    python -m utils.benchmark --rows 10k 1M 10M --repeat 5
+    python -m utils.benchmark --rows 1M --backend duckdb
+
+For each size a synthetic export (``utils/synthetic.py``, written once to
+``data/synthetic/`` and reused) is loaded and cleaned, then every callback
+function is called directly for the busiest route over the full date range.
+The filter callbacks are timed from scratch, the chart callbacks with their
+shared slice already built (as when a user changes a chart's own inputs),
+both without the result cache.
+
+With ``--backend duckdb`` the export is ingested into a Parquet cache next to
+it instead (``utils/ingest.py``, once), and the callbacks query that through
+DuckDB (``utils/backend.py``) rather than loading it.
+
+Each run appends one line per size to ``benchmarks.jsonl`` (timings, git
+commit, library versions) and prints the timings next to the previous run of
+the same size, so a change that slows something down shows up right away.
+"""
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+import pandas as pd
+
+from utils import backend, cache, dataset, encoding, ingest, slices, synthetic
+
+REPO_DIR = os.path.join(os.path.dirname(__file__), '..')
+RESULTS_FILE = os.path.join(REPO_DIR, 'benchmarks.jsonl')
+
+DEFAULT_SIZES = ['10k', '1M']
+DEFAULT_REPEAT = 3
+
+# Flag timings this much slower than the previous run
+REGRESSION_RATIO = 1.2
+
+
+def _commit():
+    """Short hash of the checked-out commit ('-dirty' with local changes), if in a git repo."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + '-dirty' if dirty else commit
+
+
+def _median_ms(func, args, repeat, before=None):
+    times = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 2)
+
+
+################### CALLBACKS ###################
+def _callbacks(route, start_date, end_date):
+    """``(name, function, args)`` for every callback, with the pages' default inputs."""
+    import run  # noqa: F401 (creates the Dash app, which registers the pages)
+    from pages import (ridership_capacity as capacity_page, ridership_punctuality as punctuality_page,
+                       ridership_stops as stops_page, ridership_summary as summary_page,
+                       ridership_time as time_page)
+
+    stops = backend.get().stops(route)
+    time_filter = slices.payload('ridership_time', route=route, start_date=start_date, end_date=end_date)
+    stops_filter = slices.payload('ridership_stops', route=route, start_date=start_date, end_date=end_date)
+    capacity_filter = slices.payload('ridership_capacity', route=route, start_date=start_date, end_date=end_date)
+    punctuality_filter = slices.payload('ridership_punctuality', route=route, start_date=start_date,
+                                        end_date=end_date)
+    return [
+        ('time.update_time_filter', time_page.update_time_filter, (route, start_date, end_date)),
+        ('time.update_time_aggregate', time_page.update_time_aggregate, (time_filter,)),
+        ('time.update_date_range_dropdown', time_page.update_date_range_dropdown, (start_date, end_date)),
+        ('time.update_ridership_daily_by_week_graph[By Week]', time_page.update_ridership_daily_by_week_graph,
+         (time_filter, None, 'By Week', None)),
+        ('time.update_ridership_daily_by_week_graph[Entire Dates]', time_page.update_ridership_daily_by_week_graph,
+         (time_filter, None, 'Entire Dates', None)),
+        ('time.update_stop_options', time_page.update_stop_options, (route,)),
+        ('time.update_stop_time_aggregate', time_page.update_stop_time_aggregate, (stops[0], time_filter)),
+        ('stops.update_stops_filter', stops_page.update_stops_filter, (route, start_date, end_date)),
+        ('stops.update_top_bottom_5_charts', stops_page.update_top_bottom_5_charts,
+         (stops_filter, 'Riders On', stops_page.DEFAULT_STOP_COUNT)),
+        ('stops.update_graphs', stops_page.update_graphs,
+         ('Riders On', stops_filter, 'sum', stops_page.DEFAULT_STOP_COUNT)),
+        ('stops.update_stop_selector_options', stops_page.update_stop_selector_options, (route,)),
+        ('stops.update_stop_bar_chart', stops_page.update_stop_bar_chart,
+         (stops_filter, stops, 'Everyday', 'Sum')),
+        ('capacity.update_capacity_filter', capacity_page.update_capacity_filter, (route, start_date, end_date)),
+        ('capacity.update_capacity_day_of_week_graph', capacity_page.update_capacity_day_of_week_graph,
+         (capacity_filter, [80, 150])),
+        ('capacity.update_capacity_hour_graph', capacity_page.update_capacity_hour_graph,
+         (capacity_filter, [80, 150], 'Everyday')),
+        ('capacity.update_denied_boardings_graph', capacity_page.update_denied_boardings_graph,
+         (capacity_filter, 'Everyday')),
+        ('punctuality.update_punctuality_filter', punctuality_page.update_punctuality_filter,
+         (route, start_date, end_date)),
+        ('punctuality.update_on_time_hour_graph', punctuality_page.update_on_time_hour_graph, (punctuality_filter,)),
+        ('punctuality.update_stop_percentile_graphs', punctuality_page.update_stop_percentile_graphs,
+         (punctuality_filter,)),
+        ('punctuality.update_lateness_heatmap', punctuality_page.update_lateness_heatmap, (punctuality_filter, 50)),
+        ('time.layout', time_page.layout, ()),
+        ('stops.layout', stops_page.layout, ()),
+        ('summary.layout', summary_page.layout, ()),
+        ('capacity.layout', capacity_page.layout, ()),
+        ('punctuality.layout', punctuality_page.layout, ()),
+    ]
+
+
+################### RUNS ###################
+def _load_pandas(path, timings):
+    """Load ``path`` into memory as the dashboard does. Returns ``(routes of every row, memory MB)``."""
+    backend.configure('pandas')
+    start = time.perf_counter()
+    df, stats = dataset.load(path)
+    timings['load'] = round((time.perf_counter() - start) * 1000, 2)
+    snapshot = dataset.Snapshot(df, stats)
+    dataset.swap(snapshot)
+    timings['cube'] = round(snapshot.stats['cube_seconds'] * 1000, 2)
+    snapshot.capacity
+    timings['capacity'] = round(snapshot.stats['capacity_seconds'] * 1000, 2)
+    return df['Route'], round(stats['memory_bytes'] / 1e6, 1)
+
+
+def _load_duckdb(path, timings):
+    """Ingest ``path`` into a Parquet cache beside it (once) and query it with DuckDB."""
+    cache_dir = os.path.splitext(path)[0] + '_cache'
+    start = time.perf_counter()
+    ingest.ingest([path], cache_dir)
+    timings['ingest'] = round((time.perf_counter() - start) * 1000, 2)
+    backend.configure('duckdb', cache_dir)
+    return backend.get().events(['Route'])['Route'], None
+
+
+def run_size(rows, repeat=DEFAULT_REPEAT, backend_name='pandas'):
+    """Benchmark one export size. Returns the record written to the results file."""
+    path = synthetic.default_path(rows)
+    if not os.path.exists(path):
+        print(f'Writing {rows:,} synthetic rows to {path}')
+        synthetic.write_csv(rows, path)
+
+    timings = {}
+    load = _load_duckdb if backend_name == 'duckdb' else _load_pandas
+    routes, memory_mb = load(path, timings)
+
+    route = routes.value_counts().idxmax()
+    first, last = backend.get().day_range()
+    start_date = encoding.to_date(first).strftime('%Y-%m-%d')
+    end_date = encoding.to_date(last).strftime('%Y-%m-%d')
+    for name, func, args in _callbacks(route, start_date, end_date):
+        func = inspect.unwrap(func)  # skip the result cache and metrics
+        if name.endswith('_filter'):
+            timings[name] = _median_ms(func, args, repeat, before=slices.clear)
+        else:
+            func(*args)  # builds the slice it reads
+            timings[name] = _median_ms(func, args, repeat)
+    cache.results.clear()
+
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'rows': rows,
+        'backend': backend_name,
+        'clean_rows': len(routes),
+        'memory_mb': memory_mb,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'timings_ms': timings,
+    }
+
+
+def previous_run(rows, results_file=RESULTS_FILE, backend_name='pandas'):
+    """The last recorded run of ``rows`` rows on ``backend_name``, or None."""
+    if not os.path.exists(results_file):
+        return None
+    last = None
+    with open(results_file) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['rows'] == rows and record.get('backend', 'pandas') == backend_name:
+                last = record
+    return last
+
+
+def report(record, previous=None):
+    """Print ``record``'s timings, side by side with ``previous`` if given."""
+    memory = f", {record['memory_mb']} MB" if record['memory_mb'] is not None else ''
+    print(f"\n{record['rows']:,} rows ({record['clean_rows']:,} after cleaning{memory}, {record['backend']})"
+          f" at {record['commit']}" + (f", vs {previous['commit']} ({previous['time']})" if previous else ''))
+    before = previous['timings_ms'] if previous else {}
+    for name, ms in record['timings_ms'].items():
+        line = f'  {name:60s} {ms:10.2f} ms'
+        if name in before and before[name]:
+            ratio = ms / before[name]
+            line += f'  {before[name]:10.2f} ms  x{ratio:.2f}' + ('  SLOWER' if ratio > REGRESSION_RATIO else '')
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark loading and callbacks on synthetic ridership data.")
+    parser.add_argument('--rows', nargs='+', type=synthetic.parse_size,
+                        default=[synthetic.SIZES[size] for size in DEFAULT_SIZES],
+                        help="export sizes, e.g. 10k 1M 10M")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="timed calls per callback (median kept)")
+    parser.add_argument('--backend', choices=backend.BACKENDS, default='pandas', help="where the queries run")
+    parser.add_argument('--output', default=RESULTS_FILE, help="JSON-lines file the results are appended to")
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        record = run_size(rows, args.repeat, args.backend)
+        report(record, previous_run(rows, args.output, args.backend))
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Memoization of callback results.
+
+Callbacks decorated with ``@cache.memoize`` are keyed on their normalized
+inputs (route, dates, day selector, calc method, stop...), the dataset
+version and a fingerprint of the dashboard code. Results live in a bounded
+in-memory LRU, with an optional on-disk tier (pickles) that survives restarts.
+When the dataset version changes (a refresh, see ``utils/refresh.py``), old
+entries are dropped, and results computed from the old data are not stored.
+
+Hit/miss/eviction counts are available from ``stats()`` (served as JSON on
+``/cache/stats`` by ``run.py``).
+"""
+import functools
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+from utils import backend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_DISK_ENTRIES = 4096
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+# DatePickerRange sends either 'YYYY-MM-DD' or 'YYYY-MM-DDT00:00:00'
+_MIDNIGHT = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:[T ]00:00:00)?$')
+
+
+def normalize(value):
+    """Canonical, hashable form of a callback input."""
+    if isinstance(value, str):
+        match = _MIDNIGHT.match(value)
+        return match.group(1) if match else value
+    if isinstance(value, dict):  # dcc.Store payloads
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        # Weekend days and stop multi-selects: order doesn't change the result
+        items = [normalize(v) for v in value]
+        try:
+            return tuple(sorted(items))
+        except TypeError:
+            return tuple(items)
+    return value
+
+
+def code_version():
+    """Fingerprint of the page and utility sources, so a deploy invalidates old results."""
+    digest = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(PROJECT_DIR, 'pages', '*.py')) +
+                       glob.glob(os.path.join(PROJECT_DIR, 'utils', '*.py'))):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class ResultCache:
+    """Bounded LRU of callback results with an optional pickle directory behind it."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, disk_dir=None,
+                 max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._disk_files = OrderedDict()  # file path -> None, oldest first
+        self._version = None
+        self._code_version = code_version()
+        self.counts = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0}
+
+    ########## VERSIONING ##########
+    def _check_version(self):
+        # Called with the lock held
+        version = f'{backend.version()}-{self._code_version}'
+        if version == self._version:
+            return
+        self._entries.clear()
+        self._version = version
+        if self.disk_dir:
+            version_dir = os.path.join(self.disk_dir, version)
+            for old in glob.glob(os.path.join(self.disk_dir, '*')):
+                if old != version_dir:
+                    shutil.rmtree(old, ignore_errors=True)
+            os.makedirs(version_dir, exist_ok=True)
+            files = sorted(glob.glob(os.path.join(version_dir, '*.pkl')), key=os.path.getmtime)
+            self._disk_files = OrderedDict.fromkeys(files)
+
+    def _disk_path(self, key):
+        name = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_dir, self._version, name + '.pkl')
+
+    ########## LOOKUP ##########
+    def get(self, key):
+        """``(True, value)`` on a hit, ``(False, None)`` on a miss."""
+        with self._lock:
+            self._check_version()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counts['hits'] += 1
+                return True, self._entries[key]
+            path = self._disk_path(key) if self.disk_dir else None
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+            else:
+                with self._lock:
+                    self.counts['disk_hits'] += 1
+                    self._store(key, value)
+                return True, value
+
+        with self._lock:
+            self.counts['misses'] += 1
+        return False, None
+
+    def put(self, key, value, version=None):
+        """Store ``value``; pass the dataset ``version`` it was computed from to skip stale results."""
+        with self._lock:
+            self._check_version()
+            if version is not None and version != backend.version():
+                return  # the data was refreshed while this was being computed
+            self._store(key, value)
+            path = self._disk_path(key) if self.disk_dir else None
+        if path:
+            self._write_disk(path, value)
+
+    def _store(self, key, value):
+        # Called with the lock held
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counts['evictions'] += 1
+
+    def _write_disk(self, path, value):
+        # Unique per writer: other processes may be writing the same result
+        tmp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning("Could not write cached result %s: %s", path, e)
+            return
+        with self._lock:
+            self._disk_files[path] = None
+            self._disk_files.move_to_end(path)
+            while len(self._disk_files) > self.max_disk_entries:
+                oldest, _ = self._disk_files.popitem(last=False)
+                try:
+                    os.remove(oldest)
+                except FileNotFoundError:
+                    pass
+                self.counts['disk_evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+            if self.disk_dir:
+                shutil.rmtree(self.disk_dir, ignore_errors=True)
+            self._disk_files.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counts['hits'] + self.counts['disk_hits'] + self.counts['misses']
+            return dict(self.counts,
+                        entries=len(self._entries),
+                        max_entries=self.max_entries,
+                        disk_entries=len(self._disk_files),
+                        hit_rate=(self.counts['hits'] + self.counts['disk_hits']) / lookups if lookups else 0.0)
+
+
+results = ResultCache()
+
+
+def configure(max_entries=DEFAULT_MAX_ENTRIES, disk_dir=None, max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+    """Replace the shared result cache (e.g. to turn on the disk tier)."""
+    global results
+    results = ResultCache(max_entries, disk_dir, max_disk_entries)
+    return results
+
+
+def stats():
+    return results.stats()
+
+
+def key_for(func, args):
+    """Result cache key of a ``@memoize``d call (also used to warm the cache)."""
+    return (f'{func.__module__}.{func.__qualname__}',) + tuple(normalize(a) for a in args)
+
+
+def memoize(func):
+    """Cache ``func``'s return value per normalized positional arguments."""
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        key = key_for(wrapper, args)
+        hit, value = results.get(key)
+        if hit:
+            return value
+        version = backend.version()
+        value = func(*args)
+        results.put(key, value, version)
+        return value
+
+    return wrapper
@@ -0,0 +1,118 @@
+"""Vehicle load factors, pre-binned for the capacity page.
+
+The load factor of a stop event is Riders Cumulative (riders on board) over
+Vehicle Capacity. It is computed for every row in one vectorized pass and cut
+into ``BUCKET_PERCENT`` buckets. The stop events are then counted per (route,
+day, hour, load bucket), so the "how often is a capacity range reached by day
+of week / by hour" charts only sum the bins of the selected range and never
+rescan rows.
+
+Riders Left (riders who could not board a full vehicle) are summed per stop
+and hour for the denied-boarding hotspots.
+
+Like the ridership cube (``utils/cube.py``), tables are sorted by (Route, Day)
+and carry a ``RouteDayIndex``. Their counts simply add up, so new rows are
+merged in (``merge``) without rebuilding.
+"""
+import numpy as np
+
+from utils import encoding
+from utils.index import RouteDayIndex
+
+BUCKET_PERCENT = 5
+# Loads above this all go to one last bucket
+MAX_PERCENT = 150
+OVERFLOW_BUCKET = MAX_PERCENT // BUCKET_PERCENT + 1
+
+MEASURES = {
+    'load_hour': ['Stop Events'],
+    'load_day': ['Stop Events'],
+    'left': ['Riders Left', 'Denied Events', 'Stop Events'],
+}
+ROLLUPS = {
+    'load_hour': ['Route', 'Day', 'Day of Week', 'Hour', 'Load Bucket'],
+    'load_day': ['Route', 'Day', 'Day of Week', 'Load Bucket'],
+    'left': ['Route', 'Day', 'Day of Week', 'Stop', 'Hour'],
+}
+
+
+def load_percent(df):
+    """Riders Cumulative / Vehicle Capacity as a percentage (NaN without a capacity)."""
+    capacity = df['Vehicle Capacity'].to_numpy(dtype=np.float64)
+    on_board = df['Riders Cumulative'].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.where(capacity > 0, on_board / capacity * 100, np.nan)
+    return percent
+
+
+def load_buckets(percent):
+    """Bucket of each load percentage (-1 when unknown).
+
+    Bucket ``b`` holds loads above ``(b - 1) * BUCKET_PERCENT`` up to
+    ``b * BUCKET_PERCENT``; bucket 0 is an empty vehicle and ``OVERFLOW_BUCKET``
+    anything above ``MAX_PERCENT``.
+    """
+    # Rounded first so 100.00000001% (float error) still counts as full
+    buckets = np.ceil(np.round(percent, 6) / BUCKET_PERCENT)
+    buckets = np.clip(np.nan_to_num(buckets, nan=-1), -1, OVERFLOW_BUCKET)
+    return buckets.astype(np.int16)
+
+
+def bucket_range(low, high):
+    """First and last bucket of loads above ``low`` % up to ``high`` % (from 0 % if ``low`` is 0).
+
+    ``high`` at ``MAX_PERCENT`` also takes in the fuller loads.
+    """
+    first = 0 if low <= 0 else int(low) // BUCKET_PERCENT + 1
+    last = OVERFLOW_BUCKET if high >= MAX_PERCENT else int(high) // BUCKET_PERCENT
+    return first, last
+
+
+def _sum(rows, by, measures):
+    return rows.groupby(by, as_index=False, sort=True, dropna=False, observed=True)[measures].sum()
+
+
+class CapacityCube:
+    """Stop-event counts per load bucket and Riders Left per stop and hour."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.indexes = {name: RouteDayIndex(table) for name, table in tables.items()}
+
+    @classmethod
+    def build(cls, df):
+        """Bin cleaned stop events (``dataset.get_df()``)."""
+        riders_left = df['Riders Left'].fillna(0).to_numpy(dtype=np.int64)  # blank: nobody left behind
+        events = df[['Route', 'Day', 'Day of Week', 'Stop']].assign(**{
+            # MISSING_TIME (-1) comes out as hour -1
+            'Hour': (df['Scheduled Time'].to_numpy() // 3600).astype(np.int8),
+            'Load Bucket': load_buckets(load_percent(df)),
+            'Riders Left': riders_left,
+            'Denied Events': (riders_left > 0).astype(np.int64),
+            'Stop Events': np.ones(len(df), dtype=np.int64),
+        })
+        tables = {'left': _sum(events, ROLLUPS['left'], MEASURES['left'])}
+        # Events without a capacity have no load factor
+        loaded = events[events['Load Bucket'] >= 0]
+        tables['load_hour'] = _sum(loaded, ROLLUPS['load_hour'], MEASURES['load_hour'])
+        tables['load_day'] = _sum(tables['load_hour'], ROLLUPS['load_day'], MEASURES['load_day'])
+        return cls(tables)
+
+    def merge(self, other):
+        """Cube over the rows of both cubes."""
+        tables = {}
+        for name, keys in ROLLUPS.items():
+            both = encoding.concat([self.tables[name], other.tables[name]])
+            tables[name] = _sum(both, keys, MEASURES[name])
+        return CapacityCube(tables)
+
+    def query(self, name, by, route=None, start_date=None, end_date=None, selected_day=None):
+        """Table ``name`` summed to the ``by`` columns for the given filters."""
+        rows = self.indexes[name].slice(route, start_date, end_date, selected_day)
+        return _sum(rows, list(by), MEASURES[name])
+
+
+def in_range(table, low, high):
+    """Rows of a load table whose bucket is in the ``low``-``high`` % range."""
+    first, last = bucket_range(low, high)
+    return table[table['Load Bucket'].between(first, last)]
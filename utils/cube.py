@@ -0,0 +1,140 @@
+"""Pre-aggregated ridership cube.
+
+The cleaned stop events are summed once per (route, day, stop, scheduled time)
+and a few coarser roll-ups are materialized from that. Callbacks query the
+smallest table that has the columns they need instead of re-scanning raw rows.
+
+Every table keeps a row count next to each sum, so ``Average`` (the mean over
+stop events, as the callbacks computed it on raw rows) is ``sum / count`` and
+matches exactly.
+
+Per-stop totals of a date range (the Stops page) come from running totals over
+the stop table instead (``utils/prefix.py``), built per route on first use.
+"""
+import threading
+
+import numpy as np
+
+from utils import encoding, metrics, prefix
+from utils.index import RouteDayIndex
+
+MEASURES = ['Riders On', 'Riders Off']
+
+# Roll-up name -> key columns, finest first. 'Day of Week' rides along with
+# 'Day' so the day selector can filter every table.
+ROLLUPS = {
+    'stop_time': ['Route', 'Day', 'Day of Week', 'Stop', 'Scheduled Time'],
+    'time': ['Route', 'Day', 'Day of Week', 'Scheduled Time'],
+    'stop': ['Route', 'Day', 'Day of Week', 'Stop'],
+    'day': ['Route', 'Day', 'Day of Week'],
+}
+
+
+def count_column(measure):
+    return f'{measure} count'
+
+
+def is_average(calc_method):
+    """True for the 'Average' option of either page's calculation dropdown."""
+    return calc_method in ('Average', 'avg')
+
+
+def values(grouped, measure, calc_method):
+    """The Sum or Average of ``measure`` from a roll-up result."""
+    if is_average(calc_method):
+        return grouped[measure] / grouped[count_column(measure)]
+    return grouped[measure]
+
+
+def regroup(rows, by, measures=MEASURES, dropna=True):
+    """Re-aggregate cube rows (sums and counts) to the ``by`` columns."""
+    columns = list(measures) + [count_column(m) for m in measures]
+    return rows.groupby(by, as_index=False, sort=True, dropna=dropna, observed=True)[columns].sum()
+
+
+def finish(grouped, calc_method, measures=MEASURES):
+    """Replace each measure's sum with its Sum/Average and drop the counts."""
+    grouped = grouped.copy()
+    for measure in measures:
+        grouped[measure] = values(grouped, measure, calc_method)
+    return grouped.drop(columns=[count_column(m) for m in measures])
+
+
+class RidershipCube:
+    """Sums and counts of Riders On/Off at several granularities.
+
+    Tables are sorted by (Route, Day), so each carries a ``RouteDayIndex``.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.indexes = {name: RouteDayIndex(table) for name, table in tables.items()}
+        self._prefix = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, df):
+        """Aggregate cleaned stop events (``dataset.get_df()``) into the cube."""
+        # Counts are stored as small ints (floats if any is missing); sum them as int64 so
+        # totals can't overflow. A missing count adds nothing to the sum or to the count.
+        # Same column order as regroup(): the sums, then their counts
+        events = df[ROLLUPS['stop_time']].assign(
+            **{measure: df[measure].fillna(0).astype('int64') for measure in MEASURES},
+            **{count_column(measure): df[measure].notna().astype('int64') for measure in MEASURES})
+        tables = {'stop_time': regroup(events, ROLLUPS['stop_time'], dropna=False)}
+        for name in ('time', 'stop', 'day'):
+            tables[name] = regroup(tables['stop_time'], ROLLUPS[name], dropna=False)
+        return cls(tables)
+
+    def merge(self, other):
+        """Cube over the rows of both cubes (sums and counts just add up)."""
+        tables = {}
+        for name, keys in ROLLUPS.items():
+            both = encoding.concat([self.tables[name], other.tables[name]])
+            tables[name] = regroup(both, keys, dropna=False)
+        return RidershipCube(tables)
+
+    def _table_for(self, columns):
+        # Coarsest table that still has every column we need
+        for name in reversed(list(ROLLUPS)):
+            if set(columns) <= set(ROLLUPS[name]):
+                return name
+        return 'stop_time'
+
+    def query(self, by, route=None, start_date=None, end_date=None, selected_day=None,
+              stops=None, measures=MEASURES):
+        """Sums and counts of ``measures`` grouped by ``by`` for the given filters."""
+        filter_columns = ['Stop'] if stops is not None else []
+        index = self.indexes[self._table_for(list(by) + filter_columns)]
+
+        rows = index.slice(route, start_date, end_date, selected_day)
+        if stops is not None:
+            rows = rows[rows['Stop'].isin(stops)]
+        return regroup(rows, list(by), measures)
+
+    def _prefix_sums(self, route):
+        if route not in self._prefix:
+            with self._lock:
+                if route not in self._prefix:
+                    columns = MEASURES + [count_column(m) for m in MEASURES]
+                    self._prefix[route] = prefix.StopPrefixSums(self.indexes['stop'].slice(route), columns)
+        return self._prefix[route]
+
+    def stop_totals(self, route=None, start_date=None, end_date=None, selected_day=None):
+        """Same as ``query(['Stop', 'Day of Week'], ...)``, in time independent of the date range."""
+        index = self.indexes['stop']
+        start_day = None if start_date is None else encoding.to_day_number(start_date)
+        end_day = None if end_date is None else encoding.to_day_number(end_date)
+        weekdays = prefix.weekday_codes(selected_day)
+        stop_dtype = index.frame['Stop'].dtype
+
+        columns = MEASURES + [count_column(m) for m in MEASURES]
+        totals = np.zeros((len(stop_dtype.categories), len(encoding.DAYS_OF_WEEK), len(columns) + 1),
+                          dtype=np.int64)
+        for name in ([route] if route is not None else index.routes):
+            if name in index.ranges:
+                sums = self._prefix_sums(name)
+                totals[sums.stops] += sums.totals(start_day, end_day, weekdays)
+        rows = prefix.frame(totals, stop_dtype, columns)
+        metrics.count_rows(len(rows))
+        return rows
@@ -0,0 +1,343 @@
+"""Shared ridership dataset.
+
+The CSV export is read and cleaned once per process and every page works off
+the same frame, instead of each page parsing (and cleaning) its own copy.
+The frame, its index and its cube are held together in a ``Snapshot``; new
+data (``utils/refresh.py``) produces a new snapshot that replaces the old one
+in a single step.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import encoding
+from utils.capacity import CapacityCube
+from utils.cube import RidershipCube
+from utils.index import RouteDayIndex, sort_by_route_day
+
+logger = logging.getLogger(__name__)
+
+################### SOURCE FILE ###################
+# file_name = 'RidershipData.csv'
+# file_name = 'Fall2024_RidershipData.csv'
+# file_name = '20250205_RidershipData.csv'
+# file_name = 'Summer2024_RidershipData.csv'
+# file_name = '051524-051924_RidershipData.csv'
+FILE_NAME = 'mock_ridership_data.csv'
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+DATE_FORMAT = '%Y/%m/%d'
+
+# Rows read from a CSV export at a time
+CHUNK_ROWS = 200_000
+
+# Every page shares one frame, so slices taken from it must never write back
+# into it. Copy-on-write guarantees that (and is the default from pandas 3 on).
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+################### CLEANING ###################
+# Label columns stored as categoricals (group-bys run on their integer codes)
+CATEGORICAL_COLUMNS = ['Route', 'Stop', 'Day Of Week', 'Ride State', 'Stop State']
+# Rider counts, downcast to the smallest integer type that holds them
+COUNT_COLUMNS = ['Riders On', 'Riders Off', 'Riders Left', 'Riders Cumulative']
+
+
+def clean(df):
+    """Apply the cleaning steps shared by every page and return a new frame.
+
+    Dates come out as int32 day numbers and times of day as int32 seconds since
+    midnight (see ``utils/encoding.py``), plus each stop event's Lateness and
+    Dwell in seconds.
+    """
+    # removing cancelled trips, skipped/waiting stops (bc no riders getting on)
+    df = df[(df['Ride State'] != 'Cancelled') &
+            (df['Stop State'] != 'Skipped') &
+            (df['Stop State'] != 'Awaiting')]
+
+    # Removing exact duplicate rows
+    df = df.drop_duplicates().reset_index(drop=True)
+
+    # converting dates to day numbers
+    df['Day'] = encoding.to_day_numbers(pd.to_datetime(df['Day'], format=DATE_FORMAT))
+
+    # full timestamps parsed once, so lateness and dwell are right across midnight too
+    scheduled = encoding.to_epoch_seconds(df['Scheduled Time'], df['Day'])
+    arrival = encoding.to_epoch_seconds(df['Actual Arrival'], df['Day'])
+    departure = encoding.to_epoch_seconds(df['Actual Departure'], df['Day'])
+    df['Lateness'] = (arrival - scheduled).astype(np.float32)  # seconds late (negative if early), NaN if unknown
+    df['Dwell'] = (departure - arrival).astype(np.float32)  # seconds at the stop
+
+    # keeping the time of day only, as seconds since midnight
+    df['Scheduled Time'] = encoding.to_seconds_of_day(scheduled)
+    df['Actual Arrival'] = encoding.to_seconds_of_day(arrival)
+    df['Actual Departure'] = encoding.to_seconds_of_day(departure)
+
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+    # blank or non-numeric counts become NaN, which the sums and averages skip
+    for column in COUNT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce', downcast='integer')
+    df['Vehicle Capacity'] = pd.to_numeric(df['Vehicle Capacity'], errors='coerce', downcast='float')
+
+    # Adding a Day of Week column (categorical, Monday first)
+    df['Day of Week'] = encoding.day_of_week(df['Day'])
+    return df
+
+
+def compact(df):
+    """Re-apply the compact dtypes of ``clean`` to a frame read back from Parquet.
+
+    Categories come back in first-seen order and counts as int32; sort the one
+    and downcast the other so both load paths give the same frame.
+    """
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+        df[column] = df[column].cat.set_categories(sorted(df[column].cat.categories))
+    for column in COUNT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce', downcast='integer')
+    df['Day of Week'] = df['Day of Week'].astype(encoding.DAY_OF_WEEK_DTYPE)
+    return df
+
+
+################### STREAMING ###################
+def row_hashes(df):
+    """64-bit hash of every row, independent of how narrow the numeric dtypes are."""
+    numeric = df.select_dtypes('number').columns
+    return pd.util.hash_pandas_object(df.astype(dict.fromkeys(numeric, 'float64')),
+                                      index=False).to_numpy()
+
+
+class SeenRows:
+    """Set of row hashes, kept as one sorted uint64 array (8 bytes per row)."""
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def contains(self, hashes):
+        """Boolean mask: which of ``hashes`` are already in the set."""
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=bool)
+        pos = np.searchsorted(self.hashes, hashes)
+        return self.hashes[np.minimum(pos, len(self.hashes) - 1)] == hashes
+
+    def add(self, hashes):
+        """Add ``hashes``; returns a mask of the ones that are new (first occurrence only)."""
+        new = ~self.contains(hashes) & ~pd.Series(hashes).duplicated().to_numpy()
+        # Appending then sorting an almost-sorted array is close to linear
+        self.hashes = np.sort(np.concatenate([self.hashes, hashes[new]]), kind='stable')
+        return new
+
+
+def clean_chunks(file_path, chunk_rows=CHUNK_ROWS, start_byte=0):
+    """Read and clean a CSV export ``chunk_rows`` rows at a time.
+
+    Yields cleaned chunks. Duplicates are dropped across chunks as well, by
+    remembering the hash of every row kept so far, so memory holds one raw chunk
+    plus 8 bytes per row instead of the whole raw file.
+
+    With ``start_byte`` (the start of a line) only the rows from there on are
+    read, e.g. the ones appended since the last ingest.
+    """
+    seen = SeenRows()
+    with open(file_path, 'rb') as f:
+        if start_byte:
+            names = list(pd.read_csv(file_path, nrows=0).columns)
+            f.seek(start_byte)
+            if not f.read(1).strip():
+                return
+            f.seek(start_byte)
+            reader = pd.read_csv(f, header=None, names=names, chunksize=chunk_rows)
+        else:
+            reader = pd.read_csv(f, chunksize=chunk_rows)
+        for chunk in reader:
+            chunk = clean(chunk)
+            chunk = chunk[seen.add(row_hashes(chunk))]
+            if len(chunk):
+                yield chunk.reset_index(drop=True)
+
+
+def read_csv(file_path, chunk_rows=CHUNK_ROWS):
+    """Cleaned frame for a CSV export, built from ``clean_chunks``."""
+    chunks = list(clean_chunks(file_path, chunk_rows))
+    if not chunks:
+        return clean(pd.read_csv(file_path, nrows=0))
+    return encoding.concat(chunks)
+
+
+################### LOADING ###################
+def load(file_path=None):
+    """Read and clean ridership data. Returns ``(df, stats)``.
+
+    Without ``file_path`` the Parquet cache written by ``python -m utils.ingest``
+    is used when present (already cleaned and typed), else ``FILE_NAME``.
+    """
+    from utils import ingest
+
+    start = time.perf_counter()
+    if file_path is None and ingest.has_cache():
+        source = ingest.CACHE_DIR
+        df = compact(ingest.read_cache())
+    else:
+        source = file_path or os.path.join(DATA_DIR, FILE_NAME)
+        df = read_csv(source)
+    # Sorted by route then day so RouteDayIndex can binary-search date ranges
+    df = sort_by_route_day(df)
+    stats = {
+        'file': os.path.abspath(source),
+        'version': fingerprint(source),
+        'rows': len(df),
+        'load_seconds': time.perf_counter() - start,
+        'memory_bytes': int(df.memory_usage(deep=True).sum()),
+    }
+    return df, stats
+
+
+def fingerprint(source):
+    """Short version id for the data behind ``source`` (a CSV or the Parquet cache)."""
+    from utils import ingest
+
+    digest = hashlib.sha1()
+    if os.path.isdir(source):
+        for name, entry in sorted(ingest.load_manifest(source)['files'].items()):
+            digest.update(f"{name}:{entry['sha256']}".encode())
+    else:
+        stat = os.stat(source)
+        digest.update(f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime}".encode())
+    return digest.hexdigest()[:12]
+
+
+################### SNAPSHOTS ###################
+class Snapshot:
+    """One version of the data: the frame plus the index and cube built from it.
+
+    Snapshots are never modified. A refresh builds a new one and swaps it in
+    (``swap``), so a callback keeps a consistent view of whichever snapshot it
+    picked up, even if new data arrives while it runs.
+    """
+
+    def __init__(self, df, stats, cube=None, capacity=None):
+        self.df = df
+        self.stats = stats
+        self.index = RouteDayIndex(df)
+        self._cube = cube
+        self._capacity = capacity
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.stats['version']
+
+    @property
+    def cube(self):
+        """The aggregate cube (``utils/cube.py``), built on first use."""
+        if self._cube is None:
+            with self._lock:
+                if self._cube is None:
+                    start = time.perf_counter()
+                    cube = RidershipCube.build(self.df)
+                    self.stats['cube_seconds'] = time.perf_counter() - start
+                    logger.info("Built ridership cube in %.2fs", self.stats['cube_seconds'])
+                    self._cube = cube
+        return self._cube
+
+    @property
+    def capacity(self):
+        """The load-factor bins (``utils/capacity.py``), built on first use."""
+        if self._capacity is None:
+            with self._lock:
+                if self._capacity is None:
+                    start = time.perf_counter()
+                    capacity = CapacityCube.build(self.df)
+                    self.stats['capacity_seconds'] = time.perf_counter() - start
+                    logger.info("Built capacity bins in %.2fs", self.stats['capacity_seconds'])
+                    self._capacity = capacity
+        return self._capacity
+
+    def extend(self, rows, version):
+        """New snapshot with the cleaned ``rows`` added.
+
+        Only ``rows`` are aggregated; the result is merged into the existing cube.
+        """
+        start = time.perf_counter()
+        df = sort_by_route_day(encoding.concat([self.df, rows]))
+        cube = self.cube.merge(RidershipCube.build(rows))
+        # Not built yet: left to be built from the whole frame on first use
+        capacity = self._capacity.merge(CapacityCube.build(rows)) if self._capacity is not None else None
+        stats = dict(self.stats, version=version, rows=len(df),
+                     memory_bytes=int(df.memory_usage(deep=True).sum()),
+                     refresh_rows=len(rows), refresh_seconds=time.perf_counter() - start)
+        return Snapshot(df, stats, cube, capacity)
+
+
+def current():
+    """The snapshot to answer a callback from, loading the data on first use.
+
+    Frames in it are read-only by contract: filter or copy them, never assign into them.
+    """
+    global _snapshot
+    if _snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                df, stats = load()
+                logger.info("Loaded %d ridership rows from %s in %.2fs (%.1f MB)",
+                            stats['rows'], stats['file'], stats['load_seconds'],
+                            stats['memory_bytes'] / 1e6)
+                _snapshot = Snapshot(df, stats)
+    return _snapshot
+
+
+def swap(snapshot):
+    """Make ``snapshot`` current. Callbacks already running keep the one they had."""
+    global _snapshot
+    snapshot.cube  # built before anyone can see the snapshot
+    with _lock:
+        _snapshot = snapshot
+    logger.info("Swapped in dataset version %s (%d rows)", snapshot.version, snapshot.stats['rows'])
+
+
+def reload():
+    """Re-read everything (after an export was replaced or removed) and swap it in."""
+    swap(Snapshot(*load()))
+
+
+def get_df():
+    """Return the current ridership frame (read-only, see ``current``)."""
+    return current().df
+
+
+def get_index():
+    """Return the ``RouteDayIndex`` over the current frame."""
+    return current().index
+
+
+def get_cube():
+    """Return the aggregate cube (``utils/cube.py``) of the current frame."""
+    return current().cube
+
+
+def get_capacity():
+    """Return the load-factor bins (``utils/capacity.py``) of the current frame."""
+    return current().capacity
+
+
+def get_version():
+    """Version id of the loaded data; changes whenever the underlying files do."""
+    return current().version
+
+
+def get_stats():
+    """Load time and memory footprint of the current frame."""
+    return dict(current().stats)
@@ -0,0 +1,137 @@
+"""Calendar dimension: semester, month, week and weekday of each date.
+
+Rows carry their date as an int32 day number (``utils/encoding.py``). The
+calendar attributes of those days are computed once per distinct day into a
+small table indexed by day number, and rows are joined to it by that key
+(``Calendar.codes``), so the charts group on integer codes instead of building
+periods and strings row by row.
+
+Codes are:
+
+- Semester: ``year * len(TERMS) + term``, in date order
+- Month: ``year * 12 + month - 1``
+- Week: day number of the Monday the (ISO) week starts on
+- Weekday: 0 (Monday) to 6 (Sunday), as ``encoding.DAYS_OF_WEEK``
+
+Academic terms are set in ``TERMS``: each term's name and the month and day it
+starts on, in order through the year. A term runs until the next one starts;
+the last one runs into the next year until the first one starts again.
+"""
+import numpy as np
+import pandas as pd
+
+from utils import encoding
+
+TERMS = [('Spring', 1, 1), ('Fall', 6, 1)]
+
+COLUMNS = ['Semester', 'Month', 'Week', 'Weekday']
+
+
+################### TERMS ###################
+def _term_starts(years):
+    """Day numbers of every term start in ``years``, as a (year, term) grid."""
+    starts = [pd.to_datetime({'year': years, 'month': month, 'day': day})
+              for _, month, day in TERMS]
+    return np.stack([encoding.to_day_numbers(start) for start in starts], axis=1)
+
+
+def semesters(day_numbers):
+    """Semester code of each day number."""
+    dates = encoding.to_dates(day_numbers)
+    years = np.asarray(dates.year)
+    starts = _term_starts(years)
+    term = (np.asarray(day_numbers)[:, None] >= starts).sum(axis=1) - 1
+    # Before the first term starts: still in last year's last term
+    return years * len(TERMS) + term
+
+
+def semester_bounds(code):
+    """First and last day (Timestamps) of a semester."""
+    year, term = divmod(int(code), len(TERMS))
+    _, month, day = TERMS[term]
+    start = pd.Timestamp(year=year, month=month, day=day)
+    if term + 1 < len(TERMS):
+        _, month, day = TERMS[term + 1]
+        end = pd.Timestamp(year=year, month=month, day=day)
+    else:
+        _, month, day = TERMS[0]
+        end = pd.Timestamp(year=year + 1, month=month, day=day)
+    return start, end - pd.Timedelta(days=1)
+
+
+def semester_label(code):
+    """``'Spring 2024'``"""
+    year, term = divmod(int(code), len(TERMS))
+    return f'{TERMS[term][0]} {year}'
+
+
+def semester_key(code):
+    """``'2024-Spring'`` (cache partitions)"""
+    year, term = divmod(int(code), len(TERMS))
+    return f'{year}-{TERMS[term][0]}'
+
+
+def month_label(code):
+    """``'September 2024'``"""
+    year, month = divmod(int(code), 12)
+    return pd.Timestamp(year=year, month=month + 1, day=1).strftime('%B %Y')
+
+
+def week_label(code):
+    """``'2024-09-02'`` (the Monday)"""
+    return encoding.to_date(code).strftime('%Y-%m-%d')
+
+
+################### CALENDAR ###################
+class Calendar:
+    """Calendar codes of every day from ``first`` to ``last`` (day numbers)."""
+
+    def __init__(self, first, last):
+        self.first, self.last = int(first), int(last)
+        days = np.arange(self.first, self.last + 1, dtype=np.int64)
+        dates = encoding.to_dates(days)
+        weekday = (days + 3) % 7  # 1970-01-01 was a Thursday
+        self.table = pd.DataFrame({
+            'Semester': semesters(days).astype(np.int32),
+            'Month': (np.asarray(dates.year) * 12 + np.asarray(dates.month) - 1).astype(np.int32),
+            'Week': (days - weekday).astype(np.int32),
+            'Weekday': weekday.astype(np.int8),
+        }, index=pd.Index(days.astype(np.int32), name='Day'))
+
+    def covers(self, first, last):
+        return self.first <= first and last <= self.last
+
+    def codes(self, column, day_numbers):
+        """``column`` codes of each day number (all within the calendar)."""
+        return self.table[column].to_numpy()[np.asarray(day_numbers, dtype=np.int64) - self.first]
+
+    def join(self, rows, columns=COLUMNS):
+        """``rows`` with the calendar ``columns`` of their Day added."""
+        return rows.assign(**{column: self.codes(column, rows['Day']) for column in columns})
+
+
+_calendar = None
+
+
+def get(first, last):
+    """A ``Calendar`` covering day numbers ``first`` to ``last``.
+
+    The last one built is reused and only rebuilt (wider) when a range falls
+    outside it.
+    """
+    global _calendar
+    first, last = int(first), int(last)
+    calendar = _calendar
+    if calendar is None or not calendar.covers(first, last):
+        if calendar is not None:
+            first, last = min(first, calendar.first), max(last, calendar.last)
+        calendar = _calendar = Calendar(first, last)
+    return calendar
+
+
+def for_days(day_numbers):
+    """A ``Calendar`` covering every day number in ``day_numbers``."""
+    day_numbers = np.asarray(day_numbers)
+    if not len(day_numbers):
+        return get(0, 0)
+    return get(day_numbers.min(), day_numbers.max())
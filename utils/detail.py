@@ -0,0 +1,50 @@
+"""Level of detail for the charts over long date ranges.
+
+A bar with a text label per day is fine for a few weeks. Over years it means
+thousands of SVG bars, a payload of several MB and a slow browser. Past
+``MAX_BARS`` bars the daily chart (and, in the browser, the weekly chart)
+switches to a WebGL line with no text. Past ``MAX_POINTS`` points the line is
+downsampled, keeping the lowest and highest value of each bucket so peaks and
+dips still show.
+
+Zooming in (a ``relayoutData`` x range, turned into a window by
+``zoom_window`` in ``assets/time_charts.js``) redraws the visible dates only,
+as bars again once few enough are left.
+"""
+import numpy as np
+
+from utils import encoding
+
+MAX_BARS = 120
+MAX_POINTS = 1000
+
+
+def is_detailed(n_bars):
+    """True if ``n_bars`` bars can be drawn as bars with text."""
+    return n_bars <= MAX_BARS
+
+
+def day_window(window):
+    """``(first, last)`` day numbers of a ``[start, end]`` zoom window, or None."""
+    if not window:
+        return None
+    start, end = sorted(window)
+    return encoding.to_day_number(start), encoding.to_day_number(end)
+
+
+def peak_indices(values, max_points=MAX_POINTS):
+    """Sorted positions to keep so at most ``max_points`` points are left.
+
+    The values are split into ``max_points // 2`` buckets of consecutive points;
+    each keeps its lowest and highest one.
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    values = np.asarray(values)
+    edges = np.linspace(0, n, max_points // 2 + 1).astype(np.int64)
+    keep = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        bucket = values[start:end]
+        keep += [start + bucket.argmin(), start + bucket.argmax()]
+    return np.unique(keep)
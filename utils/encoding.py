@@ -0,0 +1,136 @@
+"""Compact encodings used by the loaded dataset.
+
+Dates are stored as int32 day numbers (days since 1970-01-01) and times of day
+as int32 seconds since midnight, so filters and group-bys run on plain
+integers. These helpers convert query values in, and labels back out when a
+figure is built.
+"""
+import numpy as np
+import pandas as pd
+
+DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DAY_OF_WEEK_DTYPE = pd.CategoricalDtype(DAYS_OF_WEEK, ordered=True)
+
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+# Stored for times that are missing in the export
+MISSING_TIME = -1
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+################### DATES ###################
+def to_day_numbers(dates):
+    """Day numbers (int32) for a datetime-like array or Series."""
+    days = pd.to_datetime(dates).to_numpy().astype('datetime64[D]')
+    return (days - _EPOCH).astype(np.int32)
+
+
+def to_day_number(date):
+    """Day number of one date (``'2024-09-03'``, a Timestamp, ...)."""
+    return int((np.datetime64(pd.Timestamp(date).date(), 'D') - _EPOCH).astype(np.int64))
+
+
+def to_dates(day_numbers):
+    """``DatetimeIndex`` for an array of day numbers."""
+    return pd.DatetimeIndex(_EPOCH + np.asarray(day_numbers, dtype='timedelta64[D]'))
+
+
+def to_date(day_number):
+    """``Timestamp`` for one day number."""
+    return pd.Timestamp(_EPOCH + np.timedelta64(int(day_number), 'D'))
+
+
+def day_of_week(day_numbers):
+    """Weekday names (categorical, Monday first) for an array of day numbers."""
+    # 1970-01-01 was a Thursday
+    codes = (np.asarray(day_numbers, dtype=np.int64) + 3) % 7
+    return pd.Categorical.from_codes(codes, dtype=DAY_OF_WEEK_DTYPE)
+
+
+################### TIMES ###################
+def _parse_unique(text, parse, missing):
+    """``parse`` applied to each distinct string of ``text`` only (an export repeats
+    the same few dates and times), spread back over every row; ``missing`` for NaN."""
+    codes, uniques = pd.factorize(pd.Series(text, dtype=object))
+    parsed = np.append(np.asarray(parse(pd.Series(uniques, dtype=object)), dtype=np.float64), missing)
+    return parsed[codes]  # code -1 (NaN) picks the appended ``missing``
+
+
+def _day_numbers(dates):
+    parsed = pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce')
+    return (parsed - pd.Timestamp(_EPOCH)).dt.days  # NaN where unparseable
+
+
+def _clock_seconds(clock):
+    parsed = pd.to_datetime(clock, format='%H:%M:%S', errors='coerce')
+    return (parsed - parsed.dt.normalize()).dt.total_seconds()
+
+
+def to_seconds(times):
+    """Seconds since midnight (int32) from 'YYYY-MM-DD HH:MM:SS' or 'HH:MM:SS' strings."""
+    clock = pd.Series(times, dtype=object).str.slice(-8)
+    seconds = _parse_unique(clock, _clock_seconds, MISSING_TIME)
+    return np.nan_to_num(seconds, nan=MISSING_TIME).astype(np.int32)
+
+
+def to_epoch_seconds(timestamps, day_numbers):
+    """Seconds since 1970-01-01 (float64, NaN when missing) of full timestamps.
+
+    Takes 'YYYY-MM-DD HH:MM:SS' strings; 'HH:MM:SS' ones are put on the day in
+    ``day_numbers``. Differences of these are right across midnight, unlike
+    differences of ``to_seconds``.
+    """
+    timestamps = pd.Series(np.asarray(timestamps, dtype=object))
+    seconds = to_seconds(timestamps)
+    dates = timestamps.str.slice(0, -9)
+    days = _parse_unique(dates, _day_numbers, np.nan)
+    days = np.where(np.isnan(days), np.asarray(day_numbers, dtype=np.float64), days)
+    return np.where(seconds == MISSING_TIME, np.nan, days * SECONDS_PER_DAY + seconds)
+
+
+def to_seconds_of_day(epoch_seconds):
+    """Seconds since midnight (int32, ``MISSING_TIME`` when NaN) of ``to_epoch_seconds`` values."""
+    seconds = np.mod(epoch_seconds, SECONDS_PER_DAY)
+    return np.nan_to_num(seconds, nan=MISSING_TIME).astype(np.int32)
+
+
+def time_labels(seconds):
+    """'HH:MM:SS' labels for an array of seconds since midnight."""
+    seconds = np.asarray(seconds, dtype=np.int64)
+    hours, rest = np.divmod(seconds, 3600)
+    minutes, secs = np.divmod(rest, 60)
+    return [f'{h:02d}:{m:02d}:{s:02d}' for h, m, s in zip(hours, minutes, secs)]
+
+
+################### LABELS ###################
+def labeled(frame):
+    """Copy of a (small, aggregated) frame with plain labels for plotting.
+
+    Categoricals become strings and day numbers in ``Day`` become datetimes.
+    """
+    frame = frame.copy()
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype(object)
+    if 'Day' in frame.columns:
+        frame['Day'] = to_dates(frame['Day'])
+    return frame
+
+
+def concat(frames):
+    """``pd.concat`` that keeps categorical columns categorical.
+
+    Frames cleaned separately (CSV chunks, a day of new rows) have different
+    category lists, which plain ``concat`` would turn into strings. A column
+    that is categorical in the first frame but text in another (the shared
+    frame of ``utils/shared.py``) is made categorical too.
+    """
+    frames = list(frames)
+    for column, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and not dtype.ordered:
+            frames = [frame.assign(**{column: frame[column].astype('category')}) for frame in frames]
+            categories = sorted(set().union(*(frame[column].cat.categories for frame in frames)))
+            frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)})
+                      for frame in frames]
+    return pd.concat(frames, ignore_index=True)
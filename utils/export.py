@@ -0,0 +1,193 @@
+"""Downloads of the filtered stop events and the aggregations, as CSV or Parquet.
+
+    /export/events.csv?route=Airport%20Link&start_date=2024-09-01&end_date=2024-12-20&day=Weekend
+    /export/aggregations/day.parquet?route=Airport%20Link&calc=Average
+
+The parameters and aggregations are the JSON API's (``utils/api.py``). The
+response is streamed: rows are labelled and written ``CHUNK_ROWS`` at a time
+and sent as they are written, so exporting a year of stop events never holds
+the whole file in memory. Parquet needs ``pyarrow``.
+
+The pages link to these URLs (``url``) instead of returning files from a
+callback, which would build the whole file in the worker first.
+"""
+import urllib.parse
+
+import flask
+import numpy as np
+import pandas as pd
+
+from utils import api, backend, cube, encoding
+
+CHUNK_ROWS = 100_000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Times of day kept as seconds since midnight in memory, written as 'HH:MM:SS'
+TIME_COLUMNS = ['Scheduled Time', 'Actual Arrival', 'Actual Departure']
+
+# Style of the download links on the pages
+LINK_STYLE = {'font-family': 'Segoe UI', 'margin-right': '2em'}
+
+
+################### ROWS ###################
+def _labels(values, label):
+    """``label`` applied to each distinct value only (few days and times, many rows)."""
+    distinct, inverse = np.unique(values, return_inverse=True)
+    return np.asarray(label(distinct), dtype=object)[inverse]
+
+
+def _labeled_events(rows):
+    """Stop events as written: dates, times of day and labels as text."""
+    rows = rows.drop(columns=['Day of Week'])  # 'Day Of Week' is the export's own
+    rows = rows.astype({c: object for c, dtype in rows.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)})
+    rows['Day'] = _labels(rows['Day'], lambda days: encoding.to_dates(days).strftime('%Y-%m-%d'))
+    for column in TIME_COLUMNS:
+        seconds = rows[column].to_numpy()
+        rows[column] = np.where(seconds != encoding.MISSING_TIME, _labels(seconds, encoding.time_labels), None)
+    return rows
+
+
+def event_chunks(query, chunk_rows=CHUNK_ROWS):
+    """Stop events of a query (``api.parse``), route by route, ``chunk_rows`` at a time.
+
+    Always yields at least one (possibly empty) frame, so the columns are known.
+    """
+    empty = None
+    for rows in backend.get().event_batches(query['route'], query['start_date'], query['end_date'],
+                                            query['day'], chunk_rows):
+        if len(rows):
+            yield _labeled_events(rows)
+        elif empty is None:
+            empty = rows
+    if empty is not None:
+        yield _labeled_events(empty)
+
+
+def aggregate_chunks(name, query, chunk_rows=CHUNK_ROWS):
+    frame = api.aggregate(name, query)
+    for start in range(0, max(len(frame), 1), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+################### FORMATS ###################
+def _csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+
+
+class _Sink:
+    """Write-only file the Parquet writer writes to; ``take`` hands out what it wrote since."""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _parquet_schema(frame):
+    import pyarrow as pa
+
+    # Text columns as strings even when a chunk has only missing values
+    return pa.schema([(column, pa.string() if dtype == object else pa.from_numpy_dtype(dtype))
+                      for column, dtype in frame.dtypes.items()])
+
+
+def _parquet(chunks):
+    """One row group per chunk, each sent as soon as it is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _Sink()
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), _parquet_schema(chunk))
+        writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+################### ENDPOINTS ###################
+blueprint = flask.Blueprint('export', __name__, url_prefix='/export')
+
+
+def url(path, fmt, route=None, start_date=None, end_date=None, day=None, calc=None):
+    """Download URL for ``path`` (``events`` or ``aggregations/<name>``) and the pages' filter values."""
+    params = {'route': route, 'start_date': start_date, 'end_date': end_date}
+    if isinstance(day, list):
+        params['day'] = 'Weekend'
+    elif day:
+        params['day'] = day
+    if calc:
+        params['calc'] = 'Average' if cube.is_average(calc) else 'Sum'
+    query = urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+    return f'{blueprint.url_prefix}/{path}.{fmt}?{query}'
+
+
+def _filename(name, query, fmt):
+    parts = [name, query['route'] or 'all-routes', query['start_date'], query['end_date']]
+    return '-'.join(str(part).replace(' ', '-') for part in parts) + '.' + fmt
+
+
+def _download(chunks, name, query, fmt):
+    if fmt not in FORMATS:
+        return api.error(f"Unknown format: {fmt!r}. Formats: {', '.join(FORMATS)}", 404)
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return api.error("Parquet export needs pyarrow (pip install pyarrow)", 501)
+    write = _csv if fmt == 'csv' else _parquet
+    return flask.Response(flask.stream_with_context(write(chunks)), mimetype=FORMATS[fmt],
+                          headers={'Content-Disposition': f'attachment; filename="{_filename(name, query, fmt)}"'})
+
+
+def _query():
+    return api.parse(flask.request.args.to_dict())
+
+
+@blueprint.route('/events.<fmt>')
+def events_endpoint(fmt):
+    try:
+        query = _query()
+    except api.QueryError as e:
+        return api.error(str(e))
+    return _download(event_chunks(query), 'events', query, fmt)
+
+
+@blueprint.route('/aggregations/<name>.<fmt>')
+def aggregation_endpoint(name, fmt):
+    if name not in api.AGGREGATIONS:
+        return api.error(f"Unknown aggregation: {name!r}. Aggregations: {', '.join(api.AGGREGATIONS)}", 404)
+    try:
+        query = _query()
+    except api.QueryError as e:
+        return api.error(str(e))
+    return _download(aggregate_chunks(name, query), name, query, fmt)
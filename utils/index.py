@@ -0,0 +1,73 @@
+"""Route/date index over frames sorted by (Route, Day), with ``Day`` as day numbers.
+
+Each route's rows form one contiguous block, sorted by day, so a route and
+date range resolve to a row range with two binary searches and come back as an
+``iloc`` slice (a view, no copy). Filter cost scales with the result, not with
+the size of the whole frame.
+"""
+import numpy as np
+import pandas as pd
+
+from utils import encoding, metrics
+
+
+def sort_by_route_day(df):
+    """Stable-sort ``df`` by route then day, as ``RouteDayIndex`` expects."""
+    return df.sort_values(['Route', 'Day'], kind='stable').reset_index(drop=True)
+
+
+def day_mask(days_of_week, selected_day):
+    """Boolean mask for the day-of-week selector ('Everyday', a day, or a list of days)."""
+    if isinstance(selected_day, list):  # 'Weekend'
+        return days_of_week.isin(selected_day)
+    if selected_day in (None, 'Everyday'):
+        return pd.Series(True, index=days_of_week.index)
+    return days_of_week == selected_day
+
+
+class RouteDayIndex:
+    """Row ranges per route over a frame already sorted by (Route, Day)."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.days = frame['Day'].to_numpy()
+        routes = frame['Route'].to_numpy()
+
+        # One (start, end) row range per run of equal routes
+        self.ranges = {}
+        if len(routes):
+            starts = np.flatnonzero(np.r_[True, routes[1:] != routes[:-1]])
+            ends = np.r_[starts[1:], len(routes)]
+            for lo, hi in zip(starts, ends):
+                if not pd.isna(routes[lo]):
+                    self.ranges[routes[lo]] = (int(lo), int(hi))
+
+    @property
+    def routes(self):
+        return list(self.ranges)
+
+    def _to_day(self, date):
+        return encoding.to_day_number(date)
+
+    def bounds(self, route, start_date=None, end_date=None):
+        """``(lo, hi)`` row range of ``route`` between the two dates (inclusive)."""
+        lo, hi = self.ranges.get(route, (0, 0))
+        days = self.days[lo:hi]
+        if end_date is not None:
+            hi = lo + int(np.searchsorted(days, self._to_day(end_date), side='right'))
+        if start_date is not None:
+            lo = lo + int(np.searchsorted(days, self._to_day(start_date), side='left'))
+        return lo, max(lo, hi)
+
+    def slice(self, route=None, start_date=None, end_date=None, selected_day=None):
+        """Rows for a route (or every route) and date range, optionally one day selection."""
+        if route is None:
+            parts = [self.frame.iloc[slice(*self.bounds(r, start_date, end_date))] for r in self.ranges]
+            rows = pd.concat(parts) if parts else self.frame.iloc[0:0]
+        else:
+            rows = self.frame.iloc[slice(*self.bounds(route, start_date, end_date))]
+
+        if selected_day not in (None, 'Everyday'):
+            rows = rows[day_mask(rows['Day of Week'], selected_day)]
+        metrics.count_rows(len(rows))
+        return rows
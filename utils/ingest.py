@@ -0,0 +1,364 @@
+"""Ingest vendor CSV exports into a partitioned Parquet cache.
+
+Usage (from the repository root)::
+
+    python -m utils.ingest                 # every CSV in data/
+    python -m utils.ingest data/Fall2024_RidershipData.csv --force
+
+Each export is streamed through ``dataset.clean_chunks`` (a bounded number of
+rows at a time) and appended to
+``data/cache/route=<route>/semester=<year>-<term>/<export>.parquet``, so memory
+use depends on the chunk size, not the size of the export. A manifest
+records the size, mtime and SHA-256 of every ingested export, so unchanged
+files are skipped on the next run. Rows already ingested from another export
+(overlapping date ranges) are dropped so they are not counted twice.
+
+The dashboard reads the cache instead of the CSV when it exists, and
+``read_cache`` only opens the partitions a route/date range query touches.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from utils import dataset, dates, encoding
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(dataset.DATA_DIR, 'cache')
+# Bumped whenever dataset.clean() changes what it writes; older caches are rebuilt
+CACHE_FORMAT = 4
+# Leading underscore keeps pyarrow from treating the manifest as a data file
+MANIFEST_NAME = '_manifest.json'
+
+
+################### SEMESTERS ###################
+def semester_keys(days):
+    """Partition key (``'2024-Spring'``/``'2024-Fall'``) for each day number in ``days``."""
+    codes = dates.for_days(days).codes('Semester', days)
+    uniques, inverse = np.unique(codes, return_inverse=True)
+    keys = np.array([dates.semester_key(code) for code in uniques], dtype=object)
+    return pd.Index(keys[inverse])
+
+
+def semester_ranges(start_date, end_date):
+    """``(key, first day, last day)`` of every semester a date range touches."""
+    first, last = dates.semesters([encoding.to_day_number(start_date), encoding.to_day_number(end_date)])
+    return [(dates.semester_key(code), *dates.semester_bounds(code)) for code in range(first, last + 1)]
+
+
+def semesters_between(start_date, end_date):
+    """Every semester key a date range touches."""
+    return [key for key, _, _ in semester_ranges(start_date, end_date)]
+
+
+################### MANIFEST ###################
+def _manifest_path(cache_dir):
+    return os.path.join(cache_dir, MANIFEST_NAME)
+
+
+def load_manifest(cache_dir=CACHE_DIR):
+    try:
+        with open(_manifest_path(cache_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'format': CACHE_FORMAT, 'files': {}}
+
+
+def _save_manifest(manifest, cache_dir):
+    path = _manifest_path(cache_dir)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _sha256_with_prefix(path, prefix_size, block_size=1 << 20):
+    """``(SHA-256 of the file, SHA-256 of its first prefix_size bytes)`` in one read."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        remaining = prefix_size
+        while remaining:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+        prefix = digest.hexdigest()
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest(), prefix
+
+
+def _ends_line(path, offset):
+    with open(path, 'rb') as f:
+        f.seek(offset - 1)
+        return f.read(1) == b'\n'
+
+
+def has_cache(cache_dir=CACHE_DIR):
+    manifest = load_manifest(cache_dir)
+    return manifest.get('format') == CACHE_FORMAT and bool(manifest['files'])
+
+
+################### WRITING ###################
+def _partition_dir(cache_dir, route, semester):
+    return os.path.join(cache_dir, f'route={quote(route, safe="")}', f'semester={semester}')
+
+
+def _remove_parts(entry, cache_dir):
+    for part in entry.get('parts', []):
+        try:
+            os.remove(os.path.join(cache_dir, part))
+        except FileNotFoundError:
+            pass
+
+
+def _storage_schema(df):
+    """Fixed Parquet schema for cleaned rows, so every chunk of an export matches.
+
+    Labels are written as strings and counts as int32; ``dataset.compact``
+    restores the narrow in-memory dtypes on read.
+    """
+    import pyarrow as pa
+
+    fields = []
+    for column, dtype in df.dtypes.items():
+        if column in dataset.COUNT_COLUMNS:
+            arrow_type = pa.int32()
+        elif isinstance(dtype, pd.CategoricalDtype) or dtype == object:
+            arrow_type = pa.string()
+        else:
+            arrow_type = pa.from_numpy_dtype(dtype)
+        fields.append((column, arrow_type))
+    return pa.schema(fields)
+
+
+def _to_storage(rows):
+    """Cleaned rows with labels as plain strings, as they are stored (and hashed)."""
+    return rows.astype({c: object for c, dtype in rows.dtypes.items()
+                        if isinstance(dtype, pd.CategoricalDtype)})
+
+
+def _write_export(path, cache_dir, chunk_rows=dataset.CHUNK_ROWS, start_byte=0, part_name=None):
+    """Stream one export into its route/semester partitions. Returns ``(rows, part paths)``.
+
+    ``start_byte``/``part_name`` write only the rows from that offset on, to
+    parts of their own (see ``ingest``'s handling of appended exports).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    own_file = (part_name or os.path.splitext(os.path.basename(path))[0]) + '.parquet'
+    ingested = dataset.SeenRows()  # rows other exports already wrote to our partitions
+    writers = {}
+    rows_written = 0
+    try:
+        for chunk in dataset.clean_chunks(path, chunk_rows, start_byte):
+            chunk = _to_storage(chunk)
+            for (route, semester), rows in chunk.groupby([chunk['Route'], semester_keys(chunk['Day'])], sort=True):
+                partition_dir = _partition_dir(cache_dir, route, semester)
+                if partition_dir not in writers:
+                    os.makedirs(partition_dir, exist_ok=True)
+                    for other in glob.glob(os.path.join(partition_dir, '*.parquet')):
+                        if os.path.basename(other) != own_file:
+                            ingested.add(dataset.row_hashes(pd.read_parquet(other)))
+                    writers[partition_dir] = None
+                rows = rows[~ingested.contains(dataset.row_hashes(rows))]
+                if rows.empty:
+                    continue
+                if writers[partition_dir] is None:
+                    writers[partition_dir] = pq.ParquetWriter(os.path.join(partition_dir, own_file),
+                                                              _storage_schema(chunk))
+                writer = writers[partition_dir]
+                writer.write_table(pa.Table.from_pandas(rows, schema=writer.schema, preserve_index=False))
+                rows_written += len(rows)
+    finally:
+        for writer in writers.values():
+            if writer is not None:
+                writer.close()
+
+    parts = sorted(os.path.relpath(os.path.join(partition_dir, own_file), cache_dir)
+                   for partition_dir, writer in writers.items() if writer is not None)
+    return rows_written, parts
+
+
+def ingest(paths=None, cache_dir=CACHE_DIR, force=False, chunk_rows=dataset.CHUNK_ROWS):
+    """Ingest ``paths`` (default: every CSV in ``data/``) into the Parquet cache.
+
+    Returns a ``{file name: 'ingested' | 'appended' | 'unchanged' | 'removed'}``
+    report. An export that only grew at the end (the vendor appended new days)
+    is 'appended': just the new rows are read, into extra parts.
+    """
+    prune = paths is None
+    if paths is None:
+        paths = sorted(glob.glob(os.path.join(dataset.DATA_DIR, '*.csv')))
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = load_manifest(cache_dir)
+    if manifest.get('format') != CACHE_FORMAT:
+        # Written by an older dataset.clean(): start the cache over
+        for old in glob.glob(os.path.join(cache_dir, 'route=*')):
+            shutil.rmtree(old)
+        manifest = {'format': CACHE_FORMAT, 'files': {}}
+    files = manifest['files']
+    report = {}
+
+    # Work out which exports need (re)writing
+    stale = {}
+    appended = {}
+    for path in paths:
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        entry = files.get(name)
+        if entry and not force and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            report[name] = 'unchanged'
+            continue
+        grown = entry and not force and stat.st_size > entry['size']
+        if grown:
+            sha256, prefix = _sha256_with_prefix(path, entry['size'])
+        else:
+            sha256, prefix = file_sha256(path), None
+        if entry and not force and entry['sha256'] == sha256:
+            # Touched but identical: remember the new mtime and move on
+            entry['mtime'] = stat.st_mtime
+            report[name] = 'unchanged'
+            continue
+        if grown and prefix == entry['sha256'] and _ends_line(path, entry['size']):
+            # Same file with rows added at the end: only those need reading
+            appended[name] = (path, sha256)
+            continue
+        stale[name] = (path, sha256)
+
+    removed = []
+    if prune:
+        present = {os.path.basename(p) for p in paths}
+        removed = sorted(set(files) - present)
+
+    # Another export sharing a partition may have skipped rows that only the
+    # replaced/removed export held, so it has to be rewritten as well.
+    touched = {os.path.dirname(part)
+               for name in list(stale) + removed if name in files
+               for part in files[name]['parts']}
+    for name, entry in files.items():
+        if (name not in stale and name not in removed and os.path.exists(entry['path'])
+                and touched.intersection(os.path.dirname(part) for part in entry['parts'])):
+            stale[name] = appended.pop(name, None) or (entry['path'], entry['sha256'])
+
+    for name in removed:
+        _remove_parts(files.pop(name), cache_dir)
+        report[name] = 'removed'
+    for name in stale:
+        if name in files:
+            _remove_parts(files[name], cache_dir)
+
+    for name, (path, sha256) in stale.items():
+        start = time.perf_counter()
+        stat = os.stat(path)
+        rows, parts = _write_export(path, cache_dir, chunk_rows)
+        files[name] = {
+            'path': os.path.abspath(path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': sha256,
+            'rows': rows,
+            'parts': parts,
+        }
+        _save_manifest(manifest, cache_dir)
+        report[name] = 'ingested'
+        logger.info("Ingested %s: %d rows into %d partitions in %.2fs",
+                    name, rows, len(parts), time.perf_counter() - start)
+
+    for name, (path, sha256) in appended.items():
+        start = time.perf_counter()
+        entry = files[name]
+        stat = os.stat(path)
+        appends = entry.get('appends', 0) + 1
+        part_name = f'{os.path.splitext(name)[0]}.{appends}'
+        rows, parts = _write_export(path, cache_dir, chunk_rows, start_byte=entry['size'], part_name=part_name)
+        entry.update(size=stat.st_size, mtime=stat.st_mtime, sha256=sha256, appends=appends,
+                     rows=entry['rows'] + rows, parts=sorted(set(entry['parts']) | set(parts)))
+        _save_manifest(manifest, cache_dir)
+        report[name] = 'appended'
+        logger.info("Appended %d new rows of %s into %d partitions in %.2fs",
+                    rows, name, len(parts), time.perf_counter() - start)
+
+    _save_manifest(manifest, cache_dir)
+    return report
+
+
+################### READING ###################
+# Columns read back as pandas categoricals
+_LABELS = dataset.CATEGORICAL_COLUMNS + ['Day of Week']
+
+
+def read_cache(cache_dir=CACHE_DIR, routes=None, start_date=None, end_date=None):
+    """Read cleaned rows back from the cache.
+
+    Only the partitions for ``routes`` and the semesters between ``start_date``
+    and ``end_date`` are opened; rows are then trimmed to the exact dates.
+    """
+    import pyarrow.dataset as ds
+
+    source = ds.dataset(cache_dir, format='parquet', partitioning='hive')
+    condition = None
+
+    def both(a, b):
+        return b if a is None else a & b
+
+    if routes is not None:
+        condition = both(condition, ds.field('route').isin(list(routes)))
+    if start_date is not None or end_date is not None:
+        start = pd.Timestamp(start_date) if start_date is not None else pd.Timestamp.min
+        end = pd.Timestamp(end_date) if end_date is not None else pd.Timestamp.max
+        if start_date is not None and end_date is not None:
+            condition = both(condition, ds.field('semester').isin(semesters_between(start, end)))
+        if start_date is not None:
+            condition = both(condition, ds.field('Day') >= encoding.to_day_number(start))
+        if end_date is not None:
+            condition = both(condition, ds.field('Day') <= encoding.to_day_number(end))
+
+    table = source.to_table(filter=condition)
+    return table.drop_columns(['route', 'semester']).to_pandas(categories=_LABELS)
+
+
+def read_parts(parts, cache_dir=CACHE_DIR):
+    """Read the given part files (paths relative to ``cache_dir``), e.g. just-ingested ones."""
+    import pyarrow.dataset as ds
+
+    source = ds.dataset([os.path.join(cache_dir, part) for part in parts], format='parquet')
+    return source.to_table().to_pandas(categories=_LABELS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean ridership CSV exports into the Parquet cache.")
+    parser.add_argument('paths', nargs='*', help="CSV exports to ingest (default: every CSV in data/)")
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help="re-ingest files even if unchanged")
+    parser.add_argument('--chunk-rows', type=int, default=dataset.CHUNK_ROWS,
+                        help="CSV rows read at a time (bounds memory use)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+    report = ingest(args.paths or None, cache_dir=args.cache_dir, force=args.force,
+                    chunk_rows=args.chunk_rows)
+    for name, status in report.items():
+        print(f'{status:>9}  {name}')
+
+
+if __name__ == '__main__':
+    main()
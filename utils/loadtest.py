@@ -0,0 +1,280 @@
+"""Throughput and memory of the multi-worker server (``utils/serve.py``).
+
+    python -m utils.loadtest                          # 1M rows; 1, 4 and 8 workers
+    python -m utils.loadtest --rows 10M --workers 1 2 4 8 --seconds 60
+
+For each worker count the server is started on a synthetic export
+(``utils/synthetic.py``) and ``--clients`` threads replay page views over HTTP
+for ``--seconds``: each picks a page, a random route and a random date range,
+calls the page's filter callback and then its chart callbacks with the
+filter's result, as the browser does. The date ranges are random, so most
+calls miss the result cache.
+
+Reported per worker count: requests per second, median / 95th percentile
+latency, failed requests, and the memory of the server (parent and workers)
+as PSS (proportional set size: each shared page counted once across the
+processes, Linux only), plus the slices kept in shared memory. Each run appends one line per worker count to
+``loadtests.jsonl``.
+"""
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import threading
+import time
+import urllib.request
+
+from utils import dataset, encoding, shared, synthetic
+from utils.benchmark import REPO_DIR, _commit
+
+RESULTS_FILE = os.path.join(REPO_DIR, 'loadtests.jsonl')
+
+DEFAULT_ROWS = '1M'
+DEFAULT_WORKERS = [1, 4, 8]
+DEFAULT_CLIENTS = 16
+DEFAULT_SECONDS = 30
+PORT = 8041
+
+# Date ranges of a page view, in days (None: everything)
+RANGE_DAYS = [7, 30, 120, None]
+
+################### PAGE VIEWS ###################
+# Per page: the filter callback's output, then each chart callback as
+# (output, inputs); FILTER stands for the filter's result
+FILTER = object()
+PAGES = {
+    'time': ('time-filter-store.data', [
+        ('time-aggregate-store.data', {'time-filter-store.data': FILTER}),
+        ('ridership-daily-by-week-graph.figure', {'time-filter-store.data': FILTER, 'date-range-dropdown.value': None,
+                                                  'group-data-dropdown.value': 'By Week',
+                                                  'daily-zoom-store.data': None}),
+    ]),
+    'stops': ('stops-filter-store.data', [
+        ('..top-5-overall-bar-chart.figure...bottom-5-overall-bar-chart.figure..',
+         {'stops-filter-store.data': FILTER, 'riders-selector.value': 'Riders On', 'stop-count-selector.value': 10}),
+        ('..top-stops-dayofweek.figure...bottom-stops-dayofweek.figure..',
+         {'riders-selector.value': 'Riders On', 'stops-filter-store.data': FILTER, 'aggregation-selector.value': 'sum',
+          'stop-count-selector.value': 10}),
+    ]),
+    'capacity': ('capacity-filter-store.data', [
+        ('capacity-day-of-week-graph.figure', {'capacity-filter-store.data': FILTER,
+                                               'capacity-range-slider.value': [80, 150]}),
+        ('capacity-hour-graph.figure', {'capacity-filter-store.data': FILTER, 'capacity-range-slider.value': [80, 150],
+                                        'day-of-week-selector.value': 'Everyday'}),
+        ('denied-boardings-graph.figure', {'capacity-filter-store.data': FILTER,
+                                           'day-of-week-selector.value': 'Everyday'}),
+    ]),
+    'punctuality': ('punctuality-filter-store.data', [
+        ('on-time-hour-graph.figure', {'punctuality-filter-store.data': FILTER}),
+        ('..lateness-stop-graph.figure...dwell-stop-graph.figure..', {'punctuality-filter-store.data': FILTER}),
+        ('lateness-heatmap.figure', {'punctuality-filter-store.data': FILTER, 'lateness-percentile-dropdown.value': 50}),
+    ]),
+}
+
+
+def _prop(name):
+    component, prop = name.rsplit('.', 1)
+    return {'id': component, 'property': prop}
+
+
+def _body(output, inputs):
+    """JSON body of a ``/_dash-update-component`` request."""
+    outputs = [_prop(name) for name in output.strip('.').split('...')]
+    return {
+        'output': output,
+        'outputs': outputs if len(outputs) > 1 else outputs[0],
+        'inputs': [dict(_prop(name), value=value) for name, value in inputs.items()],
+        'changedPropIds': [next(iter(inputs))],
+        'state': [],
+    }
+
+
+def _post(url, body):
+    request = urllib.request.Request(url + '/_dash-update-component', data=json.dumps(body).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+def page_view(url, page, route, start_date, end_date):
+    """Requests of one page view; yields the seconds each took (None if it failed)."""
+    filter_output, charts = PAGES[page]
+    store = _prop(filter_output)
+    inputs = {'route-selector.value': route, 'date-slider.start_date': start_date, 'date-slider.end_date': end_date}
+    start = time.perf_counter()
+    try:
+        filter_data = _post(url, _body(filter_output, inputs))['response'][store['id']][store['property']]
+    except (OSError, KeyError, ValueError):
+        yield None
+        return
+    yield time.perf_counter() - start
+    for output, chart_inputs in charts:
+        chart_inputs = {name: filter_data if value is FILTER else value for name, value in chart_inputs.items()}
+        start = time.perf_counter()
+        try:
+            _post(url, _body(output, chart_inputs))
+        except (OSError, ValueError):
+            yield None
+            continue
+        yield time.perf_counter() - start
+
+
+################### SERVER ###################
+def _serve(path, port, workers):
+    import run
+    from utils import serve
+
+    dataset.swap(dataset.Snapshot(*dataset.load(path)))
+    serve.run(run.app.server, port=port, workers=workers)
+
+
+def _children(pid):
+    children = []
+    for stat in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(stat) as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == pid:
+            children.append(int(stat.split('/')[2]))
+    return children
+
+
+def _pss_mb(pid):
+    """PSS of ``pid`` and its child processes in MB, or None where /proc has no smaps_rollup."""
+    total = 0
+    for process in [pid] + _children(pid):
+        try:
+            with open(f'/proc/{process}/smaps_rollup') as f:
+                total += sum(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+        except OSError:
+            return None
+    return round(total / 1024, 1)
+
+
+def _slice_files_mb():
+    """Slices the workers keep in shared memory (``utils/slices.py``): RAM, but not mapped, so not in the PSS."""
+    files = glob.glob(os.path.join(shared.SHARED_ROOT, 'transitdash-*', 'slices', '**', '*.pkl'), recursive=True)
+    return round(sum(os.path.getsize(path) for path in files) / 1e6, 1)
+
+
+def _wait_until_up(url, timeout=600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url + '/cache/stats', timeout=5):
+                return
+        except OSError:
+            time.sleep(1)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+################### RUNS ###################
+def run_workers(rows, workers, clients=DEFAULT_CLIENTS, seconds=DEFAULT_SECONDS, port=PORT):
+    """Load-test the server with ``workers`` processes. Returns the record written to the results file."""
+    path = synthetic.default_path(rows)
+    df, stats = dataset.load(path)
+    routes = list(df['Route'].cat.categories)
+    first, last = int(df['Day'].min()), int(df['Day'].max())
+    del df
+
+    # Spawned, not forked, so the server doesn't share this process's copy of the data
+    server = multiprocessing.get_context('spawn').Process(target=_serve, args=(path, port, workers))
+    server.start()
+    url = f'http://127.0.0.1:{port}'
+    try:
+        _wait_until_up(url)
+        idle_mb = _pss_mb(server.pid)
+        latencies, failures = [], [0]
+        lock = threading.Lock()
+        stop_at = time.perf_counter() + seconds
+
+        def client(seed):
+            rng = random.Random(seed)
+            while time.perf_counter() < stop_at:
+                days = rng.choice(RANGE_DAYS)
+                start = first if days is None else rng.randint(first, max(first, last - days))
+                end = last if days is None else min(last, start + days - 1)
+                view = page_view(url, rng.choice(list(PAGES)), rng.choice(routes),
+                                 encoding.to_date(start).strftime('%Y-%m-%d'), encoding.to_date(end).strftime('%Y-%m-%d'))
+                for took in view:
+                    with lock:
+                        if took is None:
+                            failures[0] += 1
+                        else:
+                            latencies.append(took)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        loaded_mb = _pss_mb(server.pid)
+        slice_files_mb = _slice_files_mb()
+    finally:
+        server.terminate()
+        server.join()
+
+    latencies.sort()
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'rows': rows,
+        'clean_rows': stats['rows'],
+        'workers': workers,
+        'clients': clients,
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'requests': len(latencies),
+        'failed': failures[0],
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+        'idle_pss_mb': idle_mb,
+        'loaded_pss_mb': loaded_mb,
+        'slice_files_mb': slice_files_mb,
+    }
+
+
+def report(records):
+    print(f"\n{records[0]['rows']:,} rows, {records[0]['clients']} clients, {records[0]['cpus']} CPUs"
+          f" at {records[0]['commit']}")
+    print(f"  {'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'failed':>7} {'idle MB':>8} {'loaded MB':>10}"
+          f" {'slices MB':>10}")
+    for r in records:
+        print(f"  {r['workers']:>7} {r['requests_per_second']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['failed']:>7}"
+              f" {r['idle_pss_mb']:>8} {r['loaded_pss_mb']:>10} {r['slice_files_mb']:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the multi-worker server on synthetic ridership data.")
+    parser.add_argument('--rows', type=synthetic.parse_size, default=synthetic.SIZES[DEFAULT_ROWS],
+                        help="export size, e.g. 1M")
+    parser.add_argument('--workers', nargs='+', type=int, default=DEFAULT_WORKERS, help="worker counts to test")
+    parser.add_argument('--clients', type=int, default=DEFAULT_CLIENTS, help="concurrent client threads")
+    parser.add_argument('--seconds', type=int, default=DEFAULT_SECONDS, help="length of each run")
+    parser.add_argument('--output', default=RESULTS_FILE, help="JSON-lines file the results are appended to")
+    args = parser.parse_args(argv)
+
+    path = synthetic.default_path(args.rows)
+    if not os.path.exists(path):
+        print(f'Writing {args.rows:,} synthetic rows to {path}')
+        synthetic.write_csv(args.rows, path)
+
+    records = [run_workers(args.rows, workers, args.clients, args.seconds) for workers in args.workers]
+    report(records)
+    with open(args.output, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Per-callback latency, rows scanned, payload size and memory, as histograms.
+
+Every ``@callback`` is wrapped with ``@instrument`` (above ``@cache.memoize``,
+so cache hits are measured too). Each invocation records, labelled by page
+and callback:
+
+- wall time,
+- rows scanned: rows read through ``RouteDayIndex.slice`` (the frame and the
+  cube) and from shared slices (``slices.get``),
+- output payload size: the JSON Dash sends back,
+- peak allocation, while memory tracing is on (``configure(trace_memory=True)``).
+  ``tracemalloc`` makes the callbacks several times slower, so it is off by
+  default; with callbacks running in parallel threads the peaks overlap.
+
+``render`` formats them as Prometheus histograms (served on ``/metrics``).
+
+``profile(callback, calls)`` runs the next ``calls`` invocations of a
+callback under cProfile; ``profile_report`` prints the accumulated stats,
+which are also saved to ``data/profiles/<callback>.prof``.
+"""
+import bisect
+import contextvars
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from plotly.io.json import to_json_plotly
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'profiles')
+PROFILE_CALLS = 20
+MAX_PROFILE_CALLS = 1000
+
+# name: (help text, bucket upper bounds)
+METRICS = {
+    'callback_seconds': ("Callback wall time in seconds.",
+                         (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    'callback_rows_scanned': ("Data rows read by a callback.",
+                              (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)),
+    'callback_payload_bytes': ("Size of the JSON a callback returns.",
+                               (1_000, 10_000, 100_000, 1_000_000, 10_000_000)),
+    'callback_peak_alloc_bytes': ("Peak Python memory allocated during a callback (with memory tracing on).",
+                                  (100_000, 1_000_000, 10_000_000, 100_000_000, 1_000_000_000)),
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_callbacks = {}  # callback name -> page
+_rows = contextvars.ContextVar('rows_scanned', default=None)
+
+_profile_lock = threading.Lock()
+_profile_requests = {}  # callback name -> invocations still to profile
+_profiles = {}  # callback name -> pstats.Stats
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def configure(trace_memory=False):
+    """Turn recording of each callback's peak allocation on or off."""
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _observe(metric, page, callback, value):
+    key = (metric, page, callback)
+    with _lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(METRICS[metric][1])
+        _histograms[key].observe(value)
+
+
+def count_rows(rows):
+    """Add ``rows`` to the rows scanned by the callback running in this thread, if any."""
+    counter = _rows.get()
+    if counter is not None:
+        counter[0] += rows
+
+
+def _payload_size(output):
+    try:
+        return len(to_json_plotly(output))
+    except Exception:  # e.g. dash.no_update
+        return None
+
+
+################### INSTRUMENTATION ###################
+def instrument(func):
+    """Record the metrics of every call of the callback ``func``."""
+    page = func.__module__.rsplit('.', 1)[-1]
+    name = func.__name__
+    _callbacks[name] = page
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        profiler = _start_profile(name)
+        counter = [0]
+        token = _rows.set(counter)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            allocated = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            output = func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - allocated
+            _rows.reset(token)
+            if profiler:
+                _finish_profile(name, profiler)
+            _observe('callback_seconds', page, name, elapsed)
+            _observe('callback_rows_scanned', page, name, counter[0])
+            if tracing:
+                _observe('callback_peak_alloc_bytes', page, name, max(peak, 0))
+
+        size = _payload_size(output)
+        if size is not None:
+            _observe('callback_payload_bytes', page, name, size)
+        return output
+
+    return wrapper
+
+
+def render():
+    """All histograms in the Prometheus text format."""
+    with _lock:
+        histograms = dict(_histograms)
+    lines = []
+    for metric, (help_text, _) in METRICS.items():
+        name = f'transitdash_{metric}'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (key_metric, page, callback), histogram in sorted(histograms.items()):
+            if key_metric != metric:
+                continue
+            labels = f'page="{page}",callback="{callback}"'
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+################### PROFILING ###################
+def callbacks():
+    """Names of the instrumented callbacks."""
+    return sorted(_callbacks)
+
+
+def profile(callback, calls=PROFILE_CALLS):
+    """Profile the next ``calls`` invocations of ``callback`` (adding to earlier captures).
+
+    ``calls`` is capped at ``MAX_PROFILE_CALLS``; returns the number that will be profiled.
+    """
+    if callback not in _callbacks:
+        raise KeyError(callback)
+    if calls < 1:
+        raise ValueError(f"calls must be at least 1, not {calls}")
+    calls = min(calls, MAX_PROFILE_CALLS)
+    with _lock:
+        _profile_requests[callback] = calls
+    return calls
+
+
+def _start_profile(name):
+    if _profile_requests.get(name, 0) <= 0:
+        return None
+    # One profiler at a time; a call that overlaps another capture just isn't profiled
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    with _lock:
+        remaining = _profile_requests.get(name, 0)
+        if remaining > 0:
+            _profile_requests[name] = remaining - 1
+    if remaining <= 0:
+        _profile_lock.release()
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _finish_profile(name, profiler):
+    profiler.disable()
+    try:
+        with _lock:
+            if name in _profiles:
+                _profiles[name].add(profiler)
+            else:
+                _profiles[name] = pstats.Stats(profiler)
+            stats = _profiles[name]
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stats.dump_stats(os.path.join(PROFILE_DIR, f'{name}.prof'))
+    finally:
+        _profile_lock.release()
+    if not _profile_requests.get(name):
+        logger.info("Profile of %s captured in %s", name, os.path.join(PROFILE_DIR, f'{name}.prof'))
+
+
+def profile_report(callback, limit=40, sort='cumulative'):
+    """Text summary of the captured profile of ``callback`` (None if nothing captured yet)."""
+    with _lock:
+        stats = _profiles.get(callback)
+        if stats is None:
+            return None
+        out = io.StringIO()
+        report = pstats.Stats(stream=out)
+        report.add(stats)
+        report.sort_stats(sort).print_stats(limit)
+    pending = _profile_requests.get(callback, 0)
+    return (f'{pending} calls still to capture\n' if pending else '') + out.getvalue()
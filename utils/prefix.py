@@ -0,0 +1,101 @@
+"""Running totals per stop, so any date range sums in constant time.
+
+For each route and day of week, the stop roll-up of the cube (``utils/cube.py``)
+is laid out as a days x stops grid of Riders On/Off sums and counts and
+accumulated over the days. The total of a stop between two dates is then the
+difference of two rows of that grid, found with two binary searches, however
+many days the range covers. Ranking the stops (``top_k``) needs only those
+totals, so it doesn't depend on the range either.
+
+Each day has one day of week, so keeping a grid per day of week costs no more
+memory than one grid over all days, and the day selector just picks grids.
+"""
+import numpy as np
+import pandas as pd
+
+from utils import encoding
+
+
+def weekday_codes(selected_day):
+    """Day-of-week codes (0 is Monday) of the day selector ('Everyday', a day, or a list of days)."""
+    if isinstance(selected_day, list):  # 'Weekend'
+        return [encoding.DAYS_OF_WEEK.index(day) for day in selected_day]
+    if selected_day in (None, 'Everyday'):
+        return list(range(len(encoding.DAYS_OF_WEEK)))
+    return [encoding.DAYS_OF_WEEK.index(selected_day)]
+
+
+class StopPrefixSums:
+    """Cumulative sums over days x stops of one route, one grid per day of week."""
+
+    def __init__(self, rows, columns):
+        """``rows``: the route's rows of the cube's stop table; ``columns``: its sums and counts."""
+        self.columns = list(columns)
+        stops = rows['Stop'].cat.codes.to_numpy()
+        served = stops >= 0
+        days = rows['Day'].to_numpy()[served]
+        weekdays = rows['Day of Week'].cat.codes.to_numpy()[served]
+        self.stops, stop_index = np.unique(stops[served], return_inverse=True)  # category codes
+        values = np.column_stack([rows[c].to_numpy(dtype=np.int64)[served] for c in self.columns]
+                                 + [np.ones(served.sum(), dtype=np.int64)])  # last: was the stop served
+
+        self.days, self.sums = [], []
+        for weekday in range(len(encoding.DAYS_OF_WEEK)):
+            mask = weekdays == weekday
+            weekday_days, day_index = np.unique(days[mask], return_inverse=True)
+            # Row 0 stays zero, so a range starting at the first day needs no special case
+            grid = np.zeros((len(weekday_days) + 1, len(self.stops), values.shape[1]), dtype=np.int64)
+            grid[day_index + 1, stop_index[mask]] = values[mask]  # one cube row per (day, stop)
+            self.days.append(weekday_days)
+            self.sums.append(np.cumsum(grid, axis=0))
+
+    def totals(self, start_day=None, end_day=None, weekdays=None):
+        """``(stops, days of week, columns + events)`` totals between two day numbers (inclusive)."""
+        weekdays = range(len(self.days)) if weekdays is None else weekdays
+        totals = np.zeros((len(self.stops), len(self.days), len(self.columns) + 1), dtype=np.int64)
+        for weekday in weekdays:
+            days = self.days[weekday]
+            lo = 0 if start_day is None else np.searchsorted(days, start_day, side='left')
+            hi = len(days) if end_day is None else np.searchsorted(days, end_day, side='right')
+            if hi > lo:
+                totals[:, weekday] = self.sums[weekday][hi] - self.sums[weekday][lo]
+        return totals
+
+
+def frame(totals, stop_dtype, columns):
+    """Totals over every stop category (``(stops, days of week, columns + events)``) as cube rows.
+
+    Rows are (Stop, Day of Week) pairs with stop events in the range, sorted
+    like ``cube.regroup``.
+    """
+    stops, weekdays = np.nonzero(totals[:, :, -1])
+    rows = pd.DataFrame({
+        'Stop': pd.Categorical.from_codes(stops, dtype=stop_dtype),
+        'Day of Week': pd.Categorical.from_codes(weekdays, dtype=encoding.DAY_OF_WEEK_DTYPE),
+    })
+    for i, column in enumerate(columns):
+        rows[column] = totals[stops, weekdays, i]
+    return rows
+
+
+def top_k(values, k, largest=True):
+    """Positions of the ``k`` largest (or smallest) of ``values``, best first.
+
+    Picked with a partial selection, so only the ``k`` kept are sorted. Ties
+    go to the earlier position, and missing values come last, as with a
+    stable ``sort_values().head(k)``.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    positions = np.flatnonzero(~missing)
+    keys = -values[positions] if largest else values[positions]
+    k = max(int(k), 0)
+    if k < len(keys):
+        cutoff = np.partition(keys, k - 1)[k - 1] if k else -np.inf
+        inside = np.flatnonzero(keys < cutoff)
+        tied = np.flatnonzero(keys == cutoff)[:k - len(inside)]
+        chosen = np.concatenate([inside, tied])
+    else:
+        chosen = np.arange(len(keys))
+    chosen = chosen[np.lexsort((chosen, keys[chosen]))]
+    return np.concatenate([positions[chosen], np.flatnonzero(missing)[:k - len(chosen)]])
@@ -0,0 +1,53 @@
+"""On-time performance and dwell times of stop events.
+
+``dataset.clean`` parses Scheduled Time, Actual Arrival and Actual Departure
+once into full timestamps and keeps each stop event's Lateness (arrival -
+scheduled) and Dwell (departure - arrival), in seconds. ``summarize`` turns
+a route/date range of those into one row per group (stop, hour, or stop and
+hour): how many events were early, on time or late, and percentiles of
+lateness and dwell.
+
+Percentiles don't add up across days the way sums do, so they can't be
+merged from per-day bins like the cube's. They are computed in one
+vectorized group-by over the filtered events instead, once per route/date
+range (the page's shared slice), and every chart and toggle reads from that.
+"""
+import numpy as np
+
+# On time: from 1 minute early to 5 minutes late
+EARLY_SECONDS = -60
+LATE_SECONDS = 300
+
+PERCENTILES = [50, 90]
+PERCENTILE_LABELS = {50: 'Median', 90: '90th Percentile'}
+
+COLUMNS = ['Stop', 'Day of Week', 'Scheduled Time', 'Lateness', 'Dwell']
+
+
+def events(rows):
+    """Stop events of ``rows`` (``RouteDayIndex`` slice) with a known lateness, plus their scheduled hour."""
+    rows = rows[COLUMNS]
+    rows = rows[rows['Lateness'].notna().to_numpy()]
+    return rows.assign(Hour=(rows['Scheduled Time'].to_numpy() // 3600).astype(np.int8))
+
+
+def summarize(events, by):
+    """Per ``by`` group: Events, Early/On Time/Late counts, and Lateness/Dwell percentiles.
+
+    Percentile columns are named like ``'Lateness p50'``.
+    """
+    lateness = events['Lateness'].to_numpy()
+    flags = events[by].assign(**{
+        'Events': 1,
+        'Early': lateness < EARLY_SECONDS,
+        'On Time': (lateness >= EARLY_SECONDS) & (lateness <= LATE_SECONDS),
+        'Late': lateness > LATE_SECONDS,
+    })
+    summary = flags.groupby(by, observed=True, sort=True)[['Events', 'Early', 'On Time', 'Late']].sum()
+
+    grouped = events.groupby(by, observed=True, sort=True)[['Lateness', 'Dwell']]
+    for p in PERCENTILES:
+        quantiles = grouped.quantile(p / 100)
+        summary[f'Lateness p{p}'] = quantiles['Lateness']
+        summary[f'Dwell p{p}'] = quantiles['Dwell']
+    return summary.reset_index()
@@ -0,0 +1,112 @@
+"""Pick up new ridership exports without restarting the dashboard.
+
+A background thread polls ``data/`` for CSV exports that were added, grew or
+changed. When the Parquet cache is in use, ``ingest.ingest`` writes only what
+is new (a new export, or the rows appended to an existing one). Those rows are
+added to the current snapshot (``Snapshot.extend`` merges their aggregates
+into the cube), and the result is swapped in as the new dataset version. An
+export that was replaced or removed means a full reload from the cache.
+
+Without a cache, the dashboard reads a single CSV. When that file changes it
+is reloaded in full. With the DuckDB backend (``utils/backend.py``) there is
+no snapshot to update: the new files are ingested and queried from then on.
+
+Callbacks never wait on a refresh: they keep answering from the old snapshot
+until the new one is complete, and the version change drops stale cached
+results (``utils/cache.py``).
+"""
+import glob
+import logging
+import os
+import threading
+import time
+
+from utils import backend, dataset, ingest
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 60
+
+_lock = threading.Lock()
+_thread = None
+
+
+def _scan():
+    """``{path: (size, mtime)}`` for every CSV in ``data/``."""
+    files = {}
+    for path in glob.glob(os.path.join(dataset.DATA_DIR, '*.csv')):
+        stat = os.stat(path)
+        files[path] = (stat.st_size, stat.st_mtime)
+    return files
+
+
+def refresh():
+    """Bring the dataset up to date with ``data/``. Returns True if a new version was swapped in."""
+    with _lock:
+        if not backend.get().in_memory:
+            version = backend.version()
+            ingest.ingest()
+            return backend.version() != version
+
+        snapshot = dataset.current()
+        if not ingest.has_cache():
+            if dataset.fingerprint(snapshot.stats['file']) == snapshot.version:
+                return False
+            dataset.reload()
+            return True
+
+        # Only a snapshot of exactly the cache as it is now can be extended
+        in_sync = (os.path.abspath(snapshot.stats['file']) == os.path.abspath(ingest.CACHE_DIR)
+                   and dataset.fingerprint(ingest.CACHE_DIR) == snapshot.version)
+        known = {name: set(entry['parts']) for name, entry in ingest.load_manifest()['files'].items()}
+        report = ingest.ingest()
+        version = dataset.fingerprint(ingest.CACHE_DIR)
+        if version == snapshot.version:
+            return False
+
+        rewritten = [name for name, status in report.items()
+                     if status == 'removed' or (status == 'ingested' and name in known)]
+        if not in_sync or rewritten:
+            # Rows may have gone away (or we were serving the CSV): start from the cache
+            dataset.reload()
+            return True
+
+        files = ingest.load_manifest()['files']
+        new_parts = sorted(part for name, status in report.items() if status in ('ingested', 'appended')
+                           for part in set(files[name]['parts']) - known.get(name, set()))
+        if not new_parts:
+            dataset.swap(dataset.Snapshot(snapshot.df, dict(snapshot.stats, version=version), snapshot.cube))
+            return True
+        new = snapshot.extend(dataset.compact(ingest.read_parts(new_parts)), version)
+        dataset.swap(new)
+        logger.info("Added %d new rows in %.2fs", new.stats['refresh_rows'], new.stats['refresh_seconds'])
+        return True
+
+
+def _watch(poll_seconds, on_refresh):
+    last = _scan()
+    while True:
+        time.sleep(poll_seconds)
+        files = _scan()
+        if files == last:
+            continue
+        try:
+            if refresh() and on_refresh:
+                on_refresh()
+        except Exception:
+            # Keep serving the current snapshot; try again on the next change
+            logger.exception("Data refresh failed")
+        last = files
+
+
+def start(poll_seconds=POLL_SECONDS, on_refresh=None):
+    """Start the watcher thread (once per process).
+
+    ``on_refresh`` is called after each new version is swapped in.
+    """
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=_watch, args=(poll_seconds, on_refresh), name='data-refresh',
+                                   daemon=True)
+        _thread.start()
+    return _thread
@@ -0,0 +1,108 @@
+"""Production server: several worker processes sharing one copy of the dataset.
+
+    python run.py --workers 4
+
+``app.run`` (the Flask development server) is one process, so the callbacks,
+which are mostly pandas and hold the GIL, use one CPU core. ``run`` loads the
+dataset, publishes it to shared memory (``utils/shared.py``) and forks
+``workers`` processes that all accept connections on the same listening
+socket. Each maps the shared columns instead of loading its own copy, so
+adding workers adds little memory.
+
+The supervisor process keeps polling ``data/`` for new exports
+(``utils/refresh.py``) and publishes each new version; the workers attach it
+within ``shared.POLL_SECONDS``. Slices (``utils/slices.py``) go to shared
+memory as well, since a chart callback often lands on another worker than the
+filter callback that built its slice. The result cache and ``/metrics`` are
+per worker.
+
+With the DuckDB backend (``utils/backend.py``) nothing is loaded up front, so
+there is no snapshot to share: each worker queries the Parquet cache itself.
+
+Needs ``os.fork`` (Linux, macOS); elsewhere it falls back to one process.
+"""
+import logging
+import os
+import signal
+import socket
+
+from werkzeug.serving import make_server
+
+from utils import backend, dataset, refresh, shared, slices
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+BACKLOG = 128
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _worker(server, host, port, sock, root, in_memory):
+    if in_memory:
+        shared.watch(root)
+    httpd = make_server(host, port, server, threaded=True, fd=sock.fileno())
+    httpd.serve_forever()
+
+
+def _publish(root):
+    shared.publish(dataset.current(), root)
+    shared.attach(root)
+
+
+def run(server, host='127.0.0.1', port=8040, workers=DEFAULT_WORKERS, poll_seconds=refresh.POLL_SECONDS):
+    """Serve the WSGI ``server`` (``app.server``) with ``workers`` processes until interrupted."""
+    if not hasattr(os, 'fork'):
+        logger.warning("Several workers need os.fork; serving from one process")
+        refresh.start(poll_seconds)
+        server.run(host=host, port=port, threaded=True)
+        return
+
+    in_memory = backend.get().in_memory
+    root = shared.create_root()
+    if in_memory:
+        backend.get().prepare()  # built once here, not in every worker
+        _publish(root)  # the supervisor maps the shared copy too; its own one is freed
+    slices.configure(disk_dir=os.path.join(root, 'slices'))
+    # Dash finishes setting up on the first request; done here once rather than
+    # raced by the first concurrent requests of every worker
+    server.test_client().get('/_dash-layout')
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _worker(server, host, port, sock, root, in_memory)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    sock.close()
+    logger.info("Serving on http://%s:%d with %d workers", host, port, workers)
+
+    # Forked first: a thread running while forking could leave a lock held in the children
+    refresh.start(poll_seconds, on_refresh=(lambda: _publish(root)) if in_memory else None)
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        while pids:
+            pid, status = os.wait()
+            if pid in pids:
+                pids.remove(pid)
+                logger.error("Worker %d exited (status %d); %d left", pid, status, len(pids))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        shared.remove(root)
@@ -0,0 +1,147 @@
+"""One read-only copy of the dataset, shared by every worker process.
+
+With several worker processes (``utils/serve.py``), each one holding its own
+frame would multiply memory by the number of workers. Instead the supervisor
+writes every column of the current snapshot (the frame, the cube and the
+capacity bins) once as a ``.npy`` file under ``SHARED_ROOT``, and each process
+maps those files read-only (``np.load(mmap_mode='r')``). The pages of a mapped
+file are held once by the operating system whatever the number of processes
+mapping it, and on ``/dev/shm`` they never touch the disk.
+
+Labels are stored as categorical codes plus their categories (text columns
+that aren't categoricals yet become ones). Each published snapshot goes in a
+new directory and ``CURRENT`` names the latest, so the workers pick up new
+data (``watch``) by mapping the new directory while callbacks still running
+keep the old one.
+"""
+import glob
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import dataset
+from utils.capacity import CapacityCube
+from utils.cube import RidershipCube
+
+logger = logging.getLogger(__name__)
+
+SHARED_ROOT = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+POLL_SECONDS = 5
+
+CURRENT_NAME = 'CURRENT'
+SNAPSHOTS_NAME = 'snapshots'
+META_NAME = 'meta.pkl'
+
+_attached = None
+
+
+################### FRAMES ###################
+def write_frame(df, directory):
+    """Write every column of ``df`` to ``directory`` as ``.npy`` files."""
+    os.makedirs(directory)
+    columns = []
+    for i, (name, column) in enumerate(df.items()):
+        if column.dtype == object:
+            column = column.astype('category')
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(directory, f'{i}.npy'), column.cat.codes.to_numpy())
+            columns.append((name, column.dtype))
+        else:
+            np.save(os.path.join(directory, f'{i}.npy'), column.to_numpy())
+            columns.append((name, None))
+    with open(os.path.join(directory, META_NAME), 'wb') as f:
+        pickle.dump(columns, f)
+
+
+def read_frame(directory):
+    """The frame written by ``write_frame``, its columns mapped read-only (not copied)."""
+    with open(os.path.join(directory, META_NAME), 'rb') as f:
+        columns = pickle.load(f)
+    data = {}
+    for i, (name, dtype) in enumerate(columns):
+        values = np.load(os.path.join(directory, f'{i}.npy'), mmap_mode='r')
+        data[name] = pd.Categorical.from_codes(values, dtype=dtype) if dtype is not None else values
+    # copy=False keeps one block per column, backed by its mapped file
+    return pd.DataFrame(data, copy=False)
+
+
+################### SNAPSHOTS ###################
+def create_root():
+    """A new, empty directory for this server's shared files (snapshots, slices)."""
+    return tempfile.mkdtemp(prefix='transitdash-', dir=SHARED_ROOT)
+
+
+def publish(snapshot, root):
+    """Write ``snapshot`` (frame, cube and capacity bins) under ``root`` and make it current."""
+    start = time.perf_counter()
+    snapshots = os.path.join(root, SNAPSHOTS_NAME)
+    os.makedirs(snapshots, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix=f'{snapshot.version}-', dir=snapshots)
+    write_frame(snapshot.df, os.path.join(directory, 'df'))
+    for name, table in snapshot.cube.tables.items():
+        write_frame(table, os.path.join(directory, 'cube', name))
+    for name, table in snapshot.capacity.tables.items():
+        write_frame(table, os.path.join(directory, 'capacity', name))
+    with open(os.path.join(directory, 'stats.pkl'), 'wb') as f:
+        pickle.dump(snapshot.stats, f)
+
+    # Renaming is atomic: a worker reads either the old name or the new one
+    with open(os.path.join(root, CURRENT_NAME + '.tmp'), 'w') as f:
+        f.write(os.path.basename(directory))
+    os.replace(os.path.join(root, CURRENT_NAME + '.tmp'), os.path.join(root, CURRENT_NAME))
+
+    # Workers still mapping an older one keep it until they let go (files are only unlinked)
+    for old in glob.glob(os.path.join(snapshots, '*', '')):
+        if os.path.normpath(old) != directory:
+            shutil.rmtree(old, ignore_errors=True)
+    logger.info("Published dataset version %s to %s in %.2fs",
+                snapshot.version, directory, time.perf_counter() - start)
+
+
+def _tables(directory):
+    return {name: read_frame(os.path.join(directory, name)) for name in sorted(os.listdir(directory))}
+
+
+def attach(root):
+    """Swap in the snapshot current under ``root``, if not attached already. Returns True if it was."""
+    global _attached
+    with open(os.path.join(root, CURRENT_NAME)) as f:
+        name = f.read()
+    if name == _attached:
+        return False
+    directory = os.path.join(root, SNAPSHOTS_NAME, name)
+    with open(os.path.join(directory, 'stats.pkl'), 'rb') as f:
+        stats = pickle.load(f)
+    snapshot = dataset.Snapshot(read_frame(os.path.join(directory, 'df')), stats,
+                                RidershipCube(_tables(os.path.join(directory, 'cube'))),
+                                CapacityCube(_tables(os.path.join(directory, 'capacity'))))
+    dataset.swap(snapshot)
+    _attached = name
+    return True
+
+
+def _watch(root, poll_seconds):
+    while True:
+        time.sleep(poll_seconds)
+        try:
+            attach(root)
+        except Exception:
+            logger.exception("Attaching the shared dataset failed")
+
+
+def watch(root, poll_seconds=POLL_SECONDS):
+    """Start a daemon thread attaching each new snapshot published under ``root``."""
+    thread = threading.Thread(target=_watch, args=(root, poll_seconds), name='shared-dataset', daemon=True)
+    thread.start()
+    return thread
+
+
+def remove(root):
+    shutil.rmtree(root, ignore_errors=True)
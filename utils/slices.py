@@ -0,0 +1,78 @@
+"""Filter-once slices shared by the chart callbacks of a page.
+
+A page registers a builder that filters the data for its top-level filters
+(route and date range) and runs the group-bys its charts share. One filter
+callback calls ``publish`` when those inputs change and writes the returned
+small dict to a ``dcc.Store``. The chart callbacks take that store as input
+and call ``get`` to reuse the server-side result instead of each re-filtering
+the data.
+
+If the result is no longer held (evicted, or another worker process served
+the filter callback), ``get`` rebuilds it from the parameters in the store.
+With several worker processes (``utils/serve.py``) the slices are also kept
+on disk (``configure``), so a worker finds the ones the others built.
+"""
+from utils import backend, cache, metrics
+
+MAX_SLICES = 32
+MAX_DISK_SLICES = 64
+
+_builders = {}
+_slices = cache.ResultCache(max_entries=MAX_SLICES)
+
+
+def configure(disk_dir=None):
+    """Also keep slices as pickles in ``disk_dir`` (shared by the processes using it)."""
+    global _slices
+    _slices = cache.ResultCache(max_entries=MAX_SLICES, disk_dir=disk_dir, max_disk_entries=MAX_DISK_SLICES)
+
+
+def builder(name):
+    """Register the function that builds the shared slice called ``name``."""
+    def register(func):
+        _builders[name] = func
+        return func
+    return register
+
+
+def _key(name, params):
+    return (name,) + tuple(sorted(params.items()))
+
+
+def _build(name, params):
+    key = _key(name, params)
+    hit, value = _slices.get(key)
+    if not hit:
+        version = backend.version()
+        value = _builders[name](**params)
+        _slices.put(key, value, version)
+    return value
+
+
+def payload(name, **params):
+    """The store payload for slice ``name`` and ``params``, without building it."""
+    return dict({k: cache.normalize(v) for k, v in params.items()}, slice=name)
+
+
+def publish(name, **params):
+    """Build (or reuse) slice ``name`` for ``params`` and return the store payload."""
+    data = payload(name, **params)
+    get(data)
+    return data
+
+
+def get(data):
+    """The slice behind a store payload returned by ``publish``."""
+    params = {k: cache.normalize(v) for k, v in data.items() if k != 'slice'}
+    value = _build(data['slice'], params)
+    metrics.count_rows(sum(len(table) for table in value.values()))
+    return value
+
+
+def clear():
+    """Forget every built slice (benchmarks time building them from scratch)."""
+    _slices.clear()
+
+
+def stats():
+    return _slices.stats()
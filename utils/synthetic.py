@@ -0,0 +1,228 @@
+"""Synthetic ridership exports in the vendor's CSV format, at any size.
+
+The bundled mock export has a few hundred rows; this writes exports with the
+same columns and formats at production sizes (``SIZES``) for benchmarking
+(``utils/benchmark.py``). Whole trips are generated: each runs a route's
+stops in order, weekday trips cluster around the morning and evening peaks,
+weekends, summers and the winter break are quieter, loads carry from stop
+to stop (with riders left behind when a vehicle is full), and a few trips are
+cancelled, stops skipped or still awaited, and rows repeated, as in the real
+exports.
+
+    python -m utils.synthetic 1M               # data/synthetic/ridership_1M.csv
+    python -m utils.synthetic 10k -o small.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import dataset
+
+OUTPUT_DIR = os.path.join(dataset.DATA_DIR, 'synthetic')
+
+SIZES = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+
+COLUMNS = ['Route', 'Day', 'Ride Start', 'Stop', 'Scheduled Time', 'Day Of Week', 'Vehicle Capacity',
+           'Ride State', 'Stop State', 'Actual Arrival', 'Actual Departure',
+           'Riders On', 'Riders Off', 'Riders Left', 'Riders Cumulative']
+
+# Stops of each route in running order, and how often the route runs relative to the others
+ROUTES = {
+    'Downtown Loop': ['Central Station', 'City Library', 'Harbor Front', 'River Market', 'West End Plaza',
+                      'North Terminal', 'Central Station'],
+    'Red Line Shuttle': ['University Gate', 'Tech Park', 'Stadium Ave', 'Central Station', 'River Market',
+                         'South Park', 'Eastside Mall', 'Hilltop School'],
+    'Blue Line Connector': ['North Terminal', 'University Gate', 'City Library', 'Eastside Mall', 'South Park',
+                            'Harbor Front'],
+    'Green Express': ['University Gate', 'Central Station', 'North Terminal'],
+    'Airport Link': ['Central Station', 'Tech Park', 'West End Plaza', 'Hilltop School', 'Stadium Ave'],
+}
+ROUTE_WEIGHTS = [0.3, 0.25, 0.2, 0.15, 0.1]
+
+# Busier stops board more riders
+STOP_WEIGHTS = {'Central Station': 2.5, 'University Gate': 2.0, 'North Terminal': 1.5, 'City Library': 1.3,
+                'Tech Park': 1.2, 'River Market': 1.0, 'Harbor Front': 1.0, 'Eastside Mall': 0.9,
+                'West End Plaza': 0.8, 'Stadium Ave': 0.7, 'South Park': 0.5, 'Hilltop School': 0.4}
+
+VEHICLE_CAPACITY = 47.0
+MINUTES_BETWEEN_STOPS = 4
+# Share of the riders on board getting off at each stop
+ALIGHTING = 0.2
+CANCELLED_TRIPS = 0.02
+SKIPPED_STOPS = 0.03
+AWAITING_STOPS = 0.01
+DUPLICATE_ROWS = 0.01
+
+START_DATE = '2023-08-28'
+END_DATE = '2025-05-09'
+
+TRIPS_PER_CHUNK = 50_000
+
+
+def _format(times, unit='s', date_separator='-'):
+    """'YYYY-MM-DD HH:MM:SS' strings (much faster than strftime at these sizes)."""
+    text = np.datetime_as_string(times, unit=unit)
+    if date_separator != '-':
+        text = np.char.replace(text, '-', date_separator)
+    return np.char.replace(text, 'T', ' ') if unit == 's' else text
+
+
+def parse_size(text):
+    """Row count from '10k', '1M', '2.5M' or a plain number."""
+    text = str(text).strip()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:].lower())
+    return int(float(text[:-1]) * scale) if scale else int(text)
+
+
+def default_path(rows):
+    """Where ``python -m utils.synthetic`` writes an export of ``rows`` rows."""
+    label = next((name for name, size in SIZES.items() if size == rows), str(rows))
+    return os.path.join(OUTPUT_DIR, f'ridership_{label}.csv')
+
+
+################### TRIPS ###################
+def _service_days(start_date, end_date):
+    """Every calendar day in the range with how much service it gets."""
+    days = pd.date_range(start_date, end_date, freq='D')
+    weights = np.where(days.dayofweek == 5, 0.45, np.where(days.dayofweek == 6, 0.35, 1.0))
+    weights = np.where((days.month >= 6) & (days.month <= 8), weights * 0.4, weights)
+    winter_break = ((days.month == 12) & (days.day >= 20)) | ((days.month == 1) & (days.day <= 8))
+    weights = np.where(winter_break, weights * 0.15, weights)
+    return days, weights / weights.sum()
+
+
+def _start_minutes(rng, weekend):
+    """Minute of the day each trip leaves: weekday peaks around 8:00 and 17:00, flat on weekends."""
+    n = len(weekend)
+    shape = rng.choice(3, size=n, p=[0.35, 0.3, 0.35])
+    minutes = np.select([shape == 0, shape == 1],
+                        [rng.normal(8 * 60, 60, n), rng.normal(17 * 60, 75, n)],
+                        rng.uniform(6.5 * 60, 22.5 * 60, n))
+    minutes = np.where(weekend, rng.uniform(9 * 60, 22 * 60, n), minutes)
+    return np.clip(minutes, 6 * 60, 23 * 60).astype(np.int64)
+
+
+def _peak_factor(minutes):
+    """Boardings scale with how close the time is to a peak."""
+    hours = minutes / 60
+    return 0.6 + np.exp(-((hours - 8.5) ** 2) / 2) + 0.8 * np.exp(-((hours - 17) ** 2) / 3)
+
+
+def _trips(rng, n_trips, days, day_weights):
+    """One stop event per row for ``n_trips`` random trips, in running order."""
+    names = list(ROUTES)
+    route = rng.choice(len(names), size=n_trips, p=ROUTE_WEIGHTS)
+    day = days[rng.choice(len(days), size=n_trips, p=day_weights)]
+    weekend = day.dayofweek >= 5
+    start = _start_minutes(rng, weekend)
+    cancelled = rng.random(n_trips) < CANCELLED_TRIPS
+
+    # Trips x stop position, padded to the longest route
+    route_lengths = np.array([len(ROUTES[name]) for name in names])
+    lengths = route_lengths[route]
+    width = route_lengths.max()
+    stop_weights = np.zeros((len(names), width))
+    stop_codes = np.zeros((len(names), width), dtype=np.int64)
+    stop_names = sorted(STOP_WEIGHTS)
+    for r, name in enumerate(names):
+        stops = ROUTES[name]
+        stop_weights[r, :len(stops)] = [STOP_WEIGHTS[stop] for stop in stops]
+        stop_codes[r, :len(stops)] = [stop_names.index(stop) for stop in stops]
+
+    position = np.arange(width)
+    valid = position < lengths[:, None]
+    scheduled = start[:, None] + position * MINUTES_BETWEEN_STOPS
+    states = rng.random((n_trips, width))
+    skipped = states < SKIPPED_STOPS
+    awaiting = (states >= SKIPPED_STOPS) & (states < SKIPPED_STOPS + AWAITING_STOPS)
+    departed = ~cancelled[:, None] & ~skipped & ~awaiting
+
+    # Carry the load along each trip: alight a share of it, board up to capacity
+    demand = rng.poisson(stop_weights[route] * _peak_factor(scheduled) * np.where(weekend, 2.5, 5.0)[:, None])
+    on = np.zeros((n_trips, width), dtype=np.int64)
+    off = np.zeros_like(on)
+    left = np.zeros_like(on)
+    load = np.zeros(n_trips, dtype=np.int64)
+    for i in range(width):
+        last = i == lengths - 1
+        off[:, i] = np.where(last, load, rng.binomial(load, ALIGHTING))
+        room = int(VEHICLE_CAPACITY) - (load - off[:, i])
+        wanting = np.where(last, 0, demand[:, i])
+        on[:, i] = np.minimum(wanting, room)
+        left[:, i] = wanting - on[:, i]
+        for counts in (on, off, left):
+            counts[:, i] = np.where(departed[:, i] & valid[:, i], counts[:, i], 0)
+        load = load - off[:, i] + on[:, i]
+    cumulative = np.cumsum(on, axis=1)
+
+    delay = np.round(rng.gamma(2.0, 60, (n_trips, width)) + 60 * _peak_factor(scheduled)).astype(np.int64) - 90
+    dwell = 20 + 4 * (on + off) + rng.integers(0, 30, (n_trips, width))
+
+    trip, pos = np.nonzero(valid)
+    midnight = day.values[trip]
+    scheduled_at = midnight + (scheduled[trip, pos] * 60).astype('timedelta64[s]')
+    arrival = scheduled_at + delay[trip, pos].astype('timedelta64[s]')
+    has_actual = departed[trip, pos]
+    return pd.DataFrame({
+        'Route': np.array(names)[route[trip]],
+        'Day': _format(midnight, unit='D', date_separator='/'),
+        'Ride Start': _format(midnight + (start[trip] * 60).astype('timedelta64[s]')),
+        'Stop': np.array(stop_names)[stop_codes[route[trip], pos]],
+        'Scheduled Time': _format(scheduled_at),
+        'Day Of Week': day.day_name()[trip],
+        'Vehicle Capacity': VEHICLE_CAPACITY,
+        'Ride State': np.where(cancelled[trip], 'Cancelled', 'Complete'),
+        'Stop State': np.select([cancelled[trip] | skipped[trip, pos], awaiting[trip, pos]],
+                                ['Skipped', 'Awaiting'], 'Departed'),
+        'Actual Arrival': np.where(has_actual, _format(arrival), ''),
+        'Actual Departure': np.where(has_actual, _format(arrival + dwell[trip, pos].astype('timedelta64[s]')), ''),
+        'Riders On': on[trip, pos],
+        'Riders Off': off[trip, pos],
+        'Riders Left': left[trip, pos],
+        'Riders Cumulative': cumulative[trip, pos],
+    }, columns=COLUMNS)
+
+
+################### EXPORTS ###################
+def generate(rows, seed=0, start_date=START_DATE, end_date=END_DATE, trips_per_chunk=TRIPS_PER_CHUNK):
+    """Yield frames of an export with ``rows`` rows in total, a chunk of trips at a time.
+
+    The same ``rows`` and ``seed`` always give the same export.
+    """
+    days, day_weights = _service_days(start_date, end_date)
+    stops_per_trip = np.dot(ROUTE_WEIGHTS, [len(stops) for stops in ROUTES.values()])
+    remaining, chunk = rows, 0
+    while remaining > 0:
+        rng = np.random.default_rng([seed, chunk])
+        n_trips = min(trips_per_chunk, int(remaining / stops_per_trip) + 1)
+        df = _trips(rng, n_trips, days, day_weights)
+        # Exports repeat some rows
+        df = pd.concat([df, df.sample(frac=DUPLICATE_ROWS, random_state=rng)]).head(remaining)
+        remaining -= len(df)
+        chunk += 1
+        yield df
+
+
+def write_csv(rows, path=None, seed=0, **kwargs):
+    """Write a synthetic export of ``rows`` rows to ``path`` (default ``default_path``) and return the path."""
+    path = path or default_path(rows)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        for i, df in enumerate(generate(rows, seed, **kwargs)):
+            df.to_csv(f, header=i == 0, index=False)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic ridership export.")
+    parser.add_argument('rows', type=parse_size, help="number of rows, e.g. 10k, 1M, 10M")
+    parser.add_argument('-o', '--output', help="CSV to write (default: data/synthetic/ridership_<rows>.csv)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    print(write_csv(args.rows, args.output, args.seed))
+
+
+if __name__ == '__main__':
+    main()
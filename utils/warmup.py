@@ -0,0 +1,170 @@
+"""Fill the result cache before the dashboard starts serving.
+
+The first visitor after a deploy would otherwise wait for every chart to be
+computed from scratch. ``warm`` enumerates the common first views (each route
+x the full date range and each semester, then the per-stop aggregates),
+computes them in a process pool and stores the results in the result cache
+(``utils/cache.py``), most common first, until the time budget runs out.
+Workers still computing then are killed, so nothing competes with the server
+for the CPU once it starts.
+
+Each worker needs the dataset too: with ``fork`` they share the parent's
+already-loaded copy, with ``spawn`` (Windows) each one loads its own.
+"""
+import inspect
+import logging
+import multiprocessing
+import os
+import time
+
+from utils import backend, cache, encoding, ingest, slices
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_SECONDS = 60
+
+AGGREGATIONS = ['sum', 'avg']
+RIDERS = ['Riders On', 'Riders Off']
+# The capacity page's default range
+CAPACITY_RANGE = [80, 150]
+
+last_report = None
+
+
+################### QUERY SPACE ###################
+def _page_calls(route, start_date, end_date, everything):
+    """Calls the chart pages make for one route/date range.
+
+    Only the default view (Riders On, Sum) unless ``everything``.
+    """
+    from pages import (ridership_capacity as capacity_page, ridership_punctuality as punctuality_page,
+                       ridership_stops as stops_page, ridership_time as time_page)
+
+    params = dict(route=route, start_date=start_date, end_date=end_date)
+    time_filter = slices.payload('ridership_time', **params)
+    stops_filter = slices.payload('ridership_stops', **params)
+    capacity_filter = slices.payload('ridership_capacity', **params)
+    punctuality_filter = slices.payload('ridership_punctuality', **params)
+    aggregations = AGGREGATIONS if everything else AGGREGATIONS[:1]
+    riders = RIDERS if everything else RIDERS[:1]
+
+    # One aggregate covers every calculation method / day of week of the time page's charts
+    calls = [(time_page.update_time_aggregate, (time_filter,))]
+    groups = ['By Week', 'Entire Dates'] if everything else ['By Week']
+    calls += [(time_page.update_ridership_daily_by_week_graph, (time_filter, None, group, None))
+              for group in groups]
+    count = stops_page.DEFAULT_STOP_COUNT
+    for rider in riders:
+        calls.append((stops_page.update_top_bottom_5_charts, (stops_filter, rider, count)))
+        calls += [(stops_page.update_graphs, (rider, stops_filter, aggregation, count)) for aggregation in aggregations]
+    calls += [(capacity_page.update_capacity_day_of_week_graph, (capacity_filter, CAPACITY_RANGE)),
+              (capacity_page.update_capacity_hour_graph, (capacity_filter, CAPACITY_RANGE, 'Everyday')),
+              (capacity_page.update_denied_boardings_graph, (capacity_filter, 'Everyday'))]
+    calls += [(punctuality_page.update_on_time_hour_graph, (punctuality_filter,)),
+              (punctuality_page.update_stop_percentile_graphs, (punctuality_filter,)),
+              (punctuality_page.update_lateness_heatmap, (punctuality_filter, 50))]
+    return calls
+
+
+def _stop_calls(route, start_date, end_date):
+    """Stop-by-scheduled-time aggregate for every stop of ``route``."""
+    from pages import ridership_time as time_page
+
+    time_filter = slices.payload('ridership_time', route=route, start_date=start_date, end_date=end_date)
+    stops = backend.get().stops(route)
+    return [(time_page.update_stop_time_aggregate, (stop, time_filter)) for stop in stops]
+
+
+def query_space():
+    """Groups of ``(callback, args)`` calls, most commonly viewed first.
+
+    Each group shares one route/date range, so a worker builds its slice once.
+    """
+    data = backend.get()
+    first, last = (encoding.to_date(day) for day in data.day_range())
+    full = (first.strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d'))
+    semesters = [(max(start, first).strftime('%Y-%m-%d'), min(end, last).strftime('%Y-%m-%d'))
+                 for _, start, end in ingest.semester_ranges(first, last)]
+    routes = data.routes()
+
+    groups = []
+    groups += [_page_calls(route, *full, everything=False) for route in routes]
+    groups += [_page_calls(route, *full, everything=True) for route in routes]
+    groups += [_page_calls(route, *dates, everything=True) for dates in semesters for route in routes]
+    groups += [_stop_calls(route, *dates) for dates in [full] + semesters for route in routes]
+    return groups
+
+
+################### WARMING ###################
+def _compute(calls):
+    """Run ``calls`` without their cache and metrics wrappers (in a worker process).
+
+    Returns ``(dataset version, [(cache key, result), ...], failures)``.
+    """
+    version = backend.version()
+    results, failures = [], 0
+    for func, args in calls:
+        try:
+            results.append((cache.key_for(func, args), inspect.unwrap(func)(*args)))
+        except Exception:
+            logger.exception("Warm-up of %s%r failed", func.__qualname__, args)
+            failures += 1
+    return version, results, failures
+
+
+def warm(budget_seconds=DEFAULT_BUDGET_SECONDS, workers=None):
+    """Pre-compute ``query_space`` into the result cache within ``budget_seconds``.
+
+    Never plans more results than the cache holds, so the most common views are
+    not evicted by rarer ones. Returns a report (also kept in ``last_report``).
+    """
+    global last_report
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    # Drop calls already planned (the full-range default view repeats) and cap at the cache size
+    planned, skipped, seen, groups = 0, 0, set(), []
+    for calls in query_space():
+        group = []
+        for func, args in calls:
+            key = cache.key_for(func, args)
+            if key in seen:
+                continue
+            seen.add(key)
+            if planned < cache.results.max_entries:
+                group.append((func, args))
+                planned += 1
+            else:
+                skipped += 1
+        if group:
+            groups.append(group)
+
+    backend.get().prepare()  # built once here; forked workers share them
+    report = {'workers': workers, 'planned': planned, 'skipped_over_capacity': skipped,
+              'warmed': 0, 'failed': 0, 'unfinished': planned, 'unfinished_groups': len(groups)}
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    pool = context.Pool(workers)
+    try:
+        outputs = pool.imap_unordered(_compute, groups)
+        for _ in groups:
+            version, results, failures = outputs.next(timeout=max(0, start + budget_seconds - time.perf_counter()))
+            for key, value in results:
+                cache.results.put(key, value, version)
+            report['warmed'] += len(results)
+            report['failed'] += failures
+            report['unfinished'] -= len(results) + failures
+            report['unfinished_groups'] -= 1
+    except multiprocessing.TimeoutError:
+        logger.info("Warm-up time budget of %ss used up", budget_seconds)
+    finally:
+        # Kills the groups still computing, not just the ones waiting to start
+        pool.terminate()
+        pool.join()
+
+    report['seconds'] = round(time.perf_counter() - start, 2)
+    last_report = report
+    logger.info("Warmed %d of %d results in %.1fs with %d workers (%d failed, %d unfinished in %d groups, "
+                "%d over cache capacity)", report['warmed'], planned, report['seconds'], workers, report['failed'],
+                report['unfinished'], report['unfinished_groups'], skipped)
+    return report